@@ -8,15 +8,19 @@ import os
 import json
 from action import ConversationCompletionAction
 from chatgpt import extract_datasource, get_is_request_to_change_topics, get_new_or_existing_conversation, merge_conversations, summarize, summarize_knowledge, find_similar_conversations
+from async_database import AsyncDatabase
 from db import Database, UserUnion
 from discord_handler import DiscordHandler, DiscordSendable
+from user_mailbox import UserMailboxes
 from dto import Conversation, Message
 from sendable import Sendable
 
 openai.api_key = os.environ.get("OpenAIAPI-Token")
 model_engine = "gpt-3.5-turbo"
 
-db = Database("db.json")
+db = AsyncDatabase(Database(os.environ.get("Database-Path", "db.json"), mode=os.environ.get("Database-Mode", "tinydb"), cache_bytes=int(os.environ.get("Database-Cache-Bytes", str(64 << 20))),
+                            archive_path=os.environ.get("Archive-Path", "archive"), archive_after=float(os.environ.get("Archive-After-Days", "30")) * 86400),
+                   batch_window=float(os.environ.get("Database-Batch-Window", "0.005")))
 
 intents = discord.Intents(messages=True, guilds=True, message_content=True, members=True, guild_reactions=True, dm_reactions=True, presences=True, reactions=True, typing=True, voice_states=True, webhooks=True)
 client = discord.Client(intents=intents)
@@ -26,29 +30,36 @@ commands = json.load(open("commands.json", "r"))
 
 handler = DiscordHandler()
 
-def get_preference(user, preference, default="") -> Optional[str]:
-    return db.get_preference(user, preference, default)
+async def handle_messages(messages):
+    await handler.handle_discord_messages(messages, db)
 
-def get_preferences(user: UserUnion) -> dict:
-    return db.get_preferences(user)
+mailboxes = UserMailboxes(handle_messages,
+                          window=float(os.environ.get("Message-Burst-Window", "0")),
+                          max_concurrency=int(os.environ.get("Max-Concurrent-Users", "8")))
 
-def set_preference(user : UserUnion, preference, value) -> None:
-    db.set_preference(user, preference, value)
+async def get_preference(user, preference, default="") -> Optional[str]:
+    return await db.get_preference(user, preference, default)
 
-def remove_preference(user, preference):
-    db.delete_preference(user, preference)
+async def get_preferences(user: UserUnion) -> dict:
+    return await db.get_preferences(user)
 
-def set_datasource(user, datasource):
-    db.set_datasource(user, datasource)
+async def set_preference(user : UserUnion, preference, value) -> None:
+    await db.set_preference(user, preference, value)
 
-def get_datasource(user, name):
-    return db.get_datasource(user, name)
+async def remove_preference(user, preference):
+    await db.delete_preference(user, preference)
 
-def get_datasources(user):
-    return db.get_datasources(user)
+async def set_datasource(user, datasource):
+    await db.set_datasource(user, datasource)
 
-def delete_datasource(user, name):
-    db.delete_datasource(user, name)
+async def get_datasource(user, name):
+    return await db.get_datasource(user, name)
+
+async def get_datasources(user):
+    return await db.get_datasources(user)
+
+async def delete_datasource(user, name):
+    await db.delete_datasource(user, name)
 
 def split_into_chunks(text, chunk_size=2000):
     chunks = []
@@ -63,19 +74,22 @@ async def send(channel, text):
     for chunk in split_into_chunks(text):
         await channel.send(chunk)
 
-async def complete(message:Message, database: Database, sendable: Sendable):
+async def complete(message:Message, database: AsyncDatabase, sendable: Sendable):
     await ConversationCompletionAction()(message, database, sendable)
 
 for command in commands:
     def command_maker(system, user):
         async def interaction(interaction):
             await interaction.response.defer()
-            convo = Conversation.new_conversation()
-            db.set_conversation(interaction.user, convo)
-            db.set_current_conversation(interaction.user, convo)
-            sendable = DiscordSendable(interaction.followup)
-            message = Message.from_message(interaction.message)
-            await complete(message, db, sendable)
+            async def run():
+                convo = Conversation.new_conversation()
+                await db.set_conversation(interaction.user, convo)
+                await db.set_current_conversation(interaction.user, convo)
+                sendable = DiscordSendable(interaction.followup)
+                message = Message.from_message(interaction.message)
+                await complete(message, db, sendable)
+            # Switching the current conversation waits its turn behind the user's queued messages.
+            await mailboxes.call(interaction.user.id, run)
         return interaction
     tree.add_command(discord.app_commands.Command(name=command["command"], description=command["description"], callback=command_maker(command["system"], command["user"])))
 
@@ -107,6 +121,8 @@ time_zones = {
     "Pacific/Auckland": "New Zealand Standard Time (UTC+12)"
 }
 
+# Commands that only set a preference or data source write one record through the database's ordered
+# writer and never touch the conversation, so they don't queue in the user's mailbox.
 @tree.command(name="adddatasource", description="Add a data source")
 async def add_datasource_command(interaction, description: str):
     await interaction.response.defer()
@@ -115,7 +131,7 @@ async def add_datasource_command(interaction, description: str):
         await interaction.followup.send("No data source found")
         return
     await interaction.followup.send(f"Added data source {ds.get('name') or ds.get('url')}")
-    set_datasource(interaction.user.id, ds)
+    await set_datasource(interaction.user, ds)
 @tree.command(name="timezone", description="Sets your timezone for the datetime command")
 async def timezone_command(interaction):
     view = discord.ui.View()
@@ -128,7 +144,7 @@ async def timezone_command(interaction):
             return
         timezone = interaction.data.get("values", [])[0]
         await interaction.message.edit(content="Your timezone has been set to: " + time_zones[timezone], view=None)
-        set_preference(user.id, "timezone", str(timezone))
+        await set_preference(user, "timezone", str(timezone))
     asyncio.create_task(respond_to_select(interaction.user, message, id))
 @tree.command(name = "now", description = "Displays current date and time") #Add the guild ids in which the slash command will appear. If it should be in all, remove the argument, but note that it will take some time (up to an hour) to register the command if it's for all guilds.
 async def now_command(interaction):
@@ -137,11 +153,15 @@ async def now_command(interaction):
     await interaction.response.send_message(nowstr)
 
 @tree.command(name = "new", description = "Clears the current conversation's context") #Add the guild ids in which the slash command will appear. If it should be in all, remove the argument, but note that it will take some time (up to an hour) to register the command if it's for all guilds.
-async def new_command(interaction):    
-    convo = Conversation.new_conversation()
-    db.set_conversation(interaction.user, convo)
-    db.set_current_conversation(interaction.user, convo)
-    await interaction.response.send_message("New conversation created.")
+async def new_command(interaction):
+    await interaction.response.defer()
+    async def run():
+        convo = Conversation.new_conversation()
+        await db.set_conversation(interaction.user, convo)
+        await db.set_current_conversation(interaction.user, convo)
+    # A message still being handled writes to the old conversation, so the switch happens after it.
+    await mailboxes.call(interaction.user.id, run)
+    await interaction.followup.send("New conversation created.")
 
 @tree.command(name='sync', description='Owner only')
 async def sync(interaction: discord.Interaction):
@@ -161,10 +181,7 @@ async def on_message(message):
         return
     if message.author.bot:
         return
-    current_convo = db.get_current_conversation(message.author)
-    async def handle_message_async(message):
-        return await handler.handle_discord_message(message, db, message.channel)
-    asyncio.create_task(handle_message_async(message))
+    mailboxes.submit(message.author.id, message)
     
 token = os.environ.get("Discord-Token", None)
 if token is None:
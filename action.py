@@ -1,86 +1,154 @@
 from __future__ import annotations
 from abc import abstractmethod
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
 class Action:
     name:str
     description:str
+    critical:bool = True
     @abstractmethod
-    async def __call__(self, message : Message, database : Database, sendable : Sendable) -> None:
+    async def __call__(self, message : Message, database : AsyncDatabase, sendable : Sendable) -> None:
         pass
 
 class ConversationCompletionAction(Action):
-    def __init__(self):
+    def __init__(self, stream : bool = True):
         super().__init__("Conversation Completion Action", "Complete the current conversation and send the completion.")
-    async def __call__(self, message : Message, database : Database, sendable : Sendable) -> None:
-        conversation = database.get_current_conversation(message.user)
+        self.stream = stream
+        self.speculation : Optional[SpeculativeCompletion] = None
+    @staticmethod
+    async def prepare(message : Message, database : AsyncDatabase) -> Conversation:
+        conversation = await database.get_current_conversation(message.user)
         if conversation is None:
             conversation = Conversation.new_conversation()
-        preferences = database.get_preferences(message.user)
-        if preferences is not None:
+        preferences = await database.get_preferences(message.user)
+        if preferences:
             preference_summary = "\n".join([k + ": " + v for k, v in preferences.items()])
-            conversation.set_system("I have the following preferences:\n" + preference_summary)
-        if conversation.summary is not None:
-            conversation.set_system("Here's a summary of the conversation so far:\n" + conversation.summary)
-        if database.get_knowledge(message.user) is not None:
-            conversation.set_system("Here's a summary of the knowledge I have:\n" + database.get_knowledge(message.user))
+            conversation.set_system("preferences", "I have the following preferences:\n" + preference_summary)
+        knowledge = await database.get_knowledge(message.user)
+        if knowledge:
+            conversation.set_system("knowledge", "Here's a summary of the knowledge I have:\n" + knowledge)
         conversation.add_user(message.text)
-        database.set_conversation(message.user, conversation)
-        completion = await chatgpt.get_completion(conversation.get_conversation())
+        if conversation.needs_history(context_window.context_budget):
+            await database.load_history(message.user, conversation)
+        return conversation
+    @staticmethod
+    async def speculate(message : Message, database : AsyncDatabase) -> SpeculativeCompletion:
+        conversation = await ConversationCompletionAction.prepare(message, database)
+        return SpeculativeCompletion(conversation, conversation.get_conversation(context_window.context_budget))
+    async def __call__(self, message : Message, database : AsyncDatabase, sendable : Sendable) -> None:
+        if self.speculation is not None:
+            conversation = self.speculation.conversation
+            chunks = self.speculation.stream()
+        else:
+            conversation = await self.prepare(message, database)
+            chunks = None
+        # The summary was read before the reply started; a fold finishing meanwhile must not be undone.
+        await database.update_conversation_system(message.user, conversation)
+        if self.stream:
+            if chunks is None:
+                chunks = chatgpt.stream_completion(conversation.get_conversation(context_window.context_budget))
+            reply = StreamingReply(sendable)
+            await reply.start()
+            try:
+                async for chunk in chunks:
+                    await reply.append(chunk)
+            except Exception:
+                await reply.fail()
+                raise
+            completion = await reply.finish()
+        elif chunks is not None:
+            completion = "".join([chunk async for chunk in chunks])
+        else:
+            completion = await chatgpt.get_completion(conversation.get_conversation(context_window.context_budget))
         conversation.add_assistant(completion)
-        database.set_conversation(message.user, conversation)
-        await sendable.send(completion)
+        # The user turn is saved only with its reply, so a failed completion never leaves two user turns in a row.
+        await database.append_message(message.user, conversation.id, "user", message.text)
+        await database.append_message(message.user, conversation.id, "assistant", completion)
+        if not self.stream:
+            await sendable.send(completion)
 class ConversationSummaryAction(Action):
     def __init__(self):
-        super().__init__("Conversation Summary Action", "Set a summary of the current conversation on it.")
-    async def __call__(self, message : Message, database : Database, sendable : Sendable) -> None:
-        conversation = database.get_current_conversation(message.user)
+        super().__init__("Conversation Summary Action", "Set a summary of the current conversation on it.", critical=False)
+    async def __call__(self, message : Message, database : AsyncDatabase, sendable : Sendable) -> None:
+        conversation = await database.get_current_conversation(message.user)
         if conversation is None:
             return
-        conversation.summary = await chatgpt.summarize(str(conversation))
-        database.set_conversation(message.user, conversation)
+        if conversation.summarized < conversation.offset:
+            await database.load_history(message.user, conversation)
+        # Only the turns since the last fold are summarized, and only once enough of them have built up.
+        pending = conversation.unsummarized()
+        if context_window.token_counter.count_messages(pending) < context_window.summary_threshold:
+            return
+        with openai_client.priority(Priority.BACKGROUND):
+            for chunk in context_window.split_by_tokens(pending, context_window.summary_chunk_budget):
+                turns = "".join(m["role"] + ": " + m["content"] + "\n" for m in chunk)
+                conversation.summary = await chatgpt.fold_summary(conversation.summary, turns)
+                conversation.summarized += len(chunk)
+        # The system blocks were read before the folds; the completion may have replaced them since.
+        await database.update_conversation_summary(message.user, conversation)
         
 class UpdateKnowledgeAction(Action):
     def __init__(self):
-        super().__init__("Update Knowledge Action", "Update the knowledge base of the user.")
-    async def __call__(self, message : Message, database : Database, sendable : Sendable) -> None:
-        conversations = database.get_conversations(message.user)
-        summaries = ""
-        for i, convo in enumerate(conversations, start=0):
-            summaries += f"{i}. {convo.summary}\n"
-        knowledge = await chatgpt.summarize_knowledge(summaries)
-        database.set_knowledge(message.user, knowledge)
+        super().__init__("Update Knowledge Action", "Update the knowledge base of the user.", critical=False)
+    async def __call__(self, message : Message, database : AsyncDatabase, sendable : Sendable) -> None:
+        # Let a burst of topic changes settle; the background worker collapses the ones queued meanwhile.
+        await asyncio.sleep(knowledge_tree.debounce)
+        conversations = await database.get_conversations(message.user) + await database.get_archived_conversations(message.user)
+        summaries = {convo.id: convo.summary for convo in conversations if convo.summary and convo.summary != NEW_CONVERSATION_SUMMARY}
+        tree = KnowledgeTree(await database.get_knowledge_tree(message.user))
+        if not tree.apply(summaries):
+            knowledge_tree.knowledge_stats["unchanged"] += 1
+            return
+        with openai_client.priority(Priority.BACKGROUND):
+            knowledge = await tree.refresh(summaries, chatgpt.summarize_knowledge)
+        knowledge_tree.knowledge_stats["updates"] += 1
+        await database.set_knowledge_tree(message.user, tree.to_dict())
+        await database.set_knowledge(message.user, knowledge)
         
 class ConversationChangeException(Exception):
     pass
 class ChangeCurrentConversationAction(Action):
     def __init__(self):
         super().__init__("Change Current Conversation Action", "Change the current conversation.")
-    async def __call__(self, message : Message, database : Database, sendable : Sendable) -> None:
-        conversation = database.get_current_conversation(message.user)
+    async def __call__(self, message : Message, database : AsyncDatabase, sendable : Sendable) -> None:
+        conversation = await database.get_current_conversation(message.user)
         if conversation is None:
             conversation = Conversation.new_conversation()
-            database.set_conversation(message.user, conversation)
-            database.set_current_conversation(message.user, conversation)
-        conversations = database.get_conversations(message.user)
-        summaries = ""
-        for i, convo in enumerate(conversations, start=0):
-            summaries += f"{i}. {convo.summary}\n"
-        conversation_index = await chatgpt.get_new_or_existing_conversation(summaries, message.text)
+            await database.set_conversation(message.user, conversation)
+            await database.set_current_conversation(message.user, conversation)
+        conversations = await database.get_conversations(message.user) + await database.get_archived_conversations(message.user)
+        summaries = {convo.id: convo.summary for convo in conversations if convo.summary and convo.summary != NEW_CONVERSATION_SUMMARY}
+        index = ConversationIndex(await database.get_conversation_index(message.user))
+        if index.sync(summaries):
+            await database.set_conversation_index(message.user, index.to_dict())
+        candidates = index.search(message.text)
+        decision, target = conversation_index.decide(candidates)
+        if decision == "ask":
+            # Only the closest few go to the LLM, and its answer must name one of them.
+            numbered = "".join(f"{i}. {summaries[conversation_id]}\n" for i, (conversation_id, _) in enumerate(candidates))
+            with openai_client.priority(Priority.ROUTING):
+                choice = await chatgpt.get_new_or_existing_conversation(numbered, message.text)
+            if 0 <= choice < len(candidates):
+                target = candidates[choice][0]
+            elif choice != -1:
+                conversation_index.routing_stats["llm_out_of_range"] += 1
+                return
+        by_id = {convo.id: convo for convo in conversations}
         try:
-            if conversation_index == -1:
+            if target is None:
                 new_conversation = Conversation.new_conversation()
-                database.set_conversation(message.user, new_conversation)
-                database.set_current_conversation(message.user, new_conversation)
+                await database.set_conversation(message.user, new_conversation)
+                await database.set_current_conversation(message.user, new_conversation)
                 await sendable.send("I think this is a new conversation. One moment please...")
                 raise ConversationChangeException
-            elif conversations[conversation_index].id == conversation.id:
+            elif target == conversation.id:
                 return
             else:
                 await sendable.send("Im changing topics to a prior conversation. One moment please...")
-                database.set_current_conversation(message.user, conversations[conversation_index])
+                await database.set_current_conversation(message.user, by_id[target])
                 raise ConversationChangeException
         except:
             return
@@ -88,18 +156,28 @@ class ChangeCurrentConversationAction(Action):
 class RememberAction(Action):
     def __init__(self): 
         super().__init__("Remember Action", "An explicit request to remember something or keep something in mind for later.")
-    async def __call__(self, message : Message, database : Database, sendable : Sendable) -> None:
+    async def __call__(self, message : Message, database : AsyncDatabase, sendable : Sendable) -> None:
         preference = await chatgpt.extract_preferences(message.text)
         if preference is None:
             await sendable.send("I don't understand what you're asking me to remember.")
             return
         for k, v in preference.items():
-            database.set_preference(message.user, k, v)
+            await database.set_preference(message.user, k, v)
             await sendable.send(f"{k} is now {v}.")
         response = await chatgpt.get_completion([{"role":"system","content":"You are a helpful assistant."},{"role":"user","content":"I need a response to this that says I will remember these things: \n" + str(message.text) + "\nPlease blockquote the reply as a YAML blockquote starting with ```yaml\n```"}])
         await sendable.send(response.split("```yaml")[1].split("```")[0].strip())
 
-from intent_classifier import Sendable
-from db import Database
-from dto import Conversation, Message
+from sendable import Sendable
+from sendable import StreamingReply
+from async_database import AsyncDatabase
+from dto import NEW_CONVERSATION_SUMMARY, Conversation, Message
+import asyncio
 import chatgpt
+import context_window
+import conversation_index
+from conversation_index import ConversationIndex
+import knowledge_tree
+from knowledge_tree import KnowledgeTree
+import openai_client
+from openai_client import Priority
+from speculation import SpeculativeCompletion
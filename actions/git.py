@@ -4,8 +4,8 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from action import Action
 from dto import Message
-from intent_classifier import Sendable
-from db import Database
+from sendable import Sendable
+from async_database import AsyncDatabase
 from chatgpt import get_git_repo_and_options
 import os
 from subprocess import Popen, PIPE
@@ -14,17 +14,16 @@ class GitCloneAction(Action):
     def __init__(self, repo : dict[str, str]):
         super().__init__("Git Clone Action", "Clone a git repository.")
         self.repo = repo
-    async def __call__(self, message : Message, database : Database, sendable : Sendable) -> None:
+    async def __call__(self, message : Message, database : AsyncDatabase, sendable : Sendable) -> None:
         result = do_command(self.repo)
         if result:
             await sendable.send(result)
         else:
             await sendable.send("Successfully cloned into: " + self.repo["repo"])
-            conversation = database.get_current_conversation(message.user)
+            conversation = await database.get_current_conversation(message.user)
             if conversation is None:
                 raise ValueError("No conversation found.")
-            conversation.add_system("A git repository called " + self.repo["repo"] + " has been cloned from " + self.repo["url"] + " with the options: " + self.repo["options"])
-            database.set_conversation(message.user, conversation)
+            await database.append_message(message.user, conversation.id, "system", "A git repository called " + self.repo["repo"] + " has been cloned from " + self.repo["url"] + " with the options: " + self.repo["options"])
 
 def invoke_at(path: str):
     def parameterized(func):
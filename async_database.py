@@ -0,0 +1,202 @@
+from __future__ import annotations
+import asyncio
+import contextlib
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from db import Database, UserUnion
+from dto import Conversation
+from external_datasource import DataSource
+
+Job = Tuple[Callable[[], Any], asyncio.Future, asyncio.AbstractEventLoop]
+
+def settle(future : asyncio.Future, result : Any, error : Optional[BaseException]) -> None:
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+class AsyncDatabase:
+    """Awaitable Database that keeps storage work off the event loop.
+
+    Writes go to one writer thread, which commits whatever arrives within batch_window of the first
+    write as a single engine transaction. Reads run on a small thread pool and only wait for
+    writes still pending for the same user.
+    """
+    def __init__(self, database : Database, batch_window : float = 0.005, max_batch : int = 256, readers : int = 4):
+        self.database = database
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.queue : queue.Queue[Optional[Job]] = queue.Queue()
+        self.readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="database-reader")
+        self.pending : Dict[str, Set[asyncio.Future]] = {}
+        self.batches = 0
+        self.writes = 0
+        self.largest_batch = 0
+        self.writer = threading.Thread(target=self.run_writer, name="database-writer", daemon=True)
+        self.writer.start()
+
+    async def read(self, user : UserUnion, fn : Callable[..., Any], *args) -> Any:
+        # Read-your-writes: a caller that awaited nothing after starting a write, or a second coroutine for
+        # the same user, must still see it. Readers only see committed data, and the writer may be holding
+        # that user's write in an open batch, so wait for it; other users' batches don't hold anyone up.
+        pending = self.pending.get(str(user.id))
+        if pending:
+            await asyncio.wait(list(pending))
+        return await asyncio.get_running_loop().run_in_executor(self.readers, fn, *args)
+
+    async def write(self, user : UserUnion, fn : Callable[..., Any], *args) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        user_id = str(user.id)
+        pending = self.pending.setdefault(user_id, set())
+        pending.add(future)
+        self.queue.put((lambda: fn(*args), future, loop))
+        try:
+            return await asyncio.shield(future)
+        finally:
+            pending.discard(future)
+            if not pending and self.pending.get(user_id) is pending:
+                del self.pending[user_id]
+
+    def run_writer(self) -> None:
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            batch = [job]
+            stopping = False
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    job = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            self.commit(batch)
+            if stopping:
+                return
+
+    def commit(self, batch : List[Job]) -> None:
+        transaction = getattr(self.database.engine, "transaction", None)
+        results : List[Tuple[Any, Optional[BaseException]]] = []
+        try:
+            with transaction() if transaction is not None else contextlib.nullcontext():
+                for fn, _, _ in batch:
+                    try:
+                        results.append((fn(), None))
+                    except Exception as e:
+                        results.append((None, e))
+        except Exception as e:
+            # The commit itself failed, so none of the batch is known to be stored.
+            results = [(None, e)] * len(batch)
+        self.batches += 1
+        self.writes += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for (_, future, loop), (result, error) in zip(batch, results):
+            loop.call_soon_threadsafe(settle, future, result, error)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"batches": self.batches, "writes": self.writes, "mean_batch": self.writes / self.batches if self.batches else 0.0,
+                "largest_batch": self.largest_batch, "queued": self.queue.qsize(), "cache": self.database.cache_stats(),
+                "archive": self.database.archive_stats()}
+
+    async def close(self) -> None:
+        self.queue.put(None)
+        await asyncio.get_running_loop().run_in_executor(None, self.writer.join)
+        self.readers.shutdown()
+        self.database.close()
+
+    async def get_preferences(self, user : UserUnion) -> dict[str, str]:
+        return await self.read(user, self.database.get_preferences, user)
+
+    async def get_preference(self, user : UserUnion, preference_name, default=None) -> Optional[str]:
+        return await self.read(user, self.database.get_preference, user, preference_name, default)
+
+    async def set_preference(self, user : UserUnion, preference_name, preference_value):
+        await self.write(user, self.database.set_preference, user, preference_name, preference_value)
+
+    async def delete_preference(self, user : UserUnion, preference_name):
+        await self.write(user, self.database.delete_preference, user, preference_name)
+
+    async def get_datasources(self, user : UserUnion) -> dict[str, DataSource]:
+        return await self.read(user, self.database.get_datasources, user)
+
+    async def get_datasource(self, user : UserUnion, datasource_name) -> Optional[DataSource]:
+        return await self.read(user, self.database.get_datasource, user, datasource_name)
+
+    async def set_datasource(self, user : UserUnion, datasource : DataSource):
+        await self.write(user, self.database.set_datasource, user, datasource)
+
+    async def delete_datasource(self, user : UserUnion, datasource_name):
+        await self.write(user, self.database.delete_datasource, user, datasource_name)
+
+    async def get_conversations(self, user : UserUnion) -> List[Conversation]:
+        return await self.read(user, self.database.get_conversations, user)
+
+    async def get_conversation(self, user : UserUnion, conversation_id : str) -> Optional[Conversation]:
+        return await self.read(user, self.database.get_conversation, user, conversation_id)
+
+    async def set_conversation(self, user : UserUnion, conversation : Conversation):
+        # Snapshot now, so changes the caller makes after this call aren't picked up by the writer.
+        await self.write(user, self.database.set_conversation, user, conversation.copy())
+
+    async def update_conversation(self, user : UserUnion, conversation : Conversation):
+        await self.write(user, self.database.update_conversation, user, conversation.copy())
+
+    async def update_conversation_system(self, user : UserUnion, conversation : Conversation):
+        await self.write(user, self.database.update_conversation_system, user, conversation.copy())
+
+    async def update_conversation_summary(self, user : UserUnion, conversation : Conversation):
+        await self.write(user, self.database.update_conversation_summary, user, conversation.copy())
+
+    async def load_history(self, user : UserUnion, conversation : Conversation):
+        """Fills in the older turns storage left out of conversation, reading them on a reader thread."""
+        if conversation.offset > 0 and conversation.loader is not None:
+            conversation.prepend_history(await self.read(user, conversation.loader, conversation.offset))
+
+    async def append_message(self, user : UserUnion, conversation_id : str, role : str, content : str):
+        await self.write(user, self.database.append_message, user, conversation_id, role, content)
+
+    async def delete_conversation(self, user : UserUnion, conversation_id : str):
+        await self.write(user, self.database.delete_conversation, user, conversation_id)
+
+    async def get_archived_conversations(self, user : UserUnion) -> List[Conversation]:
+        return await self.read(user, self.database.get_archived_conversations, user)
+
+    async def archive_idle_conversations(self, user : UserUnion, force : bool = False) -> int:
+        return await self.write(user, self.database.archive_idle_conversations, user, force)
+
+    async def set_current_conversation(self, user : UserUnion, conversation : Conversation):
+        await self.write(user, self.database.set_current_conversation, user, conversation)
+
+    async def get_current_conversation(self, user : UserUnion) -> Optional[Conversation]:
+        return await self.read(user, self.database.get_current_conversation, user)
+
+    async def get_knowledge(self, user : UserUnion) -> str:
+        return await self.read(user, self.database.get_knowledge, user)
+
+    async def set_knowledge(self, user : UserUnion, knowledge : str):
+        await self.write(user, self.database.set_knowledge, user, knowledge)
+
+    async def get_knowledge_tree(self, user : UserUnion) -> dict[str, Any]:
+        return await self.read(user, self.database.get_knowledge_tree, user)
+
+    async def set_knowledge_tree(self, user : UserUnion, tree : dict[str, Any]):
+        await self.write(user, self.database.set_knowledge_tree, user, tree)
+
+    async def get_conversation_index(self, user : UserUnion) -> dict[str, Any]:
+        return await self.read(user, self.database.get_conversation_index, user)
+
+    async def set_conversation_index(self, user : UserUnion, index : dict[str, Any]):
+        await self.write(user, self.database.set_conversation_index, user, index)
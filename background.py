@@ -0,0 +1,52 @@
+from __future__ import annotations
+import asyncio
+import traceback
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+Job = Callable[[], Awaitable[Any]]
+
+class BackgroundWorker:
+    """Runs deferred work off the reply path; a job submitted while the same key is still queued replaces it."""
+    def __init__(self):
+        self.pending : Dict[Hashable, Job] = {}
+        self.running : Dict[Hashable, asyncio.Task] = {}
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, key : Hashable, job : Job) -> None:
+        self.submitted += 1
+        if key in self.pending:
+            self.coalesced += 1
+        self.pending[key] = job
+        if key not in self.running:
+            self.running[key] = asyncio.create_task(self.run(key))
+
+    async def run(self, key : Hashable) -> None:
+        # Jobs sharing a key never overlap; whatever was submitted meanwhile runs once afterwards.
+        try:
+            while key in self.pending:
+                job = self.pending.pop(key)
+                try:
+                    await job()
+                    self.completed += 1
+                except Exception:
+                    self.failed += 1
+                    traceback.print_exc()
+        finally:
+            del self.running[key]
+
+    async def drain(self) -> None:
+        while self.running:
+            await asyncio.gather(*self.running.values(), return_exceptions=True)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "queued": len(self.pending),
+            "running": len(self.running),
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
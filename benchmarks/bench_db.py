@@ -0,0 +1,58 @@
+"""Lookup latency of Database as users and conversations grow, against the old TinyDB query scans.
+
+Run from the repository root: python benchmarks/bench_db.py [sizes...]
+"""
+from __future__ import annotations
+import os
+import random
+import sys
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from types import SimpleNamespace
+from tinydb import Query, TinyDB
+from tinydb.storages import MemoryStorage
+from db import Database
+from dto import Conversation
+from storage.indexed import IndexedEngine
+
+def populate(size : int) -> TinyDB:
+    db = TinyDB(storage=MemoryStorage)
+    conversations, current, preferences = [], [], []
+    for i in range(size):
+        conversation = Conversation.new_conversation()
+        conversation.add_user("message " + str(i))
+        conversations.append({"user_id": str(i), "conversation": conversation, "conversation_id": conversation.id})
+        current.append({"user_id": str(i), "conversation_id": conversation.id})
+        preferences.append({"user_id": str(i), "preferences": {"name": "user " + str(i)}})
+    db.table("conversations").insert_multiple(conversations)
+    db.table("current_conversation").insert_multiple(current)
+    db.table("preferences").insert_multiple(preferences)
+    return db
+
+def time_per_call(func, users, samples : int) -> float:
+    picks = [random.choice(users) for _ in range(samples)]
+    start = time.perf_counter()
+    for user in picks:
+        func(user)
+    return (time.perf_counter() - start) / samples * 1e6
+
+def legacy_current_conversation(db : TinyDB, user) -> None:
+    # What Database did before: contains() then search() on one table, then a query on another.
+    query = Query()
+    if db.table("current_conversation").contains(query.user_id == str(user.id)):
+        conversation_id = db.table("current_conversation").search(query.user_id == str(user.id))[0]["conversation_id"]
+        db.table("conversations").get((query.user_id == str(user.id)) & (query.conversation_id == conversation_id))
+
+def main(sizes) -> None:
+    print(f"{'size':>8} {'indexed current':>16} {'indexed prefs':>14} {'tinydb current':>15}   (microseconds per call)")
+    for size in sizes:
+        tinydb = populate(size)
+        database = Database(engine=IndexedEngine(tinydb))
+        users = [SimpleNamespace(id=i) for i in range(size)]
+        indexed_current = time_per_call(database.get_current_conversation, users, 10000)
+        indexed_preferences = time_per_call(database.get_preferences, users, 10000)
+        legacy = time_per_call(lambda user: legacy_current_conversation(tinydb, user), users, max(3, 20000 // size))
+        print(f"{size:>8} {indexed_current:>16.1f} {indexed_preferences:>14.1f} {legacy:>15.1f}")
+
+if __name__ == "__main__":
+    main([int(x) for x in sys.argv[1:]] or [1000, 10000, 100000])
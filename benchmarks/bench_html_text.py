@@ -0,0 +1,70 @@
+"""HTML-to-text time of the streaming extractor against the BeautifulSoup pass it replaced.
+
+Runs over the saved pages in benchmarks/pages and over synthetic pages of growing size, which carry
+the usual navigation, scripts, sidebars and footers around their paragraphs.
+
+Run from the repository root: python benchmarks/bench_html_text.py [paragraphs...]
+"""
+from __future__ import annotations
+import glob
+import os
+import random
+import sys
+import time
+import warnings
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from bs4 import BeautifulSoup
+from html_text import extract_text
+
+PAGES = os.path.join(os.path.dirname(__file__), "pages")
+warnings.simplefilter("ignore", DeprecationWarning)
+WORDS = ("the loop runs each handler in turn while callbacks wait on the queue for input from the network and disk "
+         "so slow work moves to threads and results come back as events").split()
+
+def legacy_get_text_from_html(html : str) -> str:
+    # external_datasource.get_text_from_html as it was: a full tree, then a parent check on every text node.
+    navigation_elements = ["nav", "header", "footer", "aside", "html", "head", "meta", "link", "script", "style"]
+    non_navigation_text = []
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup.find_all(text=True):
+        if tag.parent.name not in navigation_elements:
+            non_navigation_text.append(tag.strip())
+    return "\n".join(non_navigation_text)
+
+def make_page(paragraphs : int, seed : int = 1) -> str:
+    rng = random.Random(seed)
+    sentence = lambda: " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "."
+    parts = ["<html><head><title>Synthetic</title><style>", "p { margin: 0 } " * 200, "</style><script>", "var x = 1; " * 500, "</script></head><body>",
+             "<nav><ul>", "".join(f"<li><a href='/s/{i}'>Section {i}</a></li>" for i in range(40)), "</ul></nav><main><article>"]
+    for i in range(paragraphs):
+        if i % 20 == 0:
+            parts.append(f"<h2>Part {i // 20}</h2>")
+        parts.append("<p>" + " ".join(sentence() for _ in range(3)) + " <a href='#'>more</a></p>")
+        if i % 50 == 49:
+            parts.append("<div class='advert'><a href='/ad'>Buy now</a><script>track();</script></div>")
+    parts.append("</article></main><aside class='sidebar'>" + "".join(f"<p><a href='/r/{i}'>Related {i}</a></p>" for i in range(30)) + "</aside>")
+    parts.append("<footer>" + "<a href='/x'>Link</a> " * 50 + "</footer></body></html>")
+    return "".join(parts)
+
+def timed(fn, *args, repeat : int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(*args)
+    return (time.perf_counter() - start) / repeat
+
+def report(name : str, html : str) -> None:
+    repeat = max(1, 2000000 // (len(html) + 1))
+    for method, fn in (("soup", lambda h: legacy_get_text_from_html(h)), ("stream", lambda h: extract_text(h, 0)), ("stream 8k", lambda h: extract_text(h, 8000))):
+        text = fn(html)
+        print(f"{name:>20} {len(html):>10} {method:>10} {timed(fn, html, repeat=repeat) * 1000:>10.2f} {len(text):>9}")
+
+def main(sizes) -> None:
+    print(f"{'page':>20} {'bytes':>10} {'method':>10} {'ms':>10} {'chars':>9}")
+    for path in sorted(glob.glob(os.path.join(PAGES, "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            report(os.path.basename(path), f.read())
+    for paragraphs in sizes:
+        report(f"synthetic {paragraphs}", make_page(paragraphs))
+
+if __name__ == "__main__":
+    main([int(x) for x in sys.argv[1:]] or [100, 1000, 10000])
@@ -0,0 +1,57 @@
+"""Encode/decode time and stored size of the dto codec against the jsonpickle encoding it replaced.
+
+Run from the repository root: python benchmarks/bench_serialization.py [turns...]
+"""
+from __future__ import annotations
+import json
+import os
+import sys
+import time
+import warnings
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import jsonpickle
+import serialization
+from dto import Conversation
+
+LEGACY_TAG = "{jsonpickle}:"
+warnings.simplefilter("ignore", DeprecationWarning)
+
+def make_record(turns : int) -> dict:
+    conversation = Conversation.new_conversation()
+    conversation.set_system("knowledge", "Here's a summary of the knowledge I have:\n" + "fact " * 50)
+    for turn in range(turns):
+        conversation.add_user(f"Question {turn}: " + "lorem ipsum " * 10)
+        conversation.add_assistant(f"Answer {turn}: " + "dolor sit amet " * 20)
+    return {"user_id": "1234567890", "conversation": conversation, "conversation_id": conversation.id}
+
+def legacy_encode(record : dict) -> str:
+    # What tinydb_serialization wrote: every field jsonpickled and tagged.
+    return json.dumps({k: LEGACY_TAG + jsonpickle.encode(v) for k, v in record.items()}, ensure_ascii=False)
+
+def legacy_decode(text : str) -> dict:
+    return serialization.decode_document(json.loads(text))
+
+def compact_encode(record : dict) -> str:
+    return json.dumps(serialization.encode(record), ensure_ascii=False)
+
+def compact_decode(text : str) -> dict:
+    return serialization.decode(json.loads(text))
+
+def timed(fn, arg, repeat : int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(arg)
+    return (time.perf_counter() - start) / repeat
+
+def main(sizes) -> None:
+    print(f"{'turns':>6} {'format':>10} {'encode (us)':>12} {'decode (us)':>12} {'bytes':>9}")
+    for turns in sizes:
+        record = make_record(turns)
+        repeat = max(10, 20000 // (turns + 1))
+        for name, encode, decode in (("jsonpickle", legacy_encode, legacy_decode), ("compact", compact_encode, compact_decode)):
+            text = encode(record)
+            assert decode(text)["conversation"] == record["conversation"]
+            print(f"{turns:>6} {name:>10} {timed(encode, record, repeat) * 1e6:>12.1f} {timed(decode, text, repeat) * 1e6:>12.1f} {len(text.encode('utf-8')):>9}")
+
+if __name__ == "__main__":
+    main([int(x) for x in sys.argv[1:]] or [0, 10, 100, 1000])
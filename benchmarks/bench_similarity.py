@@ -0,0 +1,59 @@
+"""All-pairs like() between two lists of search-result-sized strings: per pair versus one batch matrix.
+
+The per-pair time is measured on a sample of pairs and scaled up to the full n x n.
+
+Run from the repository root: python benchmarks/bench_similarity.py [n...]
+"""
+from __future__ import annotations
+import os
+import random
+import sys
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from similarity import like_matrix
+
+WORDS = ("market rates bank inflation election vote senate court ruling storm flood coast team season final "
+         "player coach study cells cancer trial vaccine launch rocket orbit moon company shares profit quarter").split()
+
+def make_texts(n : int, seed : int) -> list:
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 14))).capitalize() + "." for _ in range(n)]
+
+def legacy_like(string1 : str, string2 : str, threshold_jac : float = 0.4, threshold_cos : float = 0.6) -> bool:
+    # external_datasource.like as it was: a fresh CountVectorizer fitted on the two strings for every pair.
+    string1 = ''.join(c for c in string1 if c.isalnum() or c.isspace()).lower().strip()
+    string2 = ''.join(c for c in string2 if c.isalnum() or c.isspace()).lower().strip()
+    if string1.startswith("the"):
+        string1 = string1[4:]
+    if string2.startswith("the"):
+        string2 = string2[4:]
+    if not string1 or not string2:
+        return False
+    if string1 == string2 or string1[:6] in string2 or string2[:6] in string1:
+        return True
+    set1, set2 = set(string1.split()), set(string2.split())
+    if len(set1 & set2) / len(set1 | set2) >= threshold_jac:
+        return True
+    return cosine_similarity(CountVectorizer().fit_transform([string1, string2]))[0][1] >= threshold_cos
+
+def main(sizes) -> None:
+    print(f"{'n':>6} {'method':>10} {'seconds':>10} {'speedup':>9} {'matches':>9}")
+    for n in sizes:
+        left, right = make_texts(n, 1), make_texts(n, 2)
+        sample = min(n, 40)
+        start = time.perf_counter()
+        for a in left[:sample]:
+            for b in right[:sample]:
+                legacy_like(a, b)
+        legacy = (time.perf_counter() - start) * (n * n) / (sample * sample)
+        print(f"{n:>6} {'per pair':>10} {legacy:>10.2f} {1:>9.0f} {'-':>9}")
+        for name, minhash in (("matrix", False), ("minhash", True)):
+            start = time.perf_counter()
+            matches = like_matrix(left, right, minhash=minhash)
+            elapsed = time.perf_counter() - start
+            print(f"{n:>6} {name:>10} {elapsed:>10.2f} {legacy / elapsed:>9.0f} {int(matches.sum()):>9}")
+
+if __name__ == "__main__":
+    main([int(x) for x in sys.argv[1:]] or [100, 1000])
@@ -0,0 +1,81 @@
+"""Read/write latency and on-disk size of the TinyDB, journal and SQLite storage backends.
+
+Run from the repository root: python benchmarks/bench_storage.py [users...]
+"""
+from __future__ import annotations
+import glob
+import os
+import random
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from types import SimpleNamespace
+from db import Database, open_engine
+from dto import Conversation
+from storage.indexed import IndexedEngine
+
+TURNS = 10
+
+def make_conversation(user_id : int) -> Conversation:
+    conversation = Conversation.new_conversation()
+    for turn in range(TURNS):
+        conversation.add_user(f"Question {turn} from user {user_id}: " + "lorem ipsum " * 10)
+        conversation.add_assistant(f"Answer {turn}: " + "dolor sit amet " * 20)
+    return conversation
+
+def populate(mode : str, path : str, users : int) -> Database:
+    records = []
+    for i in range(users):
+        conversation = make_conversation(i)
+        records.append(("conversations", {"user_id": str(i), "conversation": conversation, "conversation_id": conversation.id}))
+        records.append(("current_conversation", {"user_id": str(i), "conversation_id": conversation.id}))
+        records.append(("preferences", {"user_id": str(i), "preferences": {"name": f"user {i}"}}))
+    engine = open_engine(path, mode)
+    if isinstance(engine, IndexedEngine):
+        # One bulk insert per table; going through put() would rewrite the file for every record.
+        for table in ("conversations", "current_conversation", "preferences"):
+            engine.db.table(table).insert_multiple([r for t, r in records if t == table])
+        engine = IndexedEngine(engine.db)
+    else:
+        transaction = getattr(engine, "transaction", None)
+        if transaction is not None:
+            with transaction():
+                for table, record in records:
+                    engine.put(table, record)
+        else:
+            for table, record in records:
+                engine.put(table, record)
+    return Database(engine=engine)
+
+def size_on_disk(path : str) -> int:
+    return sum(os.path.getsize(p) for p in glob.glob(glob.escape(path) + "*"))
+
+def bench(mode : str, users : int, writes : int, reads : int) -> dict[str, float]:
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "bench." + mode)
+    database = populate(mode, path, users)
+    people = [SimpleNamespace(id=i) for i in range(users)]
+    start = time.perf_counter()
+    for _ in range(reads):
+        database.get_current_conversation(random.choice(people))
+    read = (time.perf_counter() - start) / reads
+    start = time.perf_counter()
+    for _ in range(writes):
+        user = random.choice(people)
+        conversation = database.get_current_conversation(user)
+        conversation.add_user("One more question")
+        database.set_conversation(user, conversation)
+    write = (time.perf_counter() - start) / writes
+    database.close()
+    return {"read_us": read * 1e6, "write_ms": write * 1e3, "size_kb": size_on_disk(path) / 1024}
+
+def main(sizes) -> None:
+    print(f"{'backend':>8} {'users':>7} {'read (us)':>10} {'write (ms)':>11} {'size (KB)':>10}")
+    for users in sizes:
+        for mode in ("tinydb", "journal", "sqlite"):
+            result = bench(mode, users, writes=5 if mode == "tinydb" else 200, reads=2000)
+            print(f"{mode:>8} {users:>7} {result['read_us']:>10.1f} {result['write_ms']:>11.2f} {result['size_kb']:>10.0f}")
+
+if __name__ == "__main__":
+    main([int(x) for x in sys.argv[1:]] or [100, 1000, 5000])
@@ -1,12 +1,13 @@
 from __future__ import annotations
-from typing import List, Optional, Tuple, Type
+from typing import AsyncGenerator, List, Optional, Tuple, Type
 import openai
 import os
 import re
 from nltk.sentiment.vader import SentimentIntensityAnalyzer
-from retry import retry
 import yaml
 from typing import TypeVar
+from completion_cache import CompletionCache
+import openai_client
 import source_utils
 T = TypeVar("T", bound=object)
 
@@ -17,16 +18,29 @@ analyzer = SentimentIntensityAnalyzer()
 openai.api_key = os.getenv("OpenAIAPI-Token")
 model_engine = "gpt-3.5-turbo"
 
-@retry(tries=3, delay=3, backoff=2, logger=None)
-async def get_completion(messages :list[dict[str,str]], model:str=model_engine, temperature:float=0.5) -> str:
-    response = openai.ChatCompletion.create(
+# Only helpers that opt in with cache=True are served from here; user-facing completions never are.
+response_cache = CompletionCache(path=os.getenv("Completion-Cache-Path"))
+
+async def get_completion(messages :list[dict[str,str]], model:str=model_engine, temperature:float=0.5, cache:bool=False) -> str:
+    if not cache:
+        return await request_completion(messages, model, temperature)
+    key = CompletionCache.make_key(model, temperature, messages)
+    return await response_cache.get_or_compute(key, lambda: request_completion(messages, model, temperature))
+
+@openai_client.async_retry(tries=3, delay=3, backoff=2)
+async def request_completion(messages :list[dict[str,str]], model:str=model_engine, temperature:float=0.5) -> str:
+    response = await openai_client.create_chat_completion(
             model=model,
             messages=messages,
             temperature=temperature)
     if response is None:
-        raise Exception("No response from OpenAI")
+        raise openai.error.APIError("No response from OpenAI")
     return response.choices[0]['message']['content'] # type: ignore
 
+async def stream_completion(messages :list[dict[str,str]], model:str=model_engine, temperature:float=0.5) -> AsyncGenerator[str, None]:
+    async for chunk in openai_client.stream_chat_completion(model=model, messages=messages, temperature=temperature):
+        yield chunk
+
 def get_body(message : str) -> str:
     try:
         message = message.split('```')[1]
@@ -41,7 +55,7 @@ async def extract_topic(message : str) -> str:
         {"role":"system","content":"You are a helpful AI assistant who knows how to extract a topic from a sentence for searching Wikipedia with. I will supply you with a sentence, and I want you to tell me, in quotes, a word or phrase suitible for searching Wikipedia with. Please supply only the singular thing to search in quotes. For example, if I say 'I want to search Wikipedia for the meaning of life', you should say 'meaning of life' and nothing else."},
         {"role":"user","content":"What is the topic being discussed here? \"" + message + "\" Please only supply the topic in quotes. Make sure to include the quotes and nothing else except the topic in quotes."}
     ]
-    return (await get_completion(convo)).replace('"', '').replace("'", "").rstrip().lstrip()
+    return (await get_completion(convo, cache=True)).replace('"', '').replace("'", "").rstrip().lstrip()
 
 async def summarize(conversation: str) -> str:
     convo = [
@@ -50,6 +64,14 @@ async def summarize(conversation: str) -> str:
     ]
     return (await get_completion(convo)).replace('"', '').replace("'", "").rstrip().lstrip()
 
+async def fold_summary(summary: str, turns: str) -> str:
+    convo = [
+        {"role":"system","content":"You are a helpful AI assistant who keeps a running summary of a conversation up to date. I will supply you with the summary so far and the turns that came after it, and I want you to return the updated summary as a list of key factual and conversational datapoints. Keep every datapoint from the existing summary that is still true, add the important details from the new turns, and return only the bulleted list. Don't use words like \"summary\" or \"prior conversations\" in your reply unless they are part of the data in the list itself."},
+        {"role":"system","content":"Here's the summary so far:\n" + summary},
+        {"role":"user","content":"Here are the new turns of the conversation:\n" + turns[:12000] + "\nPlease only supply the updated summary in quotes. Make sure to include the quotes and nothing else except the summary in quotes."}
+    ]
+    return (await get_completion(convo)).replace('"', '').replace("'", "").rstrip().lstrip()
+
 async def summarize_data(data: str) -> str:
     convo = [
         {"role":"system","content":"You are a helpful AI assistant who knows how to create detailed summaries of content. I will supply you with some content, and I want you to tell me, in quotes, a summary of the conversation. Please supply as many important details in the summary as you can."},
@@ -125,7 +147,7 @@ async def get_wolfram_query(query : str) -> str:
         {"role":"system","content":"You are a helpful AI assistant capable of converting conversatioal summaries and follow up questions into a query suitible for Wolfram Alpha."},
         {"role":"user","content":"Please convert the following into a query suitible for sending to WolframAlpha: " + query}
     ]
-    return (await get_completion(convo)).replace('"', '').replace("'", "").rstrip().lstrip()
+    return (await get_completion(convo, cache=True)).replace('"', '').replace("'", "").rstrip().lstrip()
 
 async def extract_urls(query : str) -> List[dict[str,str]]:
     convo = [
@@ -157,7 +179,7 @@ async def extract_datasource(query : str) -> Optional[dict[str,str]]:
         {"role":"system","content":"You are a software engineer responsible for designing a web API interface based on a plain text description. Your goal is to take a description of a web API, including its URL and endpoints, and create a YAML map that includes all the relevant parameters specified. For example, if you were given the following plain text description: \"I have an API for searching Google at google.com, and it has a search API at /search which takes a query parameter q and returns results in JSON format\", your output would be a YAML map that includes the following information:\n```yaml\nurl: \"https://google.com\"\nendpoints:\n  - path: \"/search\"\n    method: \"GET\"\n    query_params:\n      - name: \"q\"\n        required: true\n    response_format: \"json\"\n```\n"},
         {"role":"user","content":f"Your first example is, \"{query}\" Please write a YAML map for this datasource."}
     ]
-    result = (await get_completion(convo)).replace('"', '').replace("'", "").rstrip().lstrip()
+    result = (await get_completion(convo, cache=True)).replace('"', '').replace("'", "").rstrip().lstrip()
     try:
         result = get_body(result)
         result = yaml.load(result, Loader=yaml.Loader)
@@ -179,7 +201,7 @@ async def classify_intent(categories : List[str], query : str, context: Optional
     if context is not None:
         convo += [{"role": "user", "content": "For context: " + context}]
     convo += [{"role": "user", "content": f'Please classify this message as one or more of the above options listed:\n"{query}"'}]
-    result = await get_completion(convo, temperature=0)
+    result = await get_completion(convo, temperature=0, cache=True)
     try:
         result = get_body(result)
         output = []
@@ -261,7 +283,7 @@ async def get_structured_classification(message: str, cls: Type[T], constraints:
     if constraints:
         convo += [{"role":"system","content": f"Here are the required values for the parameters:\n{con}\n"}]
     convo += [{"role": "user", "content": f'Please convert the following into a blockquoted YAML array of dictionaries that follows the above constraints: "{message}"\n'}]
-    result = (await get_completion(convo))
+    result = (await get_completion(convo, cache=True))
     result = get_body(result)
     result = source_utils.from_yaml(result, cls)
     if not isinstance(result, list):
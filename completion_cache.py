@@ -0,0 +1,134 @@
+from __future__ import annotations
+import asyncio
+import atexit
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+class CompletionCache:
+    """LRU + TTL cache of completions keyed by a hash of (model, temperature, messages)."""
+    def __init__(self, max_entries : int = 2048, ttl : float = 24 * 60 * 60, path : Optional[str] = None, flush_interval : float = 30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.flush_interval = flush_interval
+        self.entries : OrderedDict[str, Tuple[float, str]] = OrderedDict()
+        self.inflight : Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.dirty = False
+        self.last_save = time.time()
+        # Periodic saves are written on this thread, one at a time, so a put never waits on the dump.
+        self.saver = ThreadPoolExecutor(max_workers=1, thread_name_prefix="completion-cache")
+        self.saving : Optional[Future] = None
+        if self.path is not None:
+            self.load()
+            atexit.register(self.save)
+
+    @staticmethod
+    def make_key(model : str, temperature : float, messages : List[dict[str, str]]) -> str:
+        payload = json.dumps([model, temperature, messages], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key : str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self.entries[key]
+            self.dirty = True
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key : str, value : str) -> None:
+        self.entries[key] = (time.time() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.dirty = True
+        if self.path is not None and time.time() - self.last_save >= self.flush_interval and (self.saving is None or self.saving.done()):
+            self.last_save = time.time()
+            self.dirty = False
+            self.saving = self.saver.submit(self.write, list(self.entries.items()))
+
+    async def get_or_compute(self, key : str, compute : Callable[[], Awaitable[str]]) -> str:
+        # Identical prompts that are already in flight share one request instead of racing. The request
+        # runs in its own task, so cancelling the caller that started it doesn't fail the others.
+        pending = self.inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        task = asyncio.get_running_loop().create_task(self.compute(key, compute))
+        # Retrieve the outcome even if every caller has gone, so a failure isn't reported as unhandled.
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self.inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def compute(self, key : str, compute : Callable[[], Awaitable[str]]) -> str:
+        try:
+            value = await compute()
+            self.put(key, value)
+            return value
+        finally:
+            del self.inflight[key]
+
+    def load(self) -> None:
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, (expires_at, value) in sorted(data.items(), key=lambda x: x[1][0]):
+            if expires_at >= now:
+                self.entries[key] = (expires_at, value)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def save(self) -> None:
+        self.last_save = time.time()
+        if self.saving is not None:
+            self.saving.result()
+        if self.path is None or not self.dirty:
+            return
+        self.dirty = False
+        self.write(list(self.entries.items()))
+
+    def write(self, entries : List[Tuple[str, Tuple[float, str]]]) -> None:
+        temp_path = self.path + ".tmp" # type: ignore
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({k: list(v) for k, v in entries}, f, ensure_ascii=False)
+            os.replace(temp_path, self.path) # type: ignore
+        except OSError:
+            self.dirty = True
+            raise
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.dirty = True
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
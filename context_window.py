@@ -0,0 +1,100 @@
+from __future__ import annotations
+import os
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+context_budget = int(os.getenv("Context-Token-Budget", "3000"))
+# Turns are folded into the summary once this many tokens have built up, at most summary_chunk_budget per request.
+summary_threshold = int(os.getenv("Summary-Token-Threshold", "600"))
+summary_chunk_budget = int(os.getenv("Summary-Chunk-Budget", "2000"))
+
+# Per-message framing overhead and reply priming, per the OpenAI chat token accounting.
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+
+class TokenCounter:
+    """Counts chat message tokens, remembering the count for each (role, content) seen recently."""
+    def __init__(self, model : str = "gpt-3.5-turbo", max_entries : int = 50000):
+        self.model = model
+        self.max_entries = max_entries
+        self.counts : OrderedDict[Tuple[str, str], int] = OrderedDict()
+        self.encoding = None
+        self.encoding_loaded = False
+
+    def get_encoding(self):
+        # tiktoken fetches encodings on first use, so load lazily and fall back if that fails.
+        if not self.encoding_loaded:
+            self.encoding_loaded = True
+            if tiktoken is not None:
+                try:
+                    try:
+                        self.encoding = tiktoken.encoding_for_model(self.model)
+                    except KeyError:
+                        self.encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception:
+                    self.encoding = None
+        return self.encoding
+
+    def count_text(self, text : str) -> int:
+        encoding = self.get_encoding()
+        if encoding is not None:
+            return len(encoding.encode(text))
+        # Without tiktoken, roughly four characters per token for English text.
+        return (len(text) + 3) // 4
+
+    def count_message(self, message : dict[str, str]) -> int:
+        key = (message["role"], message["content"])
+        count = self.counts.get(key)
+        if count is not None:
+            self.counts.move_to_end(key)
+            return count
+        count = self.count_text(message["content"]) + MESSAGE_OVERHEAD
+        self.counts[key] = count
+        if len(self.counts) > self.max_entries:
+            self.counts.popitem(last=False)
+        return count
+
+    def count_messages(self, messages : List[dict[str, str]]) -> int:
+        return sum(self.count_message(m) for m in messages) + REPLY_OVERHEAD
+
+token_counter = TokenCounter()
+
+def build_context(system : List[dict[str, str]], messages : List[dict[str, str]], summary : Optional[str], max_tokens : int, min_recent : int = 1,
+                  summarized : int = 0) -> List[dict[str, str]]:
+    """Keep every system block and as many of the latest turns as fit, standing the summary in for the rest.
+
+    Only the first summarized messages are covered by the summary, so only those are ever dropped; a
+    tail the fold has not reached yet is kept whole, even past max_tokens.
+    """
+    used = token_counter.count_messages(system)
+    turn_costs = [token_counter.count_message(m) for m in messages]
+    if used + sum(turn_costs) <= max_tokens or summarized <= 0:
+        return system + messages
+    summary_message = []
+    if summary:
+        summary_message = [{"role":"system","content":"Here's a summary of the conversation so far:\n" + summary}]
+        used += token_counter.count_messages(summary_message) - REPLY_OVERHEAD
+    start = len(messages)
+    while start > 0 and (used + turn_costs[start - 1] <= max_tokens or len(messages) - start < min_recent or start > summarized):
+        start -= 1
+        used += turn_costs[start]
+    if start == 0:
+        return system + messages
+    return system + summary_message + messages[start:]
+
+def split_by_tokens(messages : List[dict[str, str]], max_tokens : int) -> List[List[dict[str, str]]]:
+    """Consecutive runs of messages that each fit in max_tokens; a message too big alone gets a run of its own."""
+    chunks : List[List[dict[str, str]]] = []
+    used = 0
+    for message in messages:
+        cost = token_counter.count_message(message)
+        if not chunks or used + cost > max_tokens:
+            chunks.append([])
+            used = 0
+        chunks[-1].append(message)
+        used += cost
+    return chunks
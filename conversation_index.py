@@ -0,0 +1,78 @@
+from __future__ import annotations
+import os
+from typing import Any, Dict, List, Optional, Tuple
+from knowledge_tree import fingerprint
+from text_vectors import HashingVectorizer, SparseVector, cosine, normalize
+
+routing_candidates = int(os.getenv("Routing-Candidates", "5"))
+# A candidate at least this similar, and this far ahead of the next one, is taken without asking the LLM.
+match_threshold = float(os.getenv("Routing-Match-Threshold", "0.3"))
+match_margin = float(os.getenv("Routing-Match-Margin", "0.1"))
+# Below this nothing is related, so the message starts a new conversation.
+new_threshold = float(os.getenv("Routing-New-Threshold", "0.05"))
+
+routing_stats = {"local_match": 0, "local_new": 0, "llm": 0, "llm_out_of_range": 0}
+
+Candidate = Tuple[str, float]
+
+class ConversationIndex:
+    """Hashed TF-IDF vectors over one user's conversation summaries, recomputed only where a summary changed."""
+    def __init__(self, data : Optional[Dict[str, Any]] = None):
+        data = data or {}
+        self.documents : Dict[str, Dict[str, Any]] = data.get("documents", {})
+        self.vectorizer = HashingVectorizer()
+        self.vectors : Dict[str, SparseVector] = {}
+        self.refit()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"documents": self.documents}
+
+    def refit(self) -> None:
+        # Term frequencies are stored; document frequencies and the weighted vectors are cheap to rebuild.
+        self.vectorizer.documents = len(self.documents)
+        self.vectorizer.document_frequency = {}
+        for document in self.documents.values():
+            for index, _ in document["features"]:
+                self.vectorizer.document_frequency[index] = self.vectorizer.document_frequency.get(index, 0) + 1
+        self.vectors = {conversation_id: normalize({index: weight * self.vectorizer.idf(index) for index, weight in document["features"]})
+                        for conversation_id, document in self.documents.items()}
+
+    def sync(self, summaries : Dict[str, str]) -> bool:
+        changed = False
+        for conversation_id in [c for c in self.documents if c not in summaries]:
+            del self.documents[conversation_id]
+            changed = True
+        for conversation_id, summary in summaries.items():
+            digest = fingerprint(summary)
+            document = self.documents.get(conversation_id)
+            if document is None or document["hash"] != digest:
+                self.documents[conversation_id] = {"hash": digest, "features": [[k, v] for k, v in self.vectorizer.features(summary).items()]}
+                changed = True
+        if changed:
+            self.refit()
+        return changed
+
+    def search(self, text : str, k : int = routing_candidates) -> List[Candidate]:
+        query = self.vectorizer.transform(text)
+        scores = [(conversation_id, cosine(query, vector)) for conversation_id, vector in self.vectors.items()]
+        scores.sort(key=lambda x: x[1], reverse=True)
+        return scores[:k]
+
+def decide(candidates : List[Candidate]) -> Tuple[str, Optional[str]]:
+    """("match", id) or ("new", None) when the scores settle it, otherwise ("ask", None).
+
+    With no candidates there is no earlier conversation to go back to, so the change is to a new one.
+    """
+    if not candidates:
+        routing_stats["local_new"] += 1
+        return "new", None
+    best = candidates[0][1]
+    runner_up = candidates[1][1] if len(candidates) > 1 else 0.0
+    if best >= match_threshold and best - runner_up >= match_margin:
+        routing_stats["local_match"] += 1
+        return "match", candidates[0][0]
+    if best < new_threshold:
+        routing_stats["local_new"] += 1
+        return "new", None
+    routing_stats["llm"] += 1
+    return "ask", None
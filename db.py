@@ -1,127 +1,211 @@
 from __future__ import annotations
+import os
 import discord
-from tinydb import TinyDB, Query
-from tinydb.queries import QueryInstance
-from typing import List, Optional, Type, Any, Union
-import jsonpickle
-from tinydb_serialization import Serializer
-from tinydb_serialization import SerializationMiddleware
+from tinydb import TinyDB
+from typing import Any, List, Optional, Union
+from tinydb.middlewares import Middleware
 from tinydb.storages import JSONStorage
+import serialization
 from dto import Conversation
 from dto import User, UserConversation
 from external_datasource import DataSource
+from storage.archive import ColdStore, ConversationArchive
+from storage.cache import CachedEngine
+from storage.engine import StorageEngine
+from storage.indexed import IndexedEngine
+from storage.journal import JournalEngine
+from storage.migrate import migrate
+from storage.sqlite import SQLiteEngine
 
 UserUnion = Union[User, discord.User]
-class JSONSerializer(Serializer):
-    OBJ_CLASS : Type[object] = object
+class CodecMiddleware(Middleware):
+    """Stores documents in the compact dto encoding, reading older jsonpickle-tagged documents as well."""
+    def read(self):
+        data = self.storage.read()
+        if data is None:
+            return None
+        return {table: {doc_id: serialization.decode_document(document) for doc_id, document in documents.items()} for table, documents in data.items()}
 
-    def encode(self, obj):
-        return jsonpickle.encode(obj)
+    def write(self, data):
+        self.storage.write({table: {doc_id: serialization.encode(document) for doc_id, document in documents.items()} for table, documents in data.items()})
 
-    def decode(self, s):
-        return jsonpickle.decode(s)
- 
-from tinydb import TinyDB, Query
+def open_tinydb(db_path : str) -> TinyDB:
+    return TinyDB(db_path, indent=4, separators=(',', ': '), ensure_ascii=False, storage=CodecMiddleware(JSONStorage))
 
-def get_user_query(user: UserUnion, query : Query = Query()) -> QueryInstance:
-    return query.user_id == str(user.id)
+def open_engine(db_path : str, mode : str = "tinydb") -> StorageEngine:
+    if mode == "tinydb":
+        return IndexedEngine(open_tinydb(db_path))
+    if mode == "journal":
+        # The journal lives beside db.json, so switching an existing TinyDB over starts by importing it.
+        fresh = not JournalEngine.exists(db_path)
+        engine = JournalEngine(db_path)
+        if fresh and os.path.isfile(db_path) and os.path.getsize(db_path) > 0:
+            count = migrate(db_path, engine)
+            print(f"Imported {count} records from {db_path} into a new journal")
+        return engine
+    if mode == "sqlite":
+        return SQLiteEngine(db_path)
+    raise ValueError("Unknown storage mode: " + mode)
 
-def get_conversation_query(user: UserUnion, conversation_id : str, query = Query()) -> QueryInstance:
-    user_query = get_user_query(user, query)
-    return user_query and query.conversation_id == conversation_id
-    
 class Database:
-    def __init__(self, db_path="db.json"):
-        middleware = SerializationMiddleware(JSONStorage)
-        middleware.register_serializer(JSONSerializer(), "jsonpickle")
-        self.db = TinyDB(db_path, indent=4, separators=(',', ': '), ensure_ascii=False, storage=middleware) 
-        self.preferences = self.db.table("preferences")
-        self.conversations = self.db.table("conversations")
-        self.current_conversation = self.db.table("current_conversation")
-        self.knowledge = self.db.table("knowledge")
-        self.datasources = self.db.table("datasources")
+    def __init__(self, db_path="db.json", engine : Optional[StorageEngine] = None, mode : str = "tinydb", cache_bytes : int = 0,
+                 archive_path : Optional[str] = None, archive_after : float = 30 * 86400):
+        if engine is None:
+            engine = open_engine(db_path, mode)
+        if cache_bytes > 0:
+            engine = CachedEngine(engine, cache_bytes)
+        self.engine = engine
+        self.archive = ConversationArchive(engine, ColdStore(archive_path), archive_after) if archive_path else None
+
+    def cache_stats(self) -> dict[str, Any]:
+        if isinstance(self.engine, CachedEngine):
+            return self.engine.stats()
+        return {}
+
+    def archive_stats(self) -> dict[str, Any]:
+        if self.archive is not None:
+            return self.archive.stats()
+        return {}
+
+    def touch(self, user : UserUnion, conversation_id : str):
+        if self.archive is not None:
+            self.archive.touch(str(user.id), conversation_id)
 
     def get_preferences(self, user : UserUnion) -> dict[str, str]:
-        if not self.preferences.contains(get_user_query(user)):
+        record = self.engine.get("preferences", (str(user.id),))
+        if record is None:
             return {}
-        else:
-            return self.preferences.search(get_user_query(user))[0].get("preferences", {})
-        
+        return record.get("preferences", {})
+
     def get_preference(self, user_id, preference_name, default=None) -> Optional[str]:
         return self.get_preferences(user_id).get(preference_name, default)
-    
+
     def set_preference(self, user : UserUnion, preference_name, preference_value):
-        if not self.preferences.contains(get_user_query(user)):
-            self.preferences.insert({"user_id": str(user.id), "preferences": {preference_name: preference_value}})
-        else:
-            preferences = self.preferences.search(get_user_query(user))[0].get("preferences", {})
-            preferences[preference_name] = preference_value
-            self.preferences.update({"preferences": preferences}, get_user_query(user))
+        preferences = self.get_preferences(user)
+        preferences[preference_name] = preference_value
+        self.engine.put("preferences", {"user_id": str(user.id), "preferences": preferences})
 
     def delete_preference(self, user : UserUnion, preference_name):
-        if not self.preferences.contains(get_user_query(user)):
+        preferences = self.get_preferences(user)
+        if preference_name not in preferences:
             return
-        else:
-            preferences = self.preferences.search(get_user_query(user))[0].get("preferences", {})
-            del preferences[preference_name]
-            self.preferences.update({"preferences": preferences}, get_user_query(user))
+        del preferences[preference_name]
+        self.engine.put("preferences", {"user_id": str(user.id), "preferences": preferences})
 
     def get_datasources(self, user : UserUnion) -> dict[str, DataSource]:
-        if not self.datasources.contains(get_user_query(user)):
+        record = self.engine.get("datasources", (str(user.id),))
+        if record is None:
             return {}
-        else:
-            return self.datasources.search(get_user_query(user))[0].get("datasources", {})
-        
+        return record.get("datasources", {})
+
     def get_datasource(self, user : UserUnion, datasource_name) -> Optional[DataSource]:
         return self.get_datasources(user).get(datasource_name, None)
-    
+
     def set_datasource(self, user : UserUnion, datasource : DataSource):
-        if not self.datasources.contains(get_user_query(user)):
-            self.datasources.insert({"user_id": str(user.id), "datasources": {}})
-        datasources = self.datasources.search(get_user_query(user))[0].get("datasources", {})
+        datasources = self.get_datasources(user)
         datasources[datasource.name] = datasource
-        self.datasources.update({"datasources": datasources}, get_user_query(user))
+        self.engine.put("datasources", {"user_id": str(user.id), "datasources": datasources})
 
     def delete_datasource(self, user : UserUnion, datasource_name):
-
-        if not self.datasources.contains(get_user_query(user)):
+        datasources = self.get_datasources(user)
+        if datasource_name not in datasources:
             return
-        else:
-            datasources = self.datasources.search(get_user_query(user))[0].get("datasources", {})
-            del datasources[datasource_name]
-            self.datasources.update({"datasources": datasources}, get_user_query(user))
+        del datasources[datasource_name]
+        self.engine.put("datasources", {"user_id": str(user.id), "datasources": datasources})
 
     def get_conversations(self, user : UserUnion) -> List[Conversation]:
-        result = self.conversations.search(get_user_query(user))
+        result = self.engine.find("conversations", str(user.id))
         return [r.get("conversation", None) for r in result]
-    
+
     def get_conversation(self, user : UserUnion, conversation_id : str) -> Optional[Conversation]:
-        result = self.conversations.get(get_conversation_query(user, conversation_id))
+        result = self.engine.get("conversations", (str(user.id), conversation_id))
         if result is None:
             return None
-        return result.get("conversation", None)    
+        return result.get("conversation", None)
     def set_conversation(self, user: UserUnion, conversation : Conversation):
-        self.conversations.upsert(UserConversation(user_id=str(user.id), conversation=conversation, conversation_id=conversation.id).__dict__, get_conversation_query(user, conversation.id))
+        self.touch(user, conversation.id)
+        self.engine.put("conversations", UserConversation(user_id=str(user.id), conversation=conversation, conversation_id=conversation.id).__dict__)
+
+    def update_conversation(self, user: UserUnion, conversation : Conversation):
+        self.touch(user, conversation.id)
+        self.engine.put_conversation_header(str(user.id), conversation)
+
+    def update_conversation_system(self, user: UserUnion, conversation : Conversation):
+        """Save only the conversation's system blocks, keeping the summary already stored, which a fold may have moved on."""
+        stored = self.get_conversation(user, conversation.id)
+        if stored is not None:
+            conversation = Conversation(dict(conversation.system), [], stored.summary, conversation.id, stored.summarized)
+        self.update_conversation(user, conversation)
+
+    def update_conversation_summary(self, user: UserUnion, conversation : Conversation):
+        """Save only the conversation's summary and summarized count, keeping the system blocks already stored."""
+        stored = self.get_conversation(user, conversation.id)
+        if stored is not None:
+            conversation = Conversation(dict(stored.system), [], conversation.summary, conversation.id, conversation.summarized)
+        self.update_conversation(user, conversation)
+
+    def append_message(self, user: UserUnion, conversation_id : str, role : str, content : str):
+        self.touch(user, conversation_id)
+        self.engine.append_message(str(user.id), conversation_id, {"role": role, "content": content})
 
     def delete_conversation(self, user: UserUnion, conversation_id : str):
-        return self.conversations.remove(get_conversation_query(user, conversation_id))
+        return self.engine.delete("conversations", (str(user.id), conversation_id))
+
+    def get_archived_conversations(self, user : UserUnion) -> List[Conversation]:
+        """Stubs of the user's archived conversations, carrying only their id and summary."""
+        if self.archive is None:
+            return []
+        return self.archive.stubs(str(user.id))
+
+    def archive_idle_conversations(self, user : UserUnion, force : bool = False) -> int:
+        if self.archive is None:
+            return 0
+        current = self.engine.get("current_conversation", (str(user.id),))
+        return self.archive.sweep(str(user.id), current["conversation_id"] if current else None, force=force)
 
     def set_current_conversation(self, user: UserUnion, conversation : Conversation):
-        self.current_conversation.upsert({"user_id":str(user.id), "conversation_id": conversation.id}, get_user_query(user))
+        if self.archive is not None:
+            self.archive.rehydrate(str(user.id), conversation.id)
+            self.touch(user, conversation.id)
+        self.engine.put("current_conversation", {"user_id":str(user.id), "conversation_id": conversation.id})
 
     def get_current_conversation(self, user : UserUnion) -> Optional[Conversation]:
-        if not self.current_conversation.contains(get_user_query(user)):
+        record = self.engine.get("current_conversation", (str(user.id),))
+        if record is None:
             return None
-        conversation_id = self.current_conversation.search(get_user_query(user))[0].get("conversation_id", None)
+        conversation_id = record.get("conversation_id", None)
         if conversation_id is None:
             return None
         return self.get_conversation(user, conversation_id)
-    
+
     def get_knowledge(self, user : UserUnion) -> str:
-        if not self.knowledge.contains(get_user_query(user)):
+        record = self.engine.get("knowledge", (str(user.id),))
+        if record is None:
             return ""
-        else:
-            return self.knowledge.search(get_user_query(user))[0].get("knowledge", {})
-        
+        return record.get("knowledge", "")
+
     def set_knowledge(self, user : UserUnion, knowledge : str):
-        self.knowledge.upsert({"user_id":str(user.id), "knowledge": knowledge}, get_user_query(user))
\ No newline at end of file
+        self.engine.put("knowledge", {"user_id":str(user.id), "knowledge": knowledge})
+
+    def get_knowledge_tree(self, user : UserUnion) -> dict[str, Any]:
+        record = self.engine.get("knowledge_tree", (str(user.id),))
+        if record is None:
+            return {}
+        return record.get("tree", {})
+
+    def set_knowledge_tree(self, user : UserUnion, tree : dict[str, Any]):
+        self.engine.put("knowledge_tree", {"user_id":str(user.id), "tree": tree})
+
+    def get_conversation_index(self, user : UserUnion) -> dict[str, Any]:
+        record = self.engine.get("conversation_index", (str(user.id),))
+        if record is None:
+            return {}
+        return record.get("index", {})
+
+    def set_conversation_index(self, user : UserUnion, index : dict[str, Any]):
+        self.engine.put("conversation_index", {"user_id":str(user.id), "index": index})
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.flush()
+        self.engine.close()
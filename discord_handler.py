@@ -1,28 +1,52 @@
-from typing import Union
+from typing import List, Union
 import discord
-from db import Database
+from async_database import AsyncDatabase
 from dto import Conversation, Message
 from message_handler import MessageHandler
 
-from sendable import Sendable
+from sendable import EditableMessage, Sendable
 from action import ConversationCompletionAction
 
 DiscordSendableType = Union[discord.Webhook, discord.abc.Messageable]
 
+class DiscordEditableMessage(EditableMessage):
+    def __init__(self, message: Union[discord.Message, discord.WebhookMessage]):
+        self.message = message
+    async def edit(self, message: str):
+        await self.message.edit(content=message)
+
 class DiscordSendable(Sendable):
     def __init__(self, sendable: DiscordSendableType):
         self.sendable = sendable
     async def send(self, message: str):
         await self.sendable.send(message)
+    async def send_editable(self, message: str) -> EditableMessage:
+        if isinstance(self.sendable, discord.Webhook):
+            sent = await self.sendable.send(message, wait=True)
+        else:
+            sent = await self.sendable.send(message)
+        return DiscordEditableMessage(sent)
 
 class DiscordHandler(MessageHandler):
-    async def handle_discord_message(self, message: discord.Message, database: Database, sendable : DiscordSendableType):
+    async def handle_discord_message(self, message: discord.Message, database: AsyncDatabase, sendable : DiscordSendableType):
         if isinstance(sendable, discord.Interaction):
             await self.handle_discord_interaction(Message.from_message(message), database, sendable)
         else:
             await self.handle_message(Message.from_message(message), database, DiscordSendable(sendable))
 
-    async def handle_discord_interaction(self, message: Message, database: Database, interaction: discord.Interaction):
+    async def handle_discord_messages(self, messages: List[discord.Message], database: AsyncDatabase):
+        # Consecutive messages in the same channel become a single turn.
+        runs : List[List[discord.Message]] = []
+        for message in messages:
+            if runs and runs[-1][-1].channel.id == message.channel.id:
+                runs[-1].append(message)
+            else:
+                runs.append([message])
+        for run in runs:
+            merged = Message.merge([Message.from_message(m) for m in run])
+            await self.handle_message(merged, database, DiscordSendable(run[-1].channel))
+
+    async def handle_discord_interaction(self, message: Message, database: AsyncDatabase, interaction: discord.Interaction):
         try:
             await interaction.response.defer()
             await interaction.delete_original_response()
@@ -1,10 +1,12 @@
 from __future__ import annotations
 from abc import abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+import copy
 from datetime import datetime
-from typing import AsyncGenerator, List, Optional, Union
+from typing import AsyncGenerator, Callable, List, Optional, Union
 from uuid import uuid4
 import discord
+import context_window
 
 @dataclass
 class Message:
@@ -15,7 +17,7 @@ class Message:
     followup:List[str]
     datetime:datetime
     discord_message_id:int
-    id:str = str(uuid4().hex)
+    id:str = field(default_factory=lambda: uuid4().hex)
     classifications:Optional[List[MessageClassification]] = None
     @staticmethod
     def from_message(message : discord.Message) -> Message:
@@ -40,6 +42,16 @@ class Message:
                        message.id)
         else:
             raise NotImplementedError("Not implemented")
+    @staticmethod
+    def merge(messages : List[Message]) -> Message:
+        last = messages[-1]
+        return Message(last.user,
+                       "\n".join(m.text for m in messages),
+                       last.channel,
+                       last.guild,
+                       [],
+                       last.datetime,
+                       last.discord_message_id)
         
 
 @dataclass
@@ -89,23 +101,65 @@ class User:
     def get_discord_user(self, discord_client:discord.Client) -> Optional[discord.User]:
         return discord_client.get_user(int(self.id))
     
+NEW_CONVERSATION_SUMMARY = "The start of a brand new conversation"
+DEFAULT_SYSTEM = "You are a helpful AI assistant."
+
+def upgrade_system(system : dict[str, str]) -> dict[str, str]:
+    # set_system used to replace the whole dict with {"name": ..., "message": ...}, dropping the base prompt.
+    if "name" not in system or "message" not in system:
+        return system
+    upgraded = {"system": DEFAULT_SYSTEM}
+    upgraded[system["name"]] = system["message"]
+    upgraded.update({k: v for k, v in system.items() if k not in ("name", "message")})
+    return upgraded
+
 @dataclass
 class Conversation:
     system:dict[str,str]
     messages:List[dict[str, str]]
     summary:str
-    id:str = str(uuid4().hex)
+    id:str = field(default_factory=lambda: uuid4().hex)
+    # How many of the messages, counted from the first, the summary already covers.
+    summarized:int = 0
+    # Storage may load only the latest turns; offset counts the earlier ones and loader fetches them. The loader
+    # does storage I/O, so it is only called through AsyncDatabase.load_history or from storage itself.
+    offset:int = field(default=0, metadata={"transient": True})
+    loader:Optional[Callable[[int], List[dict[str, str]]]] = field(default=None, repr=False, compare=False, metadata={"transient": True})
+    def __post_init__(self) -> None:
+        self.system = upgrade_system(self.system)
     @staticmethod
-    def new_conversation(system:str = "You are a helpful AI assistant.") -> Conversation:
-        return Conversation({"system":system},[], "The start of a brand new conversation")
+    def new_conversation(system:str = DEFAULT_SYSTEM) -> Conversation:
+        return Conversation({"system":system},[], NEW_CONVERSATION_SUMMARY)
     def set_system(self, system : str, message : str = "") -> None:
-        self.system = {"name":system,"message":message}
+        self.system[system] = message
     def delete_system(self, system : str) -> None:
         del self.system[system]
-    def get_conversation(self) -> List[dict[str, str]]:
-        messages = [{"role":"system","content":value} for value in self.system.values()]
-        messages.extend(self.messages)
-        return messages
+    def unsummarized(self) -> List[dict[str, str]]:
+        """The loaded turns the summary doesn't cover; load the history first when summarized < offset."""
+        return self.messages[max(self.summarized - self.offset, 0):]
+    def needs_history(self, max_tokens : Optional[int] = None) -> bool:
+        """Whether get_conversation(max_tokens) would use turns that aren't loaded."""
+        if self.offset == 0 or self.loader is None:
+            return False
+        # Turns the summary doesn't cover yet can't be left out, so they are needed whatever the budget.
+        if max_tokens is None or self.summarized < self.offset:
+            return True
+        system = [{"role":"system","content":value} for value in self.system.values() if value]
+        return context_window.token_counter.count_messages(system + self.messages) <= max_tokens
+    def prepend_history(self, older : List[dict[str, str]]) -> None:
+        self.messages = older + self.messages
+        self.offset = 0
+    def load_history(self) -> None:
+        if self.offset > 0 and self.loader is not None:
+            self.prepend_history(self.loader(self.offset))
+    def get_conversation(self, max_tokens : Optional[int] = None) -> List[dict[str, str]]:
+        messages = [{"role":"system","content":value} for value in self.system.values() if value]
+        if max_tokens is None:
+            messages.extend(self.messages)
+            return messages
+        # The new-conversation placeholder isn't a summary of anything; only a fold is.
+        summary = self.summary if self.summarized > 0 else None
+        return context_window.build_context(messages, self.messages, summary, max_tokens, summarized=max(self.summarized - self.offset, 0))
     def add_user(self, user : str) -> None:
         self.messages.append({"role":"user","content":user})
     def add_system(self, system : str) -> None:
@@ -114,6 +168,11 @@ class Conversation:
         self.messages.append({"role":"assistant","content":assistant})
     def delete_last_message(self) -> None:
         self.messages.pop()
+    def copy(self) -> Conversation:
+        conversation = copy.copy(self)
+        conversation.system = dict(self.system)
+        conversation.messages = list(self.messages)
+        return conversation
     def __str__(self) -> str:
         convo = ""
         for message in self.messages:
@@ -7,9 +7,9 @@ from bs4 import BeautifulSoup
 import pynytimes
 from wolframalpha import Client as WolframAlphaClient
 import wikipedia
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import requests
+import html_text
+import http_client
+from similarity import cosine_matrix, jaccard_matrix, like_matrix
 
 class DataSource:
     def __init__(self, name : str, url : str, roles : List[str]):
@@ -67,25 +67,21 @@ class ExternalDataSource(DataSource):
                     continue
                 params.extend([param.name])
             url += "&".join(params)
-            if endpoint.method == "GET":
-                response = requests.get(url)
-            elif endpoint.method == "POST":
-                response = requests.post(url, json=context, headers={"Content-Type": "application/json"})
-            else:
-                raise ValueError("Invalid method: " + endpoint.method)
-            if response.status_code == 200:
-                content = response.content.decode("utf-8")
-                if endpoint.response_format == "html":
-                    soup = BeautifulSoup(content, "html.parser")
-                    for element in soup.find_all():
-                        if element.parent.name in ["nav", "header", "footer", "aside", "html", "head", "meta", "link", "script", "style"]:
-                            continue
-                        yield element.strip()
+            # HTML pages are reduced to their text while they download.
+            text_budget = html_text.text_budget if endpoint.response_format == "html" else None
+            try:
+                if endpoint.method == "GET":
+                    response = await http_client.fetch(url, source=self.name, text_budget=text_budget)
+                elif endpoint.method == "POST":
+                    response = await http_client.fetch(url, "POST", json=context, text_budget=text_budget)
                 else:
-                    yield content
+                    raise ValueError("Invalid method: " + endpoint.method)
+            except http_client.FETCH_ERRORS:
+                continue
+            if response.status == 200 and response.content:
+                yield response.text()
             else:
                 continue
-        raise StopIteration
   
 class WikipediaDataSource(SpecializedDataSource):
     def __init__(self):
@@ -107,39 +103,39 @@ class WikipediaDataSource(SpecializedDataSource):
             return summary 
     async def query(self, query: str, context: Optional[dict[str,str]] = None) -> AsyncGenerator[str, None]:
         #TODO: Get this to yield all topic summaries.
-        yield self.get_wiki_suggestion(query)
+        yield await http_client.cached_call(self.name, query, self.get_wiki_suggestion, query)
         
 class WolframAlphaDataSource(SpecializedDataSource):
     def __init__(self):
         super().__init__("Wolfram|Alpha", "https://www.wolframalpha.com", ["compute", "research"])
         self.client = WolframAlphaClient(os.environ.get("WolframAlpha-App-ID"))
     async def query(self, query: str, context: Optional[dict[str,str]] = None) -> AsyncGenerator[str, None]:
-        res = self.client.query(query)
-        try:
-            if res["didyoumeans"] is not None:
-                print(res["didyoumeans"])
-                query = " ".join(x["#text"] for x in res["didyoumeans"]["didyoumean"])
-                res = self.client.query(query)
-        except:
-            pass
-        # Extract the plaintext result from the response
-        try:
-            res = next(res.results)
-            if res.text is not None:
-                yield res.text
-            else:
-                yield res.subpod.img.src
-        except:
-            raise StopIteration
+        # Cached as the final answer, so a repeat skips the didyoumeans follow-up call too.
+        answer = await http_client.cached_call(self.name, query, get_wolfram_answer, self.client, query)
+        if answer is not None:
+            yield answer
         
-def get_text_from_html(html) -> str:
-    navigation_elements = ["nav", "header", "footer", "aside", "html", "head", "meta", "link", "script", "style"]
-    non_navigation_text = []
-    soup = BeautifulSoup(html, "html.parser")
-    for tag in soup.find_all(text=True):
-        if tag.parent.name not in navigation_elements:
-            non_navigation_text.append(tag.strip())
-    return "\n".join(non_navigation_text)
+def get_wolfram_answer(client : WolframAlphaClient, query : str) -> Optional[str]:
+    res = client.query(query)
+    try:
+        if res["didyoumeans"] is not None:
+            print(res["didyoumeans"])
+            query = " ".join(x["#text"] for x in res["didyoumeans"]["didyoumean"])
+            res = client.query(query)
+    except:
+        pass
+    # Extract the plaintext result from the response
+    try:
+        res = next(res.results)
+        if res.text is not None:
+            return res.text
+        else:
+            return res.subpod.img.src
+    except:
+        return None
+
+def get_text_from_html(html, budget : int = html_text.text_budget) -> str:
+    return html_text.extract_text(html, budget)
 
 class NewYorkTimesDataSource(DataSource):
     def __init__(self):
@@ -147,69 +143,45 @@ class NewYorkTimesDataSource(DataSource):
         self.nytimes = pynytimes.NYTAPI(os.environ.get("NYTimes-API_Key", ""), parse_dates=True)
     async def query(self, query: str, context : Optional[dict[str,str]] = None) -> AsyncGenerator[str, None]:
         # Send the query to the external source and get the response
-        res = self.nytimes.article_search(query=query)    
-        for x in res:
-            yield x["abstract"]
-        raise StopIteration    
+        # Only the abstracts are kept, so the cached result stays plain JSON.
+        abstracts = await http_client.cached_call(self.name, query, lambda: [x["abstract"] for x in self.nytimes.article_search(query=query)])
+        for abstract in abstracts:
+            yield abstract
 class GoogleNewsDataSource(DataSource):
     def __init__(self):
         super().__init__("Google News", "https://news.google.com", ["news"])
     async def query(self, query: str, context: Optional[dict[str,str]] = None) -> AsyncGenerator[str, None]:
         # Send the query to the external source and get the response
-        res = requests.get("https://news.google.com/search?q=" + query)
-        if res.status_code!= 200:
-            raise StopIteration("Could not get a response from Google News: " + str(res.status_code))
+        res = await http_client.fetch("https://news.google.com/search?q=" + query, source=self.name)
+        if res.status != 200:
+            print("Could not get a response from Google News: " + str(res.status))
+            return
         soup = BeautifulSoup(res.content, "html.parser")
         for x in soup.find_all("div", class_="g"):
             yield x.text
-        raise StopIteration
     
 class GoogleSearchDataSource(DataSource):
     def __init__(self):
         super().__init__("Google Search", "https://www.google.com", ["search"])
     async def query(self, query: str, context: Optional[dict[str,str]] = None) -> AsyncGenerator[str, None]:
         # Send the query to the external source and get the response
-        res = requests.get("https://www.google.com/search?q=" + query)
-        if res.status_code != 200:
-            raise StopIteration("Could not get a response from Google: " + str(res.status_code))
+        res = await http_client.fetch("https://www.google.com/search?q=" + query, source=self.name)
+        if res.status != 200:
+            print("Could not get a response from Google: " + str(res.status))
+            return
         soup = BeautifulSoup(res.content, "html.parser")
         for x in soup.find_all("h3"):
             yield x.text
-        raise StopIteration
 
 def get_jaccard_similarity(str1 : str, str2 : str, threshold_jac :float=0.4) -> bool:
-    set1 = set(str1.split())
-    set2 = set(str2.split())
-    intersection = len(set1.intersection(set2))
-    union = len(set1.union(set2))
-    return intersection / union >= threshold_jac
+    return jaccard_matrix([str1], [str2])[0, 0] >= threshold_jac
 
 def get_cosine_similarity(string1: str, string2: str, threshold_cos: float) -> bool:
-    vectorizer = CountVectorizer()
-    vectors = vectorizer.fit_transform([string1, string2])
-    cosine_sim = cosine_similarity(vectors)[0][1]
-    return cosine_sim >= threshold_cos
+    return cosine_matrix([string1], [string2])[0, 0] >= threshold_cos
 
 def like(string1:str, string2:str, threshold_jac : float = 0.4, threshold_cos : float = 0.6):
-    # Remove unnecessary characters and convert to lowercase
-    string1 = ''.join(c for c in string1 if c.isalnum() or c.isspace()).lower().strip()
-    string2 = ''.join(c for c in string2 if c.isalnum() or c.isspace()).lower().strip()
-    # Remove common prefixes
-    if string1.startswith("the"):
-        string1 = string1[4:]
-    if string2.startswith("the"):
-        string2 = string2[4:]
-    # Return False if either string is empty
-    if not string1 or not string2:
-        return False
-    # Return True if strings are identical
-    if string1 == string2:
-        return True
-    # Check for substring match
-    if string1[:6] in string2 or string2[:6] in string1:
-        return True
-    # Calculate Jaccard similarity
-    return get_jaccard_similarity(string1, string2, threshold_jac) or get_cosine_similarity(string1, string2, threshold_cos)
+    # For more than one pair, call similarity.like_matrix once with every string instead.
+    return bool(like_matrix([string1], [string2], threshold_jac, threshold_cos)[0, 0])
 
 def get_specialized_data_sources(datasource_type) -> List[SpecializedDataSource]:
     return [type(ds)() for ds in SpecializedDataSource.__subclasses__() if not inspect.signature(ds).parameters and type(ds)().type == datasource_type]
@@ -0,0 +1,147 @@
+from __future__ import annotations
+import asyncio
+import os
+import time
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple
+from external_datasource import DataSource, GoogleNewsDataSource, GoogleSearchDataSource, NewYorkTimesDataSource, WikipediaDataSource, WolframAlphaDataSource
+from similarity import like_matrix
+
+fanout_deadline = float(os.getenv("Fanout-Deadline", "8"))
+# Stop waiting on the remaining sources once this much relevant text has come back.
+enough_chars = int(os.getenv("Fanout-Enough-Chars", "4000"))
+# A source that times out this many queries in a row sits out for drop_seconds, then gets one query to prove itself.
+drop_after = int(os.getenv("Fanout-Drop-After", "3"))
+drop_seconds = float(os.getenv("Fanout-Drop-Seconds", "600"))
+
+Relevance = Callable[[str], bool]
+
+source_stats : Dict[str, Dict[str, Any]] = {}
+
+def stats_for(name : str) -> Dict[str, Any]:
+    return source_stats.setdefault(name, {"queries": 0, "completed": 0, "results": 0, "timeouts": 0, "errors": 0, "cancelled": 0,
+                                          "skipped": 0, "seconds": 0.0, "first_result_seconds": 0.0, "first_results": 0,
+                                          "consecutive_timeouts": 0, "dropped_until": 0.0})
+
+def available(name : str, now : float) -> bool:
+    stats = stats_for(name)
+    if stats["consecutive_timeouts"] < drop_after:
+        return True
+    if now >= stats["dropped_until"]:
+        # Probe once; another timeout drops it again straight away.
+        stats["consecutive_timeouts"] = drop_after - 1
+        return True
+    stats["skipped"] += 1
+    return False
+
+def record_timeout(name : str, now : float) -> None:
+    stats = stats_for(name)
+    stats["timeouts"] += 1
+    stats["consecutive_timeouts"] += 1
+    if stats["consecutive_timeouts"] >= drop_after:
+        stats["dropped_until"] = now + drop_seconds
+
+def fanout_stats() -> Dict[str, Dict[str, Any]]:
+    now = time.time()
+    return {name: {"queries": s["queries"], "results": s["results"], "timeouts": s["timeouts"], "errors": s["errors"],
+                   "cancelled": s["cancelled"], "skipped": s["skipped"],
+                   "mean_seconds": s["seconds"] / s["completed"] if s["completed"] else 0.0,
+                   "mean_first_result_seconds": s["first_result_seconds"] / s["first_results"] if s["first_results"] else 0.0,
+                   "dropped": s["consecutive_timeouts"] >= drop_after and now < s["dropped_until"]}
+            for name, s in source_stats.items()}
+
+def has_text(text : str) -> bool:
+    return isinstance(text, str) and bool(text.strip())
+
+class FanOutDataSource(DataSource):
+    """Queries several data sources at once under one deadline and streams back whatever they return first.
+
+    Results are yielded as they arrive, dropping any that are like one already yielded, until every
+    source is done, the deadline passes, or enough_chars of relevant text has been collected.
+    """
+    def __init__(self, sources : List[DataSource], deadline : float = fanout_deadline, enough_chars : int = enough_chars,
+                 relevant : Relevance = has_text, dedupe : bool = True):
+        super().__init__("Fan-out", "", sorted({role for source in sources for role in source.role}))
+        self.sources = sources
+        self.deadline = deadline
+        self.enough_chars = enough_chars
+        self.relevant = relevant
+        self.dedupe = dedupe
+
+    async def drain(self, index : int, source : DataSource, query : str, context : Optional[dict[str, str]], queue : asyncio.Queue) -> None:
+        stats = stats_for(source.name)
+        stats["queries"] += 1
+        started = time.monotonic()
+        first = True
+        try:
+            async for text in source.query(query, context):
+                if first:
+                    stats["first_result_seconds"] += time.monotonic() - started
+                    stats["first_results"] += 1
+                    first = False
+                stats["results"] += 1
+                queue.put_nowait((index, text))
+            stats["completed"] += 1
+            stats["seconds"] += time.monotonic() - started
+            stats["consecutive_timeouts"] = 0
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            stats["errors"] += 1
+            print(f"Data source {source.name} failed: {e!r}")
+        finally:
+            queue.put_nowait((index, None))
+
+    async def results(self, query : str, context : Optional[dict[str, str]] = None) -> AsyncGenerator[Tuple[str, str], None]:
+        """(source name, text) pairs in the order they arrive."""
+        loop = asyncio.get_running_loop()
+        stop_at = loop.time() + self.deadline
+        queue : asyncio.Queue[Tuple[int, Optional[str]]] = asyncio.Queue()
+        now = time.time()
+        sources = [source for source in self.sources if available(source.name, now)]
+        tasks = {i: loop.create_task(self.drain(i, source, query, context, queue)) for i, source in enumerate(sources)}
+        running = set(tasks)
+        kept : List[str] = []
+        collected = 0
+        timed_out = False
+        try:
+            while running and collected < self.enough_chars:
+                remaining = stop_at - loop.time()
+                try:
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    index, text = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    timed_out = True
+                    break
+                if text is None:
+                    running.discard(index)
+                    continue
+                if not self.relevant(text):
+                    continue
+                # Paragraphs on one subject often share a six-character run, so only word overlap counts here.
+                if self.dedupe and kept and like_matrix([text], kept, prefix=False).any():
+                    continue
+                kept.append(text)
+                collected += len(text)
+                yield sources[index].name, text
+        finally:
+            now = time.time()
+            for index in running:
+                tasks[index].cancel()
+                if timed_out:
+                    record_timeout(sources[index].name, now)
+                else:
+                    stats_for(sources[index].name)["cancelled"] += 1
+
+    async def query(self, query : str, context : Optional[dict[str, str]] = None) -> AsyncGenerator[str, None]:
+        async for _, text in self.results(query, context):
+            yield text
+
+def builtin_sources() -> List[DataSource]:
+    sources : List[DataSource] = []
+    for source_type in (WikipediaDataSource, WolframAlphaDataSource, NewYorkTimesDataSource, GoogleNewsDataSource, GoogleSearchDataSource):
+        try:
+            sources.append(source_type())
+        except Exception as e:
+            print(f"Skipping data source {source_type.__name__}: {e!r}")
+    return sources
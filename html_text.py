@@ -0,0 +1,152 @@
+from __future__ import annotations
+import codecs
+import os
+import re
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+
+# Characters of text to keep from a page; 0 keeps everything.
+text_budget = int(os.getenv("HTML-Text-Budget", "8000"))
+# Blocks shorter than this, other than headings, are usually menus, bylines and buttons.
+min_block_words = int(os.getenv("HTML-Min-Block-Words", "3"))
+max_link_density = float(os.getenv("HTML-Max-Link-Density", "0.5"))
+
+SKIP_TAGS = frozenset(["nav", "header", "footer", "aside", "head", "script", "style", "noscript", "template", "svg", "iframe", "form", "button", "select"])
+VOID_TAGS = frozenset(["area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"])
+BLOCK_TAGS = frozenset(["address", "article", "blockquote", "body", "dd", "div", "dl", "dt", "figcaption", "h1", "h2", "h3", "h4", "h5", "h6",
+                        "li", "main", "ol", "p", "pre", "section", "table", "tr", "ul"])
+# Cells are kept together with the rest of their row.
+CELL_TAGS = frozenset(["td", "th"])
+HEADING_TAGS = frozenset(["h1", "h2", "h3", "h4", "h5", "h6"])
+MAIN_TAGS = frozenset(["main", "article"])
+# Themes put layout classes such as "right-sidebar" on these, so they are never judged by class or id.
+CONTAINER_TAGS = frozenset(["html", "body", "main", "article"])
+# Tags closed implicitly by another of the same kind, as in <li>one<li>two.
+SELF_CLOSING = frozenset(["p", "li", "dt", "dd", "tr", "td", "th"])
+BOILERPLATE_HINT = re.compile(r"nav|navbar|navigation|menu|footer|sidebar|breadcrumbs?|cookies?|banner|comments?|share|sharing|social|"
+                              r"adverts?|advertisement|promo|related|subscribe|newsletter")
+# Class tokens are matched word by word, so "nav-below-header" hints but "commentary" and "canvas" do not.
+HINT_SEPARATOR = re.compile(r"[\s_-]+")
+
+# tag, started a skipped subtree, main, link, heading
+OpenTag = Tuple[str, bool, bool, bool, bool]
+
+def looks_like_boilerplate(tag : str, attrs : List[Tuple[str, Optional[str]]]) -> bool:
+    if tag in CONTAINER_TAGS:
+        return False
+    return any(name in ("class", "id") and value and any(BOILERPLATE_HINT.fullmatch(word) for word in HINT_SEPARATOR.split(value.lower()))
+               for name, value in attrs)
+
+class TextExtractor(HTMLParser):
+    """Readable text from HTML fed in pieces, without building a document tree.
+
+    Navigation, script and style subtrees, and elements whose class or id looks like boilerplate, are
+    skipped as a whole. The remaining text is split into blocks, and blocks that are mostly links or
+    only a couple of words are dropped. If the page marks its content with main or article, only
+    that is kept. done turns True once budget characters have been kept, so the caller can stop feeding.
+    """
+    def __init__(self, budget : int = text_budget, encoding : str = "utf-8"):
+        super().__init__(convert_charrefs=True)
+        self.budget = budget
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        self.stack : List[OpenTag] = []
+        self.skipping = 0
+        self.main_depth = 0
+        self.link_depth = 0
+        self.heading_depth = 0
+        self.parts : List[str] = []
+        self.link_chars = 0
+        self.blocks : List[Tuple[str, bool]] = []
+        self.kept_chars = 0
+        self.main_chars = 0
+        self.seen_main = False
+        self.done = False
+
+    def feed_bytes(self, data : bytes) -> None:
+        if not self.done:
+            self.feed(self.decoder.decode(data))
+
+    def close(self) -> None:
+        if not self.done:
+            self.feed(self.decoder.decode(b"", final=True))
+            super().close()
+        self.flush()
+
+    def handle_starttag(self, tag : str, attrs : List[Tuple[str, Optional[str]]]) -> None:
+        if self.done:
+            return
+        if tag in VOID_TAGS:
+            if tag in ("br", "hr") and not self.skipping:
+                self.flush()
+            return
+        if tag in SELF_CLOSING and self.stack and self.stack[-1][0] == tag:
+            self.pop(len(self.stack) - 1)
+        skip = not self.skipping and (tag in SKIP_TAGS or looks_like_boilerplate(tag, attrs))
+        visible = not self.skipping and not skip
+        if visible and tag in BLOCK_TAGS:
+            self.flush()
+        elif visible and tag in CELL_TAGS and "".join(self.parts).strip():
+            self.parts.append(" | ")
+        entry = (tag, skip, visible and tag in MAIN_TAGS, visible and tag == "a", visible and tag in HEADING_TAGS)
+        self.stack.append(entry)
+        self.skipping += entry[1]
+        self.main_depth += entry[2]
+        self.link_depth += entry[3]
+        self.heading_depth += entry[4]
+        self.seen_main = self.seen_main or entry[2]
+
+    def handle_endtag(self, tag : str) -> None:
+        if self.done:
+            return
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i][0] == tag:
+                if not self.skipping and tag in BLOCK_TAGS:
+                    self.flush()
+                self.pop(i)
+                return
+
+    def pop(self, index : int) -> None:
+        while len(self.stack) > index:
+            _, skip, main, link, heading = self.stack.pop()
+            self.skipping -= skip
+            self.main_depth -= main
+            self.link_depth -= link
+            self.heading_depth -= heading
+
+    def handle_data(self, data : str) -> None:
+        if self.done or self.skipping:
+            return
+        self.parts.append(data)
+        if self.link_depth:
+            self.link_chars += len(data.strip())
+
+    def flush(self) -> None:
+        text = " ".join("".join(self.parts).split())
+        link_chars = self.link_chars
+        self.parts = []
+        self.link_chars = 0
+        if not text or self.done:
+            return
+        # Headings are kept even when they are links, as headlines on a listing page are.
+        if not self.heading_depth and (link_chars / len(text) > max_link_density or len(text.split()) < min_block_words):
+            return
+        main = self.main_depth > 0
+        self.blocks.append((text, main))
+        self.kept_chars += len(text) + 1
+        self.main_chars += (len(text) + 1) * main
+        if self.budget and (self.main_chars >= self.budget or (not self.seen_main and self.kept_chars >= self.budget)):
+            self.done = True
+
+    def text(self) -> str:
+        blocks = [text for text, main in self.blocks if main] or [text for text, _ in self.blocks]
+        text = "\n".join(blocks)
+        return text[:self.budget] if self.budget else text
+
+def extract_text(html : str, budget : int = text_budget) -> str:
+    extractor = TextExtractor(budget)
+    for start in range(0, len(html), 64 << 10):
+        extractor.feed(html[start:start + (64 << 10)])
+        if extractor.done:
+            break
+    extractor.close()
+    return extractor.text()
@@ -0,0 +1,188 @@
+from __future__ import annotations
+import asyncio
+import functools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple, Type, TypeVar
+import aiohttp
+from html_text import TextExtractor
+from storage.response_cache import ResponseCache, parse_ttls
+
+T = TypeVar("T")
+
+max_connections = int(os.getenv("HTTP-Max-Connections", "100"))
+connections_per_host = int(os.getenv("HTTP-Connections-Per-Host", "8"))
+connect_timeout = float(os.getenv("HTTP-Connect-Timeout", "5"))
+request_timeout = float(os.getenv("HTTP-Request-Timeout", "20"))
+max_response_bytes = int(os.getenv("HTTP-Max-Response-Bytes", str(2 << 20)))
+# Threads for data sources whose client libraries only block.
+blocking_workers = int(os.getenv("HTTP-Blocking-Workers", "8"))
+
+# Set Response-Cache-Bytes to 0 to turn the cache off.
+cache_path = os.getenv("Response-Cache-Path", "responses.db")
+cache_bytes = int(os.getenv("Response-Cache-Bytes", str(256 << 20)))
+cache_ttl = float(os.getenv("Response-Cache-TTL", "3600"))
+# Failures and empty results are kept only this long, so a flaky source is retried soon.
+cache_negative_ttl = float(os.getenv("Response-Cache-Negative-TTL", "300"))
+cache_ttls = parse_ttls(os.getenv("Response-Cache-TTLs", "Wikipedia=604800,Wolfram|Alpha=86400,New York Times=1800,Google News=900,Google Search=3600"))
+
+# Status stored for a request that failed without a response.
+FAILED = 0
+
+http_stats = {"requests": 0, "errors": 0, "too_large": 0, "bytes": 0, "blocking_calls": 0, "stopped_early": 0}
+
+class ResponseTooLarge(aiohttp.ClientError):
+    pass
+
+class CachedFailure(aiohttp.ClientError):
+    pass
+
+FETCH_ERRORS : Tuple[Type[BaseException], ...] = (aiohttp.ClientError, asyncio.TimeoutError)
+
+@dataclass
+class Response:
+    url : str
+    status : int
+    headers : Dict[str, str] = field(default_factory=dict)
+    content : bytes = b""
+
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+_session : Optional[aiohttp.ClientSession] = None
+
+def get_session() -> aiohttp.ClientSession:
+    # Created lazily so it binds to the running loop; the connector keeps a keep-alive pool per host.
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=max_connections, limit_per_host=connections_per_host, keepalive_timeout=60, ttl_dns_cache=300)
+        _session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=request_timeout, sock_connect=connect_timeout))
+    return _session
+
+async def close_session() -> None:
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+async def request(url : str, method : str, max_bytes : Optional[int], text_budget : Optional[int] = None, **kwargs) -> Response:
+    limit = max_response_bytes if max_bytes is None else max_bytes
+    http_stats["requests"] += 1
+    try:
+        async with get_session().request(method, url, **kwargs) as response:
+            if response.content_length is not None and response.content_length > limit:
+                raise ResponseTooLarge(f"{url}: {response.content_length} bytes")
+            extractor = TextExtractor(text_budget, response.charset or "utf-8") if text_budget is not None else None
+            body = bytearray()
+            read = 0
+            async for chunk in response.content.iter_chunked(64 << 10):
+                read += len(chunk)
+                if read > limit:
+                    raise ResponseTooLarge(f"{url}: more than {limit} bytes")
+                if extractor is None:
+                    body.extend(chunk)
+                    continue
+                extractor.feed_bytes(chunk)
+                if extractor.done:
+                    http_stats["stopped_early"] += 1
+                    break
+            if extractor is not None:
+                extractor.close()
+                body = bytearray(extractor.text().encode("utf-8"))
+            http_stats["bytes"] += read
+            return Response(str(response.url), response.status, dict(response.headers), bytes(body))
+    except ResponseTooLarge:
+        http_stats["too_large"] += 1
+        raise
+    except FETCH_ERRORS:
+        http_stats["errors"] += 1
+        raise
+
+blocking = ThreadPoolExecutor(max_workers=blocking_workers, thread_name_prefix="datasource-blocking")
+
+async def run_blocking(fn : Callable[..., T], *args, **kwargs) -> T:
+    http_stats["blocking_calls"] += 1
+    return await asyncio.get_running_loop().run_in_executor(blocking, functools.partial(fn, *args, **kwargs))
+
+# The cache has its own thread, so lookups never wait behind slow calls on the blocking executor.
+cache_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-cache")
+
+_cache : Optional[ResponseCache] = None
+
+def open_cache() -> Optional[ResponseCache]:
+    # Runs on the cache thread, which is also where the SQLite file is first opened.
+    global _cache
+    if _cache is None and cache_bytes > 0:
+        _cache = ResponseCache(cache_path, cache_bytes, cache_ttl, cache_negative_ttl, cache_ttls)
+    return _cache
+
+async def get_cache() -> Optional[ResponseCache]:
+    if _cache is not None or cache_bytes <= 0:
+        return _cache
+    return await cache_io(open_cache)
+
+async def cache_io(fn : Callable[..., T], *args) -> T:
+    return await asyncio.get_running_loop().run_in_executor(cache_executor, fn, *args)
+
+def cache_stats() -> Dict[str, Any]:
+    return _cache.stats() if _cache is not None else {}
+
+async def fetch(url : str, method : str = "GET", max_bytes : Optional[int] = None, source : Optional[str] = None, text_budget : Optional[int] = None,
+                **kwargs) -> Response:
+    """Request url on the shared session and read the body, raising ResponseTooLarge past max_bytes.
+
+    With text_budget, the body is HTML that is turned into text as it arrives, and content holds only
+    that text, stopping once text_budget characters are kept (0 keeps all of it). GET requests made
+    for a source go through the response cache.
+    """
+    cache = await get_cache() if source is not None and method == "GET" else None
+    if cache is None:
+        return await request(url, method, max_bytes, text_budget, **kwargs)
+    key = url if text_budget is None else f"text:{text_budget}:{url}"
+    entry = await cache_io(cache.lookup, source, key)
+    if entry is not None and entry.fresh(time.time()):
+        if entry.status == FAILED:
+            raise CachedFailure(f"{url}: failed recently")
+        return Response(url, entry.status, entry.headers, entry.body)
+    headers = dict(kwargs.pop("headers", None) or {})
+    if entry is not None and not entry.negative:
+        if "ETag" in entry.headers:
+            headers["If-None-Match"] = entry.headers["ETag"]
+        if "Last-Modified" in entry.headers:
+            headers["If-Modified-Since"] = entry.headers["Last-Modified"]
+    try:
+        response = await request(url, method, max_bytes, text_budget, headers=headers, **kwargs)
+    except FETCH_ERRORS:
+        await cache_io(functools.partial(cache.put, source, key, FAILED, b"", negative=True))
+        raise
+    if response.status == 304 and entry is not None and not entry.negative:
+        await cache_io(cache.refresh, source, key, entry)
+        return Response(url, entry.status, entry.headers, entry.body)
+    negative = response.status >= 400 or not response.content
+    # Only the validators are worth keeping from the headers.
+    received = {k.lower(): v for k, v in response.headers.items()}
+    kept = {name: received[name.lower()] for name in ("ETag", "Last-Modified", "Content-Type") if name.lower() in received}
+    await cache_io(functools.partial(cache.put, source, key, response.status, b"" if response.status >= 400 else response.content, kept, negative))
+    return response
+
+async def cached_call(source : str, key : str, fn : Callable[..., Any], *args, **kwargs) -> Any:
+    """run_blocking(fn, ...) with its result, which must be JSON-serializable, cached under source and key."""
+    cache = await get_cache()
+    if cache is None:
+        return await run_blocking(fn, *args, **kwargs)
+    key = "call:" + key
+    entry = await cache_io(cache.lookup, source, key)
+    if entry is not None and entry.fresh(time.time()):
+        if entry.status == FAILED:
+            raise CachedFailure(f"{source} {key}: failed recently")
+        return json.loads(entry.body)
+    try:
+        result = await run_blocking(fn, *args, **kwargs)
+    except Exception:
+        await cache_io(functools.partial(cache.put, source, key, FAILED, b"", negative=True))
+        raise
+    await cache_io(functools.partial(cache.put, source, key, 200, json.dumps(result, ensure_ascii=False).encode("utf-8"), negative=not result))
+    return result
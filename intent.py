@@ -1,7 +1,7 @@
 from abc import abstractmethod
 from typing import List, TypeVar, Union
 from action import Action, ChangeCurrentConversationAction, ConversationCompletionAction, ConversationSummaryAction, RememberAction, UpdateKnowledgeAction
-from db import Database
+from async_database import AsyncDatabase
 from dto import Message
 from sendable import Sendable
 
@@ -11,8 +11,12 @@ class Intent():
     def get_descriptions() -> List[str]:
         pass
     @staticmethod
+    def get_examples() -> List[str]:
+        # Typical messages, which seed the local classifier before it has learned from the LLM.
+        return []
+    @staticmethod
     @abstractmethod
-    async def get_actions(message:Message, database : Database, sendable : Sendable) -> List[Action]:
+    async def get_actions(message:Message, database : AsyncDatabase, sendable : Sendable) -> List[Action]:
         pass
 
 class SubIntent():
@@ -21,8 +25,11 @@ class SubIntent():
     def get_descriptions() -> List[str]:
         pass
     @staticmethod
+    def get_examples() -> List[str]:
+        return []
+    @staticmethod
     @abstractmethod
-    async def get_actions(message:Message, database : Database, sendable : Sendable) -> List[Action]:
+    async def get_actions(message:Message, database : AsyncDatabase, sendable : Sendable) -> List[Action]:
         pass
 
 IntentType = Union[TypeVar("Intent", bound=Intent), TypeVar("SubIntent", bound=SubIntent)]
@@ -32,14 +39,25 @@ class TopicChangeIntent(Intent):
     def get_descriptions() -> List[str]:
         return ["An explicit request to change the topic.", "An implict request to discuss something unrelated to what we have been discussing."]
     @staticmethod
-    async def get_actions(message: Message, database : Database, sendable : Sendable) -> List[Action]:
+    def get_examples() -> List[str]:
+        return ["Let's talk about something else.", "Can we change the subject?", "New topic please.", "Enough about that, let's switch topics.",
+                "Let's go back to what we were talking about before.", "Forget that, I want to ask about something different.",
+                "Different question, unrelated to this.", "On another note, let's discuss something new."]
+    @staticmethod
+    async def get_actions(message: Message, database : AsyncDatabase, sendable : Sendable) -> List[Action]:
         return [ChangeCurrentConversationAction(), UpdateKnowledgeAction(), ConversationCompletionAction(), ConversationSummaryAction()]
 class NoOpIntent(Intent):
     @staticmethod
     def get_descriptions() -> List[str]:
         return ["None of the above."]
     @staticmethod
-    async def get_actions(message: Message, database : Database, sendable : Sendable) -> List[Action]:
+    def get_examples() -> List[str]:
+        return ["hi", "hello", "hey there", "thanks", "thank you", "thanks a lot", "ok", "okay", "cool", "great", "nice", "good morning",
+                "good night", "bye", "sounds good", "got it", "yes", "no", "sure", "lol", "awesome, thanks!", "How are you?",
+                "What do you mean?", "Can you explain that again?", "Why is that?", "Tell me more.", "Can you give me an example?",
+                "What about the second one?", "That makes sense.", "I don't understand.", "Could you elaborate on that?"]
+    @staticmethod
+    async def get_actions(message: Message, database : AsyncDatabase, sendable : Sendable) -> List[Action]:
         return [ConversationCompletionAction(), ConversationSummaryAction()]
 
 class PleasantryIntent(NoOpIntent):
@@ -57,6 +75,11 @@ class RememberIntent(Intent):
     def get_descriptions() -> List[str]:
         return ["An explicit request to remember a detail or a set of details.","An explicit request to keep something in mind or to note something for the future."]
     @staticmethod
-    async def get_actions(message: Message, database : Database, sendable : Sendable) -> List[Action]:
+    def get_examples() -> List[str]:
+        return ["Remember that my birthday is in May.", "Please remember my name is Sam.", "Keep in mind that I'm vegetarian.",
+                "Note that I prefer metric units.", "Don't forget that my dog is called Rex.", "Remember this for later.",
+                "Make a note that the meeting moved to Friday.", "Please remember I live in Berlin."]
+    @staticmethod
+    async def get_actions(message: Message, database : AsyncDatabase, sendable : Sendable) -> List[Action]:
         return [RememberAction()]
         
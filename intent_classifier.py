@@ -1,12 +1,40 @@
 from __future__ import annotations
 import json
+import time
 from typing import List, Tuple, Type
 from sortedcollections import OrderedSet
 import dto
 from intent import IntentType
+from local_classifier import local_classifier
+
+classification_stats = {
+    "local": {"attempts": 0, "hits": 0, "seconds": 0.0},
+    "llm": {"attempts": 0, "hits": 0, "seconds": 0.0},
+}
+
+def record_classification(path : str, started : float, hit : bool) -> None:
+    stats = classification_stats[path]
+    stats["attempts"] += 1
+    stats["hits"] += int(hit)
+    stats["seconds"] += time.perf_counter() - started
 
 class IntentClassifier:
     async def classify_intent(self, message : Message, intents : List[IntentType]) ->  List[Type[IntentType]]:
+        started = time.perf_counter()
+        local = local_classifier.classify_parts(message.text, intents) # type: ignore
+        record_classification("local", started, local is not None)
+        if local is not None:
+            # Shaped like the LLM's classifications, one per sentence, for anything that reads them later.
+            message.classifications = [dto.MessageClassification(message.text, part, intent.get_descriptions()[0]) for part, intent, _ in local]
+            return list(OrderedSet(intent for _, intent, _ in local))
+        started = time.perf_counter()
+        with openai_client.priority(Priority.ROUTING):
+            results = await self.classify_with_llm(message, intents)
+        record_classification("llm", started, len(results) > 0)
+        local_classifier.record(message.text, results)
+        return results
+
+    async def classify_with_llm(self, message : Message, intents : List[IntentType]) ->  List[Type[IntentType]]:
         descriptions = {}
         for intent in intents:
             for description in intent.get_descriptions():
@@ -30,4 +58,6 @@ class IntentClassifier:
         return list(results)
 
 import chatgpt
+import openai_client
+from openai_client import Priority
 from dto import Message
@@ -1,7 +1,7 @@
 from __future__ import annotations
 import sys
 import os
-from db import Database
+from async_database import AsyncDatabase
 from intent import Intent, NoOpIntent, SubIntent
 from sendable import Sendable
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -20,7 +20,11 @@ class GitIntent(Intent):
     def get_descriptions() -> List[str]:
         return ["Something to do with git."]
     @staticmethod
-    async def get_actions(message: Message, database : Database, sendable : Sendable) -> List[Action]:
+    def get_examples() -> List[str]:
+        return ["Clone the git repo at github.com/user/project.", "Can you git clone this repository?", "Check out the repository from GitHub.",
+                "Pull the latest changes from the git repo.", "What branches does this git repository have?"]
+    @staticmethod
+    async def get_actions(message: Message, database : AsyncDatabase, sendable : Sendable) -> List[Action]:
         await sendable.send("I think you want me to do something with Git. One moment please...")
         intent_classifier = IntentClassifier()
         intent = await intent_classifier.classify_intent(message, GitSubIntent.__subclasses__())
@@ -33,7 +37,7 @@ class GitSubIntent(SubIntent):
         return ["Base class for Git Sub Intents."]
     @abstractmethod
     @staticmethod
-    async def get_actions(message:Message, database : Database, sendable : Sendable) -> List[Action]:
+    async def get_actions(message:Message, database : AsyncDatabase, sendable : Sendable) -> List[Action]:
         raise NotImplementedError("Not implemented")
     
 @dataclass
@@ -42,7 +46,10 @@ class GitCloneIntent(GitSubIntent):
     def get_descriptions() -> List[str]:
         return ["An explicit command or request to clone a git repository."]
     @staticmethod
-    async def get_actions(message: Message, database : Database, sendable : Sendable) -> List[Action]:
+    def get_examples() -> List[str]:
+        return ["Clone https://github.com/user/project.git", "git clone the repo at github.com/user/project", "Please clone this repository."]
+    @staticmethod
+    async def get_actions(message: Message, database : AsyncDatabase, sendable : Sendable) -> List[Action]:
         repo = await get_git_repo_and_options(message.text)
         if repo is None:
             return [] #TODO: return an error message
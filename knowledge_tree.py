@@ -0,0 +1,84 @@
+from __future__ import annotations
+import hashlib
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+group_size = int(os.getenv("Knowledge-Group-Size", "8"))
+debounce = float(os.getenv("Knowledge-Debounce", "10"))
+
+knowledge_stats = {"updates": 0, "unchanged": 0, "group_digests": 0, "root_digests": 0}
+
+Summarizer = Callable[[str], Awaitable[str]]
+
+def fingerprint(summary : str) -> str:
+    return hashlib.sha1(summary.encode("utf-8")).hexdigest()[:16]
+
+def numbered(texts : List[str]) -> str:
+    return "".join(f"{i}. {text}\n" for i, text in enumerate(texts))
+
+class KnowledgeTree:
+    """A user's knowledge as conversation summaries grouped under group digests under one root digest.
+
+    Only groups whose members were added, removed or re-summarized are digested again, followed by
+    the root, so an update costs one group plus the root rather than every conversation.
+    """
+    def __init__(self, data : Optional[Dict[str, Any]] = None, group_size : int = group_size):
+        data = data or {}
+        self.group_size = group_size
+        self.leaves : Dict[str, Dict[str, Any]] = data.get("leaves", {})
+        self.groups : List[Dict[str, Any]] = data.get("groups", [])
+        self.root : str = data.get("root", "")
+        self.root_dirty : bool = data.get("root_dirty", False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"leaves": self.leaves, "groups": self.groups, "root": self.root, "root_dirty": self.root_dirty}
+
+    def mark(self, group : int) -> None:
+        self.groups[group]["dirty"] = True
+        self.root_dirty = True
+
+    def place(self, conversation_id : str) -> int:
+        for i, group in enumerate(self.groups):
+            if len(group["members"]) < self.group_size:
+                group["members"].append(conversation_id)
+                return i
+        self.groups.append({"members": [conversation_id], "digest": "", "dirty": True})
+        return len(self.groups) - 1
+
+    def apply(self, summaries : Dict[str, str]) -> bool:
+        """Bring the leaves in line with the current summaries, marking what changed; False if nothing did."""
+        for conversation_id in [c for c in self.leaves if c not in summaries]:
+            group = self.leaves.pop(conversation_id)["group"]
+            self.groups[group]["members"].remove(conversation_id)
+            self.mark(group)
+        for conversation_id, summary in summaries.items():
+            leaf = self.leaves.get(conversation_id)
+            digest = fingerprint(summary)
+            if leaf is None:
+                group = self.place(conversation_id)
+                self.leaves[conversation_id] = {"hash": digest, "group": group}
+                self.mark(group)
+            elif leaf["hash"] != digest:
+                leaf["hash"] = digest
+                self.mark(leaf["group"])
+        return self.root_dirty
+
+    async def refresh(self, summaries : Dict[str, str], summarize : Summarizer) -> str:
+        for group in self.groups:
+            if not group["dirty"]:
+                continue
+            members = [summaries[c] for c in group["members"]]
+            if len(members) > 1:
+                group["digest"] = await summarize(numbered(members))
+                knowledge_stats["group_digests"] += 1
+            else:
+                group["digest"] = members[0] if members else ""
+            group["dirty"] = False
+        digests = [group["digest"] for group in self.groups if group["members"]]
+        if len(digests) > 1:
+            self.root = await summarize(numbered(digests))
+            knowledge_stats["root_digests"] += 1
+        else:
+            self.root = digests[0] if digests else ""
+        self.root_dirty = False
+        return self.root
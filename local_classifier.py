@@ -0,0 +1,129 @@
+from __future__ import annotations
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+from text_vectors import HashingVectorizer, SparseVector, add_into, cosine, normalize
+
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n+")
+
+def get_label(intent : type) -> str:
+    return intent.__module__ + "." + intent.__qualname__
+
+def get_seeds(intent : type) -> List[str]:
+    examples = getattr(intent, "get_examples", None)
+    return (intent.get_descriptions() or []) + ((examples() or []) if examples is not None else [])
+
+def split_parts(text : str) -> List[str]:
+    return [part.strip() for part in SENTENCE_BREAK.split(text) if part.strip()]
+
+class LocalIntentClassifier:
+    """Nearest-centroid intent classifier seeded with intent descriptions and examples, and trained on a log of past LLM classifications."""
+    def __init__(self, log_path : Optional[str] = "classification_log.jsonl", threshold : float = 0.2, margin : float = 0.5, rebuild_every : int = 100):
+        self.log_path = log_path
+        self.threshold = threshold
+        self.margin = margin
+        self.rebuild_every = rebuild_every
+        self.vectorizer = HashingVectorizer()
+        self.examples : List[Tuple[str, List[str]]] = []
+        self.known : Set[str] = set()
+        self.sums : Dict[str, SparseVector] = {}
+        self.centroids : Dict[str, SparseVector] = {}
+        self.seeds : Dict[str, List[str]] = {}
+        self.seed_vectors : Dict[str, List[SparseVector]] = {}
+        self.pending = 0
+        self.loaded = False
+        # Appends to the log happen on this thread, in order, so classification never waits on the disk.
+        self.log_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="intent-log")
+
+    def load(self) -> None:
+        self.loaded = True
+        if self.log_path is None or not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self.examples.append((entry["text"], entry["labels"]))
+        self.rebuild()
+
+    def ensure_trained(self, intents : List[type]) -> None:
+        if not self.loaded:
+            self.load()
+        missing = [intent for intent in intents if get_label(intent) not in self.known]
+        if not missing:
+            return
+        for intent in missing:
+            self.known.add(get_label(intent))
+            self.seeds[get_label(intent)] = get_seeds(intent)
+            for seed in self.seeds[get_label(intent)]:
+                self.examples.append((seed, [get_label(intent)]))
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        self.vectorizer.fit(text for text, _ in self.examples)
+        self.sums = {}
+        for text, labels in self.examples:
+            vector = self.vectorizer.transform(text)
+            for label in labels:
+                add_into(self.sums.setdefault(label, {}), vector)
+        self.centroids = {label: normalize(total) for label, total in self.sums.items()}
+        self.seed_vectors = {label: [self.vectorizer.transform(seed) for seed in seeds] for label, seeds in self.seeds.items()}
+        self.pending = 0
+
+    def score(self, vector : SparseVector, label : str) -> float:
+        # A short message such as "thanks" is far from a centroid of many phrasings but close to one of the seeds.
+        return max([cosine(vector, self.centroids.get(label, {}))] + [cosine(vector, seed) for seed in self.seed_vectors.get(label, [])])
+
+    def classify(self, text : str, intents : List[type]) -> Optional[Tuple[type, float]]:
+        self.ensure_trained(intents)
+        vector = self.vectorizer.transform(text)
+        scores = sorted(((self.score(vector, get_label(intent)), intent) for intent in intents), key=lambda x: x[0], reverse=True)
+        if not scores:
+            return None
+        best, intent = scores[0]
+        runner_up = scores[1][0] if len(scores) > 1 else 0.0
+        # Centroids average many phrasings, so absolute scores run low; also require a clear lead.
+        if best < self.threshold or runner_up > best * (1 - self.margin):
+            return None
+        return intent, best
+
+    def classify_parts(self, text : str, intents : List[type]) -> Optional[List[Tuple[str, type, float]]]:
+        """(part, intent, score) for each sentence of text, or None unless every sentence is classified confidently."""
+        results = []
+        for part in split_parts(text) or [text]:
+            result = self.classify(part, intents)
+            if result is None:
+                return None
+            results.append((part, result[0], result[1]))
+        return results
+
+    def record(self, text : str, intents : List[type]) -> None:
+        if not text.strip() or not intents:
+            return
+        labels = [get_label(intent) for intent in intents]
+        self.examples.append((text, labels))
+        if self.log_path is not None:
+            self.log_writer.submit(self.append_log, json.dumps({"text": text, "labels": labels}, ensure_ascii=False) + "\n")
+        # Fold the example into its centroids now; the IDF weights are refreshed in periodic rebuilds.
+        self.vectorizer.partial_fit(text)
+        vector = self.vectorizer.transform(text)
+        for label in labels:
+            total = self.sums.setdefault(label, {})
+            add_into(total, vector)
+            self.centroids[label] = normalize(total)
+        self.pending += 1
+        if self.pending >= self.rebuild_every:
+            self.rebuild()
+
+    def append_log(self, line : str) -> None:
+        with open(self.log_path, "a", encoding="utf-8") as f: # type: ignore
+            f.write(line)
+
+local_classifier = LocalIntentClassifier(
+    os.getenv("Intent-Log-Path", "classification_log.jsonl"),
+    threshold=float(os.getenv("Local-Intent-Threshold", "0.2")),
+    margin=float(os.getenv("Local-Intent-Margin", "0.5")))
@@ -1,28 +1,55 @@
+import functools
+import os
 from action import ConversationChangeException, ConversationCompletionAction
-from db import Database
+from background import BackgroundWorker
+from async_database import AsyncDatabase
 from dto import Message
 from intent import Intent
 from intent_classifier import IntentClassifier
 from sendable import Sendable
 import chatgpt
 
+speculative_completion = os.getenv("Speculative-Completion", "1") != "0"
+
 class MessageHandler:
-    def __init__(self):
+    def __init__(self, speculate : bool = speculative_completion):
+        self.speculate = speculate
         self.custom_handlers = {}
         self.intent_classifier = IntentClassifier()
+        self.background = BackgroundWorker()
 
-    async def handle_message(self, message: Message, database: Database, sendable: Sendable):
+    async def handle_message(self, message: Message, database: AsyncDatabase, sendable: Sendable):
         if message.user.id in self.custom_handlers:
             await self.custom_handlers[message.user.id](message, database, sendable)
             del self.custom_handlers[message.user.id]
             return
-        intents = await self.intent_classifier.classify_intent(message, Intent.__subclasses__())
-        actions = [action for intent in intents for action in await intent.get_actions(message, database, sendable)]
+        speculation = await ConversationCompletionAction.speculate(message, database) if self.speculate else None
+        try:
+            intents = await self.intent_classifier.classify_intent(message, Intent.__subclasses__())
+            actions = [action for intent in intents for action in await intent.get_actions(message, database, sendable)]
+        except BaseException:
+            if speculation is not None:
+                speculation.discard()
+            raise
+        if speculation is not None:
+            # Only a plain completion, with nothing ahead of it that could change the conversation, can reuse the speculation.
+            if actions and type(actions[0]) is ConversationCompletionAction:
+                actions[0].speculation = speculation # type: ignore
+            else:
+                speculation.discard()
+        deferred = []
         for action in actions:
+            if not action.critical:
+                deferred.append(action)
+                continue
             try:
                 await action(message, database, sendable)
             except ConversationChangeException:
                 message.text = await chatgpt.remove_change_of_topic(message.text)
                 await self.handle_message(message, database, sendable)
+        # Summaries and knowledge updates run once the reply is out, collapsed per user and action.
+        for action in deferred:
+            self.background.submit((message.user.id, action.name), functools.partial(action, message, database, sendable))
+        self.background.submit((message.user.id, "archive"), functools.partial(database.archive_idle_conversations, message.user))
     
 
@@ -0,0 +1,247 @@
+from __future__ import annotations
+import asyncio
+import contextlib
+import functools
+import heapq
+import itertools
+import os
+import time
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, Type, TypeVar
+import aiohttp
+import openai
+from context_window import token_counter
+
+openai.api_key = os.getenv("OpenAIAPI-Token")
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+RETRYABLE_ERRORS : Tuple[Type[BaseException], ...] = (
+    openai.error.APIError,
+    openai.error.APIConnectionError,
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+)
+
+max_connections = int(os.getenv("OpenAI-Max-Connections", "20"))
+request_timeout = float(os.getenv("OpenAI-Request-Timeout", "120"))
+requests_per_minute = float(os.getenv("OpenAI-Requests-Per-Minute", "3500"))
+tokens_per_minute = float(os.getenv("OpenAI-Tokens-Per-Minute", "90000"))
+# Completion length assumed when reserving tokens for a request that doesn't set max_tokens.
+expected_completion_tokens = int(os.getenv("OpenAI-Expected-Completion-Tokens", "400"))
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    ROUTING = 1
+    BACKGROUND = 2
+
+current_priority : ContextVar[Priority] = ContextVar("openai_priority", default=Priority.INTERACTIVE)
+
+@contextlib.contextmanager
+def priority(level : Priority) -> Iterator[None]:
+    token = current_priority.set(level)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+class TokenBucket:
+    def __init__(self, per_minute : float, capacity : Optional[float] = None):
+        self.rate = per_minute / 60
+        self.capacity = capacity if capacity is not None else per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount : float) -> float:
+        self.refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount : float) -> None:
+        # May go negative when actual usage exceeds the reservation; later requests repay the debt.
+        self.refill()
+        self.level -= amount
+
+class RateLimitScheduler:
+    """Admits OpenAI requests in priority order within request and token per-minute budgets."""
+    def __init__(self, requests_per_minute : float, tokens_per_minute : float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.queue : List[Tuple[int, int, int, float, asyncio.Future]] = []
+        self.sequence = itertools.count()
+        self.blocked_until = 0.0
+        self.wakeup : Optional[asyncio.Event] = None
+        self.dispatcher : Optional[asyncio.Task] = None
+        self.dispatched : Dict[Priority, int] = {p: 0 for p in Priority}
+        self.total_wait : Dict[Priority, float] = {p: 0.0 for p in Priority}
+        self.max_wait : Dict[Priority, float] = {p: 0.0 for p in Priority}
+        self.rate_limited = 0
+
+    async def acquire(self, tokens : int, level : Optional[Priority] = None) -> None:
+        if level is None:
+            level = current_priority.get()
+        if self.dispatcher is None or self.dispatcher.done():
+            self.wakeup = asyncio.Event()
+            self.dispatcher = asyncio.get_running_loop().create_task(self.dispatch())
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queue, (int(level), next(self.sequence), tokens, time.monotonic(), future))
+        self.wakeup.set() # type: ignore
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Admitted just as the caller was cancelled; the request is never sent.
+            if future.done() and not future.cancelled():
+                self.record_usage(tokens, 0)
+            raise
+
+    def record_usage(self, reserved : int, used : int) -> None:
+        """Settles a reservation with the tokens actually used, refunding the rest; 0 for a request that failed."""
+        self.tokens.consume(used - reserved)
+
+    def retry_after(self, seconds : float) -> None:
+        self.rate_limited += 1
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def dispatch(self) -> None:
+        while True:
+            while self.queue and self.queue[0][4].done():
+                heapq.heappop(self.queue)
+            if not self.queue:
+                self.wakeup.clear() # type: ignore
+                await self.wakeup.wait() # type: ignore
+                continue
+            level, _, tokens, enqueued, future = self.queue[0]
+            wait = max(self.blocked_until - time.monotonic(), self.requests.time_until(1), self.tokens.time_until(tokens))
+            if wait > 0:
+                # A higher priority arrival wakes us early and becomes the new head of the queue.
+                self.wakeup.clear() # type: ignore
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=wait) # type: ignore
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self.queue)
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            waited = time.monotonic() - enqueued
+            self.dispatched[Priority(level)] += 1
+            self.total_wait[Priority(level)] += waited
+            self.max_wait[Priority(level)] = max(self.max_wait[Priority(level)], waited)
+            future.set_result(None)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "queue_depth": sum(1 for entry in self.queue if not entry[4].done()),
+            "rate_limited": self.rate_limited,
+            "priorities": {
+                p.name.lower(): {
+                    "dispatched": self.dispatched[p],
+                    "mean_wait": self.total_wait[p] / self.dispatched[p] if self.dispatched[p] else 0.0,
+                    "max_wait": self.max_wait[p],
+                } for p in Priority
+            },
+        }
+
+scheduler = RateLimitScheduler(requests_per_minute, tokens_per_minute)
+
+def estimate_tokens(kwargs : dict[str, Any]) -> int:
+    return token_counter.count_messages(kwargs.get("messages", [])) + kwargs.get("max_tokens", expected_completion_tokens)
+
+def get_retry_after(error : openai.error.OpenAIError, default : float = 1.0) -> float:
+    try:
+        return float((error.headers or {}).get("retry-after", default))
+    except (TypeError, ValueError):
+        return default
+
+_session : Optional[aiohttp.ClientSession] = None
+
+def get_session() -> aiohttp.ClientSession:
+    # One keep-alive pool shared by every completion, created lazily so it binds to the running loop.
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=max_connections, keepalive_timeout=60, ttl_dns_cache=300)
+        _session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=request_timeout))
+    return _session
+
+async def close_session() -> None:
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+def async_retry(tries : int = 3, delay : float = 3, backoff : float = 2, exceptions : Tuple[Type[BaseException], ...] = RETRYABLE_ERRORS) -> Callable[[F], F]:
+    def decorator(func : F) -> F:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            remaining, wait = tries, delay
+            while True:
+                try:
+                    return await func(*args, **kwargs)
+                except exceptions:
+                    remaining -= 1
+                    if remaining <= 0:
+                        raise
+                    await asyncio.sleep(wait)
+                    wait *= backoff
+        return wrapper # type: ignore
+    return decorator
+
+async def create_chat_completion(**kwargs) -> Any:
+    reserved = estimate_tokens(kwargs)
+    await scheduler.acquire(reserved)
+    used = 0
+    try:
+        openai.aiosession.set(get_session())
+        response = await openai.ChatCompletion.acreate(**kwargs)
+        usage = getattr(response, "usage", None)
+        used = usage["total_tokens"] if usage is not None else reserved
+        return response
+    except openai.error.RateLimitError as e:
+        scheduler.retry_after(get_retry_after(e))
+        raise
+    finally:
+        # Timeouts, server errors and cancellation all hand the reservation back.
+        scheduler.record_usage(reserved, used)
+
+async def stream_chat_completion(tries : int = 3, delay : float = 3, backoff : float = 2, **kwargs) -> AsyncGenerator[str, None]:
+    # Retrying is only safe until the first token has been handed to the caller.
+    remaining, wait = tries, delay
+    while True:
+        started = False
+        finished = False
+        reserved = estimate_tokens(kwargs)
+        await scheduler.acquire(reserved)
+        try:
+            openai.aiosession.set(get_session())
+            response = await openai.ChatCompletion.acreate(stream=True, **kwargs)
+            async for chunk in response: # type: ignore
+                content = chunk.choices[0].get("delta", {}).get("content")
+                if content:
+                    started = True
+                    yield content
+            finished = True
+            return
+        except RETRYABLE_ERRORS as e:
+            if isinstance(e, openai.error.RateLimitError):
+                scheduler.retry_after(get_retry_after(e))
+            remaining -= 1
+            if started or remaining <= 0:
+                raise
+            await asyncio.sleep(wait)
+            wait *= backoff
+        finally:
+            # A stream that broke off before its first token cost nothing; one that produced text keeps its estimate.
+            if not started and not finished:
+                scheduler.record_usage(reserved, 0)
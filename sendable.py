@@ -1,7 +1,111 @@
 from abc import abstractmethod
+import time
+from typing import Any, Dict, List, Optional
+
+class EditableMessage():
+    @abstractmethod
+    async def edit(self, message:str) -> None:
+        raise NotImplementedError("Not implemented")
 
 class Sendable():
     @abstractmethod
     async def send(self, message:str) -> None:
         raise NotImplementedError("Not implemented")
+    async def send_editable(self, message:str) -> EditableMessage:
+        raise NotImplementedError("Not implemented")
+
+EMPTY_REPLY = "I didn't get a reply to that, please try again."
+FAILED_REPLY = "Something went wrong while I was replying, please try again."
+
+stream_stats = {"replies": 0, "empty_replies": 0, "failed_replies": 0, "first_token_seconds": 0.0, "first_token_max": 0.0, "rollovers": 0}
+
+def streaming_stats() -> Dict[str, Any]:
+    timed = stream_stats["replies"] - stream_stats["empty_replies"]
+    return {**stream_stats, "first_token_mean": stream_stats["first_token_seconds"] / timed if timed else 0.0}
+
+def split_at_limit(text : str, limit : int) -> int:
+    split = text[:limit].rfind(" ")
+    return split if split > 0 else limit
+
+class StreamingReply():
+    """Posts a placeholder, then edits it as text arrives, rolling over into a new message past the limit."""
+    def __init__(self, sendable : Sendable, placeholder : str = "...", edit_interval : float = 1.0, limit : int = 2000):
+        self.sendable = sendable
+        self.placeholder = placeholder
+        self.edit_interval = edit_interval
+        self.limit = limit
+        self.chunks : List[str] = []
+        self.text = ""
+        self.shown = ""
+        self.message : Optional[EditableMessage] = None
+        self.editable = True
+        self.last_edit = 0.0
+        self.first_token_latency : Optional[float] = None
+        self.started_at = 0.0
+
+    async def start(self) -> None:
+        self.started_at = time.monotonic()
+        try:
+            self.message = await self.sendable.send_editable(self.placeholder)
+        except NotImplementedError:
+            self.editable = False
+        self.last_edit = time.monotonic()
+
+    async def append(self, chunk : str) -> None:
+        if self.first_token_latency is None:
+            self.first_token_latency = time.monotonic() - self.started_at
+        self.chunks.append(chunk)
+        self.text += chunk
+        if not self.editable:
+            return
+        while len(self.text) > self.limit:
+            split = split_at_limit(self.text, self.limit)
+            await self._show(self.text[:split])
+            self.text = self.text[split:].lstrip(" ")
+            # A remainder still over the limit is split on the next pass, so only send it when it fits.
+            first = self.text if 0 < len(self.text) <= self.limit else self.placeholder
+            self.message = await self.sendable.send_editable(first)
+            self.shown = first
+            stream_stats["rollovers"] += 1
+            self.last_edit = time.monotonic()
+        if time.monotonic() - self.last_edit >= self.edit_interval:
+            await self._show(self.text)
+
+    async def finish(self) -> str:
+        stream_stats["replies"] += 1
+        if self.first_token_latency is None:
+            stream_stats["empty_replies"] += 1
+        else:
+            stream_stats["first_token_seconds"] += self.first_token_latency
+            stream_stats["first_token_max"] = max(stream_stats["first_token_max"], self.first_token_latency)
+        if not "".join(self.chunks).strip():
+            # Nothing came back, so the placeholder must not be left as the answer.
+            self.text = EMPTY_REPLY
+        if self.editable:
+            await self._show(self.text)
+        else:
+            text = self.text
+            while len(text) > self.limit:
+                split = split_at_limit(text, self.limit)
+                await self.sendable.send(text[:split])
+                text = text[split:].lstrip(" ")
+            if text:
+                await self.sendable.send(text)
+        return "".join(self.chunks)
+
+    async def fail(self) -> None:
+        """The completion broke off: the placeholder, or the text shown so far, is marked with a notice."""
+        stream_stats["failed_replies"] += 1
+        text = self.text.strip()
+        notice = text + "\n\n" + FAILED_REPLY if text and len(text) + len(FAILED_REPLY) + 2 <= self.limit else FAILED_REPLY
+        if self.editable:
+            await self._show(notice)
+        else:
+            await self.sendable.send(FAILED_REPLY)
 
+    async def _show(self, text : str) -> None:
+        if self.message is None or not text or text == self.shown:
+            return
+        await self.message.edit(text)
+        self.shown = text
+        self.last_edit = time.monotonic()
@@ -0,0 +1,140 @@
+"""Compact JSON encoding for the dto dataclasses.
+
+A registered dataclass is written as a dict of its fields plus an "@" key naming the class, e.g.
+{"@": "Conversation", "system": {...}, "messages": [...], "summary": "...", "id": "..."}. Fields left
+at a plain default and fields marked transient are omitted. Each class carries a schema version;
+version 1 is tagged with the bare name and later versions as "Name/2", and an upgrade function
+brings older documents forward on read.
+
+Objects of unregistered classes fall back to jsonpickle's flattened form, which is also how older
+records were stored, so anything with "py/" keys is handed to jsonpickle on the way back in.
+"""
+from __future__ import annotations
+import dataclasses
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+import jsonpickle
+import dto
+
+TYPE_KEY = "@"
+LEGACY_TAG = "{jsonpickle}:"
+Upgrade = Callable[[int, Dict[str, Any]], Dict[str, Any]]
+
+class Schema:
+    """How one dataclass is encoded: its tag, version and persisted fields."""
+    def __init__(self, cls : Type[Any], name : str, version : int, upgrade : Optional[Upgrade]):
+        self.cls = cls
+        self.name = name
+        self.version = version
+        self.upgrade = upgrade
+        self.tag = name if version == 1 else f"{name}/{version}"
+        fields = [f for f in dataclasses.fields(cls) if not f.metadata.get("transient")]
+        self.names = frozenset(f.name for f in fields)
+        self.fields : Tuple[Tuple[str, Any], ...] = tuple((f.name, f.default) for f in fields)
+        self.defaults : Tuple[dataclasses.Field, ...] = tuple(f for f in dataclasses.fields(cls)
+                                                            if f.default is not dataclasses.MISSING or f.default_factory is not dataclasses.MISSING)
+
+    def encode(self, obj : Any) -> Dict[str, Any]:
+        data : Dict[str, Any] = {TYPE_KEY: self.tag}
+        for name, default in self.fields:
+            # An object jsonpickle restored from before a field existed lacks it; it is at its default.
+            value = getattr(obj, name, default)
+            if default is dataclasses.MISSING or value != default:
+                data[name] = encode(value)
+        return data
+
+    def decode(self, data : Dict[str, Any], version : int) -> Any:
+        values = {k: decode(v) for k, v in data.items() if k != TYPE_KEY}
+        if version < self.version and self.upgrade is not None:
+            values = self.upgrade(version, values)
+        return self.cls(**{k: v for k, v in values.items() if k in self.names})
+
+    def fill(self, obj : Any) -> None:
+        """Sets any field with a default that obj has no value for, as __init__ would have."""
+        for f in self.defaults:
+            if f.name not in obj.__dict__:
+                setattr(obj, f.name, f.default if f.default is not dataclasses.MISSING else f.default_factory()) # type: ignore
+
+schemas_by_class : Dict[Type[Any], Schema] = {}
+schemas_by_name : Dict[str, Schema] = {}
+
+def register(cls : Type[Any], name : Optional[str] = None, version : int = 1, upgrade : Optional[Upgrade] = None) -> Type[Any]:
+    schema = Schema(cls, name or cls.__name__, version, upgrade)
+    schemas_by_class[cls] = schema
+    schemas_by_name[schema.name] = schema
+    return cls
+
+def encode(value : Any) -> Any:
+    kind = type(value)
+    if kind is str or kind is int or kind is float or kind is bool or value is None:
+        return value
+    if kind is list:
+        return [encode(v) for v in value]
+    if kind is dict:
+        data = {}
+        for k, v in value.items():
+            if type(k) is not str or k == TYPE_KEY or k.startswith("py/"):
+                return {TYPE_KEY: "dict", "items": [[encode(k), encode(v)] for k, v in value.items()]}
+            data[k] = v if type(v) is str else encode(v)
+        return data
+    schema = schemas_by_class.get(kind)
+    if schema is not None:
+        return schema.encode(value)
+    if kind is tuple:
+        return {TYPE_KEY: "tuple", "items": [encode(v) for v in value]}
+    if kind is datetime:
+        return {TYPE_KEY: "datetime", "value": value.isoformat()}
+    return jsonpickle.Pickler().flatten(value)
+
+def decode(data : Any) -> Any:
+    kind = type(data)
+    if kind is list:
+        return [decode(v) for v in data]
+    if kind is not dict:
+        return data
+    tag = data.get(TYPE_KEY)
+    if tag is None:
+        values = {}
+        for k, v in data.items():
+            if k.startswith("py/"):
+                return restored(jsonpickle.Unpickler().restore(data))
+            values[k] = v if type(v) is str else decode(v)
+        return values
+    if tag == "dict":
+        return {decode(k): decode(v) for k, v in data["items"]}
+    if tag == "tuple":
+        return tuple(decode(v) for v in data["items"])
+    if tag == "datetime":
+        return datetime.fromisoformat(data["value"])
+    name, _, version = tag.partition("/")
+    schema = schemas_by_name.get(name)
+    if schema is None:
+        raise ValueError("Unknown type tag: " + tag)
+    return schema.decode(data, int(version or 1))
+
+def restored(value : Any) -> Any:
+    """Completes the dataclasses in a value jsonpickle restored, which bypasses __init__: fields added since
+    they were stored get their defaults, and __post_init__ runs."""
+    kind = type(value)
+    if kind is list or kind is tuple:
+        for v in value:
+            restored(v)
+    elif kind is dict:
+        for v in value.values():
+            restored(v)
+    elif kind in schemas_by_class:
+        for v in value.__dict__.values():
+            restored(v)
+        schemas_by_class[kind].fill(value)
+        post_init = getattr(value, "__post_init__", None)
+        if post_init is not None:
+            post_init()
+    return value
+
+def decode_document(document : Dict[str, Any]) -> Dict[str, Any]:
+    # tinydb_serialization stored every field of a document as "{jsonpickle}:<json>".
+    return {k: restored(jsonpickle.decode(v[len(LEGACY_TAG):])) if type(v) is str and v.startswith(LEGACY_TAG) else decode(v) for k, v in document.items()}
+
+for cls in (dto.Message, dto.Channel, dto.Guild, dto.User, dto.Conversation, dto.UserConversation,
+            dto.UserCurrentConversation, dto.MessageClassification, dto.Justification):
+    register(cls)
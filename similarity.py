@@ -0,0 +1,131 @@
+from __future__ import annotations
+import zlib
+from typing import Dict, List, Sequence, Set, Tuple
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+def clean(text : str) -> str:
+    """The normalization like() has always applied: alphanumerics and whitespace only, lowercased, a leading "the" cut."""
+    text = "".join(c for c in text if c.isalnum() or c.isspace()).lower().strip()
+    if text.startswith("the"):
+        text = text[4:]
+    return text
+
+def vectorize(left : Sequence[str], right : Sequence[str], **options) -> Tuple[sparse.csr_matrix, sparse.csr_matrix]:
+    # One vocabulary over both sides, so rows of the two matrices line up column for column.
+    vectorizer = CountVectorizer(**options)
+    try:
+        vectors = vectorizer.fit_transform(list(left) + list(right))
+    except ValueError:
+        # Nothing in either list produced a token.
+        vectors = sparse.csr_matrix((len(left) + len(right), 1))
+    return vectors[:len(left)], vectors[len(left):]
+
+def cosine_matrix(left : Sequence[str], right : Sequence[str]) -> np.ndarray:
+    """Cosine similarity of word counts for every pair, as a len(left) x len(right) array."""
+    a, b = vectorize(left, right)
+    def unit(m : sparse.csr_matrix) -> sparse.csr_matrix:
+        norms = np.sqrt(np.asarray(m.multiply(m).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return sparse.diags(1.0 / norms) @ m
+    return (unit(a) @ unit(b).T).toarray()
+
+def jaccard_matrix(left : Sequence[str], right : Sequence[str]) -> np.ndarray:
+    """Jaccard similarity of the whitespace-separated word sets for every pair."""
+    a, b = vectorize(left, right, binary=True, lowercase=False, token_pattern=r"\S+")
+    intersection = (a @ b.T).toarray()
+    union = np.asarray(a.sum(axis=1)) + np.asarray(b.sum(axis=1)).T - intersection
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union > 0, intersection / np.maximum(union, 1), 0.0)
+
+def minhash_signatures(token_sets : Sequence[Set[str]], num_perm : int = 128, seed : int = 1) -> np.ndarray:
+    """One row of num_perm minimum hashes per set; empty sets get MAX_HASH throughout."""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, MAX_HASH, num_perm, dtype=np.uint64)
+    b = rng.integers(0, MAX_HASH, num_perm, dtype=np.uint64)
+    signatures = np.full((len(token_sets), num_perm), MAX_HASH, dtype=np.uint64)
+    hashes = [np.array([zlib.crc32(t.encode("utf-8")) for t in tokens], dtype=np.uint64) for tokens in token_sets]
+    rows = [i for i, h in enumerate(hashes) if len(h)]
+    if not rows:
+        return signatures
+    flat = np.concatenate([hashes[i] for i in rows])
+    # a * x + b stays below 2**64 because all three are below 2**32.
+    permuted = ((np.outer(flat, a) + b) % np.uint64(MERSENNE_PRIME)) & np.uint64(MAX_HASH)
+    offsets = np.cumsum([0] + [len(hashes[i]) for i in rows[:-1]])
+    signatures[rows] = np.minimum.reduceat(permuted, offsets, axis=0)
+    return signatures
+
+def minhash_jaccard_matrix(left : Sequence[str], right : Sequence[str], num_perm : int = 128, bands : int = 32, seed : int = 1) -> np.ndarray:
+    """Estimated Jaccard similarity, computed only for pairs that share an LSH band bucket; all others are 0.
+
+    With r = num_perm / bands rows per band, pairs above roughly (1 / bands) ** (1 / r) are likely to be
+    found, which is about 0.42 for the defaults.
+    """
+    left_sets = [set(s.split()) for s in left]
+    right_sets = [set(s.split()) for s in right]
+    a = minhash_signatures(left_sets, num_perm, seed)
+    b = minhash_signatures(right_sets, num_perm, seed)
+    rows = num_perm // bands
+    candidates : Set[Tuple[int, int]] = set()
+    for band in range(bands):
+        columns = slice(band * rows, (band + 1) * rows)
+        buckets : Dict[bytes, List[int]] = {}
+        for i in range(len(left)):
+            if left_sets[i]:
+                buckets.setdefault(a[i, columns].tobytes(), []).append(i)
+        for j in range(len(right)):
+            if right_sets[j]:
+                for i in buckets.get(b[j, columns].tobytes(), ()):
+                    candidates.add((i, j))
+    result = np.zeros((len(left), len(right)))
+    if candidates:
+        i, j = np.array(sorted(candidates)).T
+        result[i, j] = (a[i] == b[j]).mean(axis=1)
+    return result
+
+def prefix_matrix(left : Sequence[str], right : Sequence[str], length : int = 6) -> np.ndarray:
+    """True where the first length characters of either string appear anywhere in the other."""
+    result = np.zeros((len(left), len(right)), dtype=bool)
+    def mark(target : np.ndarray, prefixed : Sequence[str], searched : Sequence[str]) -> None:
+        tables : Dict[int, Dict[str, List[int]]] = {}
+        for i, s in enumerate(prefixed):
+            if s:
+                tables.setdefault(len(s[:length]), {}).setdefault(s[:length], []).append(i)
+        for j, s in enumerate(searched):
+            for size, table in tables.items():
+                for substring in {s[k:k + size] for k in range(len(s) - size + 1)} & table.keys():
+                    target[table[substring], j] = True
+    mark(result, left, right)
+    mark(result.T, right, left)
+    return result
+
+def like_matrix(left : Sequence[str], right : Sequence[str], threshold_jac : float = 0.4, threshold_cos : float = 0.6, minhash : bool = False,
+                prefix : bool = True) -> np.ndarray:
+    """like() for every pair of left and right at once, as a boolean len(left) x len(right) array.
+
+    Both lists are normalized once and share one vocabulary. With minhash, Jaccard is estimated
+    through MinHash/LSH instead of computed exactly. Without prefix, the six-character prefix rule,
+    which suits short titles but matches unrelated paragraphs, is left out.
+    """
+    a = [clean(s) for s in left]
+    b = [clean(s) for s in right]
+    jaccard = minhash_jaccard_matrix(a, b) if minhash else jaccard_matrix(a, b)
+    result = (jaccard >= threshold_jac) | (cosine_matrix(a, b) >= threshold_cos)
+    if prefix:
+        result |= prefix_matrix(a, b)
+    result[[i for i, s in enumerate(a) if not s], :] = False
+    result[:, [j for j, s in enumerate(b) if not s]] = False
+    return result
+
+def distinct(texts : Sequence[str], threshold_jac : float = 0.4, threshold_cos : float = 0.6, minhash : bool = False, prefix : bool = True) -> List[str]:
+    """The texts in order, dropping any that is like one already kept."""
+    similar = like_matrix(texts, texts, threshold_jac, threshold_cos, minhash, prefix)
+    kept : List[int] = []
+    for i in range(len(texts)):
+        if not similar[i, kept].any():
+            kept.append(i)
+    return [texts[i] for i in kept]
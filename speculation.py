@@ -0,0 +1,55 @@
+from __future__ import annotations
+import asyncio
+from typing import AsyncGenerator, List, Optional
+from context_window import token_counter
+from dto import Conversation
+import chatgpt
+
+speculation_stats = {"attempts": 0, "hits": 0, "misses": 0, "wasted_tokens": 0}
+
+class SpeculativeCompletion:
+    """A completion started before the message is classified, buffered until it is committed or discarded."""
+    def __init__(self, conversation : Conversation, context : List[dict[str, str]]):
+        self.conversation = conversation
+        self.context = context
+        self.chunks : List[str] = []
+        self.done = False
+        self.error : Optional[BaseException] = None
+        self.changed = asyncio.Event()
+        speculation_stats["attempts"] += 1
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self) -> None:
+        try:
+            async for chunk in chatgpt.stream_completion(self.context):
+                self.chunks.append(chunk)
+                self.changed.set()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self.changed.set()
+
+    async def stream(self) -> AsyncGenerator[str, None]:
+        # Replays what arrived while classification ran, then follows the live stream.
+        speculation_stats["hits"] += 1
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            self.changed.clear()
+            await self.changed.wait()
+
+    def discard(self) -> None:
+        self.task.cancel()
+        speculation_stats["misses"] += 1
+        speculation_stats["wasted_tokens"] += token_counter.count_messages(self.context) + token_counter.count_text("".join(self.chunks))
+
+def get_speculation_stats() -> dict[str, float]:
+    attempts = speculation_stats["attempts"]
+    return dict(speculation_stats, hit_rate=speculation_stats["hits"] / attempts if attempts else 0.0)
@@ -0,0 +1,150 @@
+from __future__ import annotations
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from dto import Conversation
+from storage.engine import StorageEngine
+import serialization
+
+class ColdStore:
+    """Gzipped conversation documents on disk, one file per conversation."""
+    def __init__(self, path : str):
+        self.path = path
+
+    def file_path(self, user_id : str, conversation_id : str) -> str:
+        safe = lambda s: re.sub(r"[^A-Za-z0-9_-]", "_", s)
+        return os.path.join(self.path, safe(user_id), safe(conversation_id) + ".json.gz")
+
+    def save(self, user_id : str, conversation : Conversation) -> int:
+        path = self.file_path(user_id, conversation.id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = gzip.compress(json.dumps(serialization.encode(conversation), ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        return len(data)
+
+    def load(self, user_id : str, conversation_id : str) -> Conversation:
+        with open(self.file_path(user_id, conversation_id), "rb") as f:
+            return serialization.decode(json.loads(gzip.decompress(f.read())))
+
+    def remove(self, user_id : str, conversation_id : str) -> None:
+        try:
+            os.remove(self.file_path(user_id, conversation_id))
+        except FileNotFoundError:
+            pass
+
+class ConversationArchive:
+    """Moves conversations idle for longer than max_idle out of the hot conversations table.
+
+    An archived conversation leaves behind a stub in archived_conversations holding its id, summary
+    and where it went, while the full conversation sits compressed in the cold store until it is
+    selected again. Activity is kept in memory as turns arrive and written to conversation_activity
+    when the user is swept or the archive is flushed, so a turn never writes more than the conversation.
+    """
+    def __init__(self, engine : StorageEngine, cold_store : ColdStore, max_idle : float = 30 * 86400, sweep_interval : float = 3600):
+        self.engine = engine
+        self.cold_store = cold_store
+        self.max_idle = max_idle
+        self.sweep_interval = sweep_interval
+        self.lock = threading.RLock()
+        self.touched : Dict[tuple, float] = {}
+        self.unsaved : Dict[str, set] = {}
+        self.swept : Dict[str, float] = {}
+        self.hot_counts : Dict[str, int] = {}
+        self.archived = 0
+        self.archived_bytes = 0
+        self.rehydrations = 0
+        self.rehydrate_seconds = 0.0
+        self.rehydrate_max = 0.0
+
+    def touch(self, user_id : str, conversation_id : str, now : Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        with self.lock:
+            self.touched[(user_id, conversation_id)] = now
+            self.unsaved.setdefault(user_id, set()).add(conversation_id)
+
+    def flush(self, user_id : Optional[str] = None) -> None:
+        """Writes the activity recorded since the last flush, for one user or for everyone."""
+        with self.lock:
+            for user in [user_id] if user_id is not None else list(self.unsaved):
+                for conversation_id in self.unsaved.pop(user, ()):
+                    last_active = self.touched.pop((user, conversation_id), None)
+                    if last_active is not None:
+                        self.engine.put("conversation_activity", {"user_id": user, "conversation_id": conversation_id, "last_active": last_active})
+
+    def last_active(self, user_id : str, conversation_id : str, now : float) -> float:
+        touched = self.touched.get((user_id, conversation_id))
+        if touched is not None:
+            return touched
+        record = self.engine.get("conversation_activity", (user_id, conversation_id))
+        if record is None:
+            # Conversations from before archiving existed start ageing from the first sweep that sees them.
+            self.touch(user_id, conversation_id, now)
+            return now
+        return record["last_active"]
+
+    def sweep(self, user_id : str, current_id : Optional[str], now : Optional[float] = None, force : bool = False) -> int:
+        now = time.time() if now is None else now
+        with self.lock:
+            if not force and now - self.swept.get(user_id, float("-inf")) < self.sweep_interval:
+                return 0
+            self.swept[user_id] = now
+            count = 0
+            records = self.engine.find("conversations", user_id)
+            for record in records:
+                conversation_id = record["conversation_id"]
+                if conversation_id != current_id and now - self.last_active(user_id, conversation_id, now) > self.max_idle:
+                    self.archive(user_id, record["conversation"], now)
+                    count += 1
+            self.hot_counts[user_id] = len(records) - count
+            self.flush(user_id)
+            return count
+
+    def archive(self, user_id : str, conversation : Conversation, now : float) -> None:
+        conversation.load_history()
+        size = self.cold_store.save(user_id, conversation)
+        self.engine.put("archived_conversations", {"user_id": user_id, "conversation_id": conversation.id, "summary": conversation.summary,
+                                                   "messages": len(conversation.messages), "archived_at": now, "bytes": size})
+        self.engine.delete("conversations", (user_id, conversation.id))
+        self.engine.delete("conversation_activity", (user_id, conversation.id))
+        self.touched.pop((user_id, conversation.id), None)
+        self.unsaved.get(user_id, set()).discard(conversation.id)
+        self.archived += 1
+        self.archived_bytes += size
+
+    def is_archived(self, user_id : str, conversation_id : str) -> bool:
+        return self.engine.get("archived_conversations", (user_id, conversation_id)) is not None
+
+    def stubs(self, user_id : str) -> List[Conversation]:
+        return [Conversation({}, [], stub["summary"], stub["conversation_id"]) for stub in self.engine.find("archived_conversations", user_id)]
+
+    def rehydrate(self, user_id : str, conversation_id : str) -> Optional[Conversation]:
+        started = time.perf_counter()
+        with self.lock:
+            if not self.is_archived(user_id, conversation_id):
+                return None
+            conversation = self.cold_store.load(user_id, conversation_id)
+            self.engine.put("conversations", {"user_id": user_id, "conversation": conversation, "conversation_id": conversation_id})
+            self.engine.delete("archived_conversations", (user_id, conversation_id))
+            self.cold_store.remove(user_id, conversation_id)
+            if user_id in self.hot_counts:
+                self.hot_counts[user_id] += 1
+            self.touch(user_id, conversation_id)
+            elapsed = time.perf_counter() - started
+            self.rehydrations += 1
+            self.rehydrate_seconds += elapsed
+            self.rehydrate_max = max(self.rehydrate_max, elapsed)
+            return conversation
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"hot_conversations": sum(self.hot_counts.values()), "users_swept": len(self.hot_counts), "archived": self.archived,
+                    "archived_bytes": self.archived_bytes, "rehydrations": self.rehydrations,
+                    "rehydrate_mean_ms": self.rehydrate_seconds / self.rehydrations * 1000 if self.rehydrations else 0.0,
+                    "rehydrate_max_ms": self.rehydrate_max * 1000}
@@ -0,0 +1,160 @@
+from __future__ import annotations
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from dto import Conversation
+from storage.engine import Key, StorageEngine, detach, record_key
+
+CacheKey = Tuple[str, str, Any]
+
+def estimate_size(value : Any) -> int:
+    """Rough bytes held by a cached value; strings dominate, so containers are only lightly counted."""
+    if isinstance(value, str):
+        return 49 + len(value)
+    if isinstance(value, dict):
+        return 64 + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 56 + sum(estimate_size(v) for v in value)
+    if isinstance(value, Conversation):
+        return 64 + estimate_size(value.system) + estimate_size(value.messages) + estimate_size(value.summary) + estimate_size(value.id)
+    return sys.getsizeof(value)
+
+class CachedEngine(StorageEngine):
+    """Read-through LRU over another engine, bounded by the approximate size of what it holds.
+
+    Writes go to the engine first and then update the cached copies in place, so users who stay
+    active are served from memory. A missing record is cached too, as None.
+    """
+    def __init__(self, engine : StorageEngine, max_bytes : int = 64 << 20):
+        self.engine = engine
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self.entries : OrderedDict[CacheKey, Tuple[Any, int]] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.transaction = getattr(engine, "transaction", None)
+
+    def lookup(self, cache_key : CacheKey, load : Callable[[], Any]) -> Any:
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry is not None:
+                self.entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            value = load()
+            # A read of the last commit while another thread's writes are still open may already be stale.
+            sees_pending_writes = getattr(self.engine, "sees_pending_writes", None)
+            if sees_pending_writes is None or sees_pending_writes():
+                self.store(cache_key, value)
+            return value
+
+    def store(self, cache_key : CacheKey, value : Any) -> None:
+        self.discard(cache_key)
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        self.entries[cache_key] = (value, size)
+        self.size += size
+        self.evict()
+
+    def evict(self) -> None:
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.size -= evicted
+            self.evictions += 1
+
+    def discard(self, cache_key : CacheKey) -> None:
+        entry = self.entries.pop(cache_key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def resize(self, cache_key : CacheKey, grown : Optional[int] = None) -> None:
+        entry = self.entries.get(cache_key)
+        if entry is None:
+            return
+        if grown is None:
+            self.store(cache_key, entry[0])
+        else:
+            self.discard(cache_key)
+            self.entries[cache_key] = (entry[0], entry[1] + grown)
+            self.size += entry[1] + grown
+            self.evict()
+
+    def get(self, table : str, key : Key) -> Optional[dict[str, Any]]:
+        return detach(self.lookup(("get", table, key), lambda: self.engine.get(table, key)))
+
+    def find(self, table : str, user_id : str) -> List[dict[str, Any]]:
+        return [detach(record) for record in self.lookup(("find", table, user_id), lambda: self.engine.find(table, user_id))] # type: ignore
+
+    def put(self, table : str, record : dict[str, Any]) -> None:
+        with self.lock:
+            self.engine.put(table, record)
+            record = detach(record) # type: ignore
+            key = record_key(table, record)
+            self.store(("get", table, key), record)
+            found = self.entries.get(("find", table, key[0]))
+            if found is not None:
+                records = found[0]
+                if any(record_key(table, r) == key for r in records):
+                    # Keep the record where it was, since find returns a user's records in insertion order.
+                    records = [detach(record) if record_key(table, r) == key else r for r in records]
+                else:
+                    records = records + [detach(record)]
+                self.store(("find", table, key[0]), records)
+
+    def delete(self, table : str, key : Key) -> None:
+        with self.lock:
+            self.engine.delete(table, key)
+            self.store(("get", table, key), None)
+            found = self.entries.get(("find", table, key[0]))
+            if found is not None:
+                self.store(("find", table, key[0]), [r for r in found[0] if record_key(table, r) != key])
+
+    def cached_conversations(self, user_id : str, conversation_id : str) -> List[Tuple[CacheKey, Optional[Conversation]]]:
+        # The conversation as cached by get and by find, or None where the cache can't tell.
+        result : List[Tuple[CacheKey, Optional[Conversation]]] = []
+        get_key : CacheKey = ("get", "conversations", (user_id, conversation_id))
+        entry = self.entries.get(get_key)
+        if entry is not None:
+            result.append((get_key, entry[0]["conversation"] if entry[0] is not None else None))
+        find_key : CacheKey = ("find", "conversations", user_id)
+        entry = self.entries.get(find_key)
+        if entry is not None:
+            matches = [r["conversation"] for r in entry[0] if r["conversation_id"] == conversation_id]
+            result.append((find_key, matches[0] if matches else None))
+        return result
+
+    def append_message(self, user_id : str, conversation_id : str, message : dict[str, str]) -> None:
+        with self.lock:
+            self.engine.append_message(user_id, conversation_id, message)
+            for cache_key, conversation in self.cached_conversations(user_id, conversation_id):
+                if conversation is None:
+                    self.discard(cache_key)
+                else:
+                    conversation.messages.append(dict(message))
+                    self.resize(cache_key, estimate_size(message))
+
+    def put_conversation_header(self, user_id : str, conversation : Conversation) -> None:
+        with self.lock:
+            self.engine.put_conversation_header(user_id, conversation)
+            for cache_key, cached in self.cached_conversations(user_id, conversation.id):
+                if cached is None:
+                    self.discard(cache_key)
+                else:
+                    cached.system = dict(conversation.system)
+                    cached.summary = conversation.summary
+                    cached.summarized = conversation.summarized
+                    self.resize(cache_key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "evictions": self.evictions, "entries": len(self.entries), "bytes": self.size, "max_bytes": self.max_bytes}
+
+    def close(self) -> None:
+        self.engine.close()
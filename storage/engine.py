@@ -0,0 +1,106 @@
+from __future__ import annotations
+from abc import abstractmethod
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from dto import Conversation
+
+Key = Tuple[str, ...]
+
+# Every table is keyed by user, except the per-conversation ones since a user can have many.
+TABLE_KEYS : Dict[str, Tuple[str, ...]] = {
+    "conversations": ("user_id", "conversation_id"),
+    "archived_conversations": ("user_id", "conversation_id"),
+    "conversation_activity": ("user_id", "conversation_id"),
+}
+DEFAULT_KEY = ("user_id",)
+
+def key_fields(table : str) -> Tuple[str, ...]:
+    return TABLE_KEYS.get(table, DEFAULT_KEY)
+
+def record_key(table : str, record : dict[str, Any]) -> Key:
+    return tuple(str(record[field]) for field in key_fields(table))
+
+def detach_value(value : Any) -> Any:
+    if isinstance(value, Conversation):
+        return value.copy()
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+def detach(record : Optional[dict[str, Any]]) -> Optional[dict[str, Any]]:
+    # Engines that keep live objects hand out copies, so a caller mutating a result
+    # without saving it can't change what is stored.
+    if record is None:
+        return None
+    return {k: detach_value(v) for k, v in record.items()}
+
+class RecordIndex:
+    """Every table's records held in memory, hashed by key and grouped by user."""
+    def __init__(self):
+        self.records : Dict[str, Dict[Key, dict[str, Any]]] = {}
+        self.by_user : Dict[str, Dict[str, Dict[Key, None]]] = {}
+
+    def get(self, table : str, key : Key) -> Optional[dict[str, Any]]:
+        return self.records.get(table, {}).get(key)
+
+    def find(self, table : str, user_id : str) -> List[dict[str, Any]]:
+        records = self.records.get(table, {})
+        return [records[key] for key in self.by_user.get(table, {}).get(user_id, {})]
+
+    def put(self, table : str, record : dict[str, Any]) -> Key:
+        key = record_key(table, record)
+        self.records.setdefault(table, {})[key] = record
+        # A dict rather than a set keeps a user's records in insertion order.
+        self.by_user.setdefault(table, {}).setdefault(key[0], {})[key] = None
+        return key
+
+    def delete(self, table : str, key : Key) -> Optional[dict[str, Any]]:
+        record = self.records.get(table, {}).pop(key, None)
+        if record is None:
+            return None
+        keys = self.by_user[table][key[0]]
+        keys.pop(key, None)
+        if not keys:
+            del self.by_user[table][key[0]]
+        return record
+
+    def tables(self) -> List[str]:
+        return list(self.records)
+
+    def items(self, table : str) -> Iterator[dict[str, Any]]:
+        return iter(list(self.records.get(table, {}).values()))
+
+class StorageEngine:
+    @abstractmethod
+    def get(self, table : str, key : Key) -> Optional[dict[str, Any]]:
+        pass
+    @abstractmethod
+    def find(self, table : str, user_id : str) -> List[dict[str, Any]]:
+        pass
+    @abstractmethod
+    def put(self, table : str, record : dict[str, Any]) -> None:
+        pass
+    @abstractmethod
+    def delete(self, table : str, key : Key) -> None:
+        pass
+    def append_message(self, user_id : str, conversation_id : str, message : dict[str, str]) -> None:
+        # Engines that can store a single turn override this; the fallback rewrites the conversation.
+        record = self.get("conversations", (user_id, conversation_id))
+        if record is None:
+            raise KeyError(conversation_id)
+        record["conversation"].messages.append(dict(message))
+        self.put("conversations", record)
+    def put_conversation_header(self, user_id : str, conversation : Conversation) -> None:
+        """Save a conversation's system blocks and summary, creating it without messages if it is new."""
+        record = self.get("conversations", (user_id, conversation.id))
+        if record is None:
+            stored = Conversation(dict(conversation.system), [], conversation.summary, conversation.id, conversation.summarized)
+            record = {"user_id": user_id, "conversation": stored, "conversation_id": conversation.id}
+        else:
+            record["conversation"].system = dict(conversation.system)
+            record["conversation"].summary = conversation.summary
+            record["conversation"].summarized = conversation.summarized
+        self.put("conversations", record)
+    def close(self) -> None:
+        pass
@@ -0,0 +1,73 @@
+from __future__ import annotations
+import contextlib
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+from tinydb import TinyDB
+from storage.engine import Key, RecordIndex, StorageEngine, detach
+
+class IndexedEngine(StorageEngine):
+    """Serves reads from in-memory hash indexes on user and (user, conversation); TinyDB stays the durable copy.
+
+    TinyDB rewrites its whole file on every change, so writes dump the indexes straight to its storage
+    instead, once per call or once per transaction.
+    """
+    def __init__(self, db : TinyDB):
+        self.db = db
+        self.lock = threading.RLock()
+        self.index = RecordIndex()
+        self.doc_ids : Dict[str, Dict[Key, int]] = {}
+        self.next_ids : Dict[str, int] = {}
+        self.depth = 0
+        self.dirty = False
+        for table in db.tables():
+            for document in db.table(table).all():
+                key = self.index.put(table, dict(document))
+                self.doc_ids.setdefault(table, {})[key] = document.doc_id
+            self.next_ids[table] = max(self.doc_ids.get(table, {}).values(), default=0) + 1
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        with self.lock:
+            self.depth += 1
+            try:
+                yield
+            finally:
+                self.depth -= 1
+                self.commit()
+
+    def commit(self) -> None:
+        if self.depth > 0 or not self.dirty:
+            return
+        self.db.storage.write({table: {str(self.doc_ids[table][key]): record for key, record in records.items()}
+                               for table, records in self.index.records.items()})
+        self.dirty = False
+
+    def get(self, table : str, key : Key) -> Optional[dict[str, Any]]:
+        with self.lock:
+            return detach(self.index.get(table, key))
+
+    def find(self, table : str, user_id : str) -> List[dict[str, Any]]:
+        with self.lock:
+            return [detach(record) for record in self.index.find(table, user_id)] # type: ignore
+
+    def put(self, table : str, record : dict[str, Any]) -> None:
+        with self.lock:
+            record = detach(record) # type: ignore
+            key = self.index.put(table, record)
+            doc_ids = self.doc_ids.setdefault(table, {})
+            if key not in doc_ids:
+                doc_ids[key] = self.next_ids.get(table, 1)
+                self.next_ids[table] = doc_ids[key] + 1
+            self.dirty = True
+            self.commit()
+
+    def delete(self, table : str, key : Key) -> None:
+        with self.lock:
+            if self.index.delete(table, key) is None:
+                return
+            del self.doc_ids[table][key]
+            self.dirty = True
+            self.commit()
+
+    def close(self) -> None:
+        self.db.close()
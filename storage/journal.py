@@ -0,0 +1,212 @@
+from __future__ import annotations
+import contextlib
+import glob
+import json
+import os
+import re
+import threading
+from typing import Any, Callable, Iterator, List, Optional
+from dto import Conversation
+import serialization
+from storage.engine import Key, RecordIndex, StorageEngine, detach
+
+Encoder = Callable[[dict[str, Any]], Any]
+Decoder = Callable[[Any], dict[str, Any]]
+
+class JournalEngine(StorageEngine):
+    """Keeps tables in memory and persists each mutation as one appended log line.
+
+    Appending a turn or changing a conversation's system blocks and summary logs only that change,
+    not the whole conversation. The log is split into numbered segments. Once a segment holds compact_after entries a new one is
+    started, and a background thread folds the closed segments into the snapshot by replaying them
+    on top of the previous snapshot file, so it never has to lock the live tables. On open the
+    snapshot is loaded and any segments newer than it are replayed; a torn final line is ignored.
+    """
+    def __init__(self, path : str, compact_after : int = 10000, fsync : bool = False, encode : Encoder = serialization.encode, decode : Decoder = serialization.decode):
+        self.path = path
+        self.compact_after = compact_after
+        self.fsync = fsync
+        self.encode = encode
+        self.decode = decode
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.index = RecordIndex()
+        snapshot_segment = self.load_snapshot(self.index)
+        segments = [s for s in self.list_segments() if s > snapshot_segment]
+        for segment in segments:
+            self.replay(segment, self.index)
+        self.entries = 0
+        # Always start a fresh segment so new entries never follow a torn line.
+        self.segment = max(segments + [snapshot_segment]) + 1
+        self.log = open(self.segment_path(self.segment), "a", encoding="utf-8")
+        self.compactions = 0
+        self.compact_requested = threading.Event()
+        self.closed = False
+        self.compactor = threading.Thread(target=self.run_compactor, name="journal-compactor", daemon=True)
+        self.compactor.start()
+        if len(segments) > 0:
+            self.compact_requested.set()
+
+    @staticmethod
+    def exists(path : str) -> bool:
+        """Whether a journal has been started at path, by its snapshot or any log segment."""
+        return os.path.exists(path + ".snapshot") or bool(glob.glob(glob.escape(path) + ".*.log"))
+
+    def snapshot_path(self) -> str:
+        return self.path + ".snapshot"
+
+    def segment_path(self, segment : int) -> str:
+        return f"{self.path}.{segment:08d}.log"
+
+    def list_segments(self) -> List[int]:
+        pattern = re.compile(re.escape(self.path) + r"\.(\d{8})\.log$")
+        matches = (pattern.match(p) for p in glob.glob(glob.escape(self.path) + ".*.log"))
+        return sorted(int(m.group(1)) for m in matches if m is not None)
+
+    def load_snapshot(self, index : RecordIndex) -> int:
+        if not os.path.exists(self.snapshot_path()):
+            return 0
+        with open(self.snapshot_path(), "r", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            for line in f:
+                entry = json.loads(line)
+                index.put(entry["t"], self.decode(entry["r"]))
+        return header["segment"]
+
+    def replay(self, segment : int, index : RecordIndex) -> int:
+        count = 0
+        with open(self.segment_path(segment), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                self.apply(index, entry)
+                count += 1
+        return count
+
+    def apply(self, index : RecordIndex, entry : dict[str, Any]) -> None:
+        if entry["op"] == "put":
+            index.put(entry["t"], self.decode(entry["r"]))
+        elif entry["op"] == "delete":
+            index.delete(entry["t"], tuple(entry["k"]))
+        elif entry["op"] == "append":
+            record = index.get("conversations", tuple(entry["k"]))
+            if record is not None:
+                record["conversation"].messages.append(entry["m"])
+        elif entry["op"] == "header":
+            record = index.get("conversations", tuple(entry["k"]))
+            if record is None:
+                conversation = Conversation(entry["system"], [], entry["summary"], entry["k"][1], entry.get("summarized", 0))
+                index.put("conversations", {"user_id": entry["k"][0], "conversation": conversation, "conversation_id": entry["k"][1]})
+            else:
+                record["conversation"].system = entry["system"]
+                record["conversation"].summary = entry["summary"]
+                record["conversation"].summarized = entry.get("summarized", 0)
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        # Entries logged inside are flushed, and fsynced if asked, once at the end.
+        with self.lock:
+            self.depth += 1
+            try:
+                yield
+            finally:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.sync()
+
+    def sync(self) -> None:
+        self.log.flush()
+        if self.fsync:
+            os.fsync(self.log.fileno())
+
+    def append(self, entry : dict[str, Any]) -> None:
+        self.log.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        if self.depth == 0:
+            self.sync()
+        self.entries += 1
+        if self.entries >= self.compact_after:
+            self.rotate()
+            self.compact_requested.set()
+
+    def rotate(self) -> None:
+        self.sync()
+        self.log.close()
+        self.segment += 1
+        self.entries = 0
+        self.log = open(self.segment_path(self.segment), "a", encoding="utf-8")
+
+    def get(self, table : str, key : Key) -> Optional[dict[str, Any]]:
+        with self.lock:
+            return detach(self.index.get(table, key))
+
+    def find(self, table : str, user_id : str) -> List[dict[str, Any]]:
+        with self.lock:
+            return [detach(record) for record in self.index.find(table, user_id)] # type: ignore
+
+    def put(self, table : str, record : dict[str, Any]) -> None:
+        with self.lock:
+            record = detach(record) # type: ignore
+            self.index.put(table, record)
+            self.append({"op": "put", "t": table, "r": self.encode(record)})
+
+    def delete(self, table : str, key : Key) -> None:
+        with self.lock:
+            if self.index.delete(table, key) is None:
+                return
+            self.append({"op": "delete", "t": table, "k": list(key)})
+
+    def append_message(self, user_id : str, conversation_id : str, message : dict[str, str]) -> None:
+        with self.lock:
+            key = (user_id, conversation_id)
+            if self.index.get("conversations", key) is None:
+                raise KeyError(conversation_id)
+            entry = {"op": "append", "t": "conversations", "k": list(key), "m": dict(message)}
+            self.apply(self.index, entry)
+            self.append(entry)
+
+    def put_conversation_header(self, user_id : str, conversation : Conversation) -> None:
+        with self.lock:
+            entry = {"op": "header", "t": "conversations", "k": [user_id, conversation.id], "system": dict(conversation.system), "summary": conversation.summary,
+                     "summarized": conversation.summarized}
+            self.apply(self.index, entry)
+            self.append(entry)
+
+    def run_compactor(self) -> None:
+        while True:
+            self.compact_requested.wait()
+            self.compact_requested.clear()
+            if self.closed:
+                return
+            self.compact()
+
+    def compact(self) -> None:
+        with self.lock:
+            closed = [s for s in self.list_segments() if s < self.segment]
+        if not closed:
+            return
+        index = RecordIndex()
+        snapshot_segment = self.load_snapshot(index)
+        closed = [s for s in closed if s > snapshot_segment]
+        for segment in closed:
+            self.replay(segment, index)
+        temp_path = self.snapshot_path() + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"segment": max(closed + [snapshot_segment])}) + "\n")
+            for table in index.tables():
+                for record in index.items(table):
+                    f.write(json.dumps({"t": table, "r": self.encode(record)}, ensure_ascii=False, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path())
+        for segment in closed:
+            os.remove(self.segment_path(segment))
+        self.compactions += 1
+
+    def close(self) -> None:
+        with self.lock:
+            self.closed = True
+            self.compact_requested.set()
+            self.log.close()
+        self.compactor.join()
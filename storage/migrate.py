@@ -0,0 +1,122 @@
+"""Copy a TinyDB db.json into another storage engine without loading the file into memory.
+
+Usage: python -m storage.migrate db.json db.sqlite [--mode sqlite|journal]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+from typing import Any, Iterator, TextIO, Tuple
+import serialization
+from storage.engine import StorageEngine
+
+WHITESPACE = " \t\r\n"
+
+class JSONStreamReader:
+    """Pulls JSON tokens and whole values out of a file through a bounded sliding buffer."""
+    def __init__(self, f : TextIO, chunk_size : int = 1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self, size : int) -> bool:
+        chunk = self.f.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill(self.chunk_size):
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, token : str) -> None:
+        if self.peek() != token:
+            raise ValueError(f"Expected {token!r} at {self.buffer[self.pos:self.pos + 40]!r}")
+        self.pos += 1
+
+    def accept(self, token : str) -> bool:
+        if self.peek() == token:
+            self.pos += 1
+            return True
+        return False
+
+    def value(self) -> Any:
+        # Only strings and objects are read this way, and both fail to parse until they are complete.
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                self.pos = end
+                return value
+            except json.JSONDecodeError:
+                if not self.fill(size):
+                    raise
+                size *= 2
+
+def iter_tinydb(f : TextIO) -> Iterator[Tuple[str, str, dict[str, Any]]]:
+    reader = JSONStreamReader(f)
+    reader.expect("{")
+    if reader.accept("}"):
+        return
+    while True:
+        table = reader.value()
+        reader.expect(":")
+        reader.expect("{")
+        if not reader.accept("}"):
+            while True:
+                doc_id = reader.value()
+                reader.expect(":")
+                yield table, doc_id, serialization.decode_document(reader.value())
+                if not reader.accept(","):
+                    break
+            reader.expect("}")
+        if not reader.accept(","):
+            break
+    reader.expect("}")
+
+def migrate(source : str, engine : StorageEngine, batch_size : int = 500) -> int:
+    count = 0
+    transaction = getattr(engine, "transaction", None)
+    with open(source, "r", encoding="utf-8") as f:
+        documents = iter_tinydb(f)
+        while True:
+            batch = [d for _, d in zip(range(batch_size), documents)]
+            if not batch:
+                return count
+            if transaction is not None:
+                with transaction():
+                    for table, _, document in batch:
+                        engine.put(table, document)
+            else:
+                for table, _, document in batch:
+                    engine.put(table, document)
+            count += len(batch)
+
+def main(argv=None) -> None:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+    from db import open_engine
+    parser = argparse.ArgumentParser(description="Migrate a TinyDB db.json into another storage engine.")
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    parser.add_argument("--mode", default="sqlite", choices=["sqlite", "journal"])
+    args = parser.parse_args(argv)
+    engine = open_engine(args.destination, args.mode)
+    try:
+        count = migrate(args.source, engine)
+    finally:
+        engine.close()
+    print(f"Migrated {count} records from {args.source} to {args.destination}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+from __future__ import annotations
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    source TEXT NOT NULL,
+    key TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    negative INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (source, key)
+);
+CREATE INDEX IF NOT EXISTS responses_by_use ON responses (last_used);
+"""
+
+@dataclass
+class CachedResponse:
+    status : int
+    headers : Dict[str, str] = field(default_factory=dict)
+    body : bytes = b""
+    negative : bool = False
+    expires_at : float = 0.0
+
+    def fresh(self, now : float) -> bool:
+        return now < self.expires_at
+
+def parse_ttls(text : str) -> Dict[str, float]:
+    # "Wikipedia=604800,Google News=900"
+    ttls : Dict[str, float] = {}
+    for item in text.split(","):
+        name, _, seconds = item.rpartition("=")
+        if name.strip():
+            ttls[name.strip()] = float(seconds)
+    return ttls
+
+class ResponseCache:
+    """Responses and data source results kept in SQLite, keyed by source and request.
+
+    Entries stay fresh for their source's TTL; failures and empty results are kept for negative_ttl.
+    A stale entry can be revalidated instead of fetched again. Once the bodies held pass max_bytes, the
+    least recently used entries are evicted.
+    """
+    def __init__(self, path : str, max_bytes : int = 256 << 20, default_ttl : float = 3600, negative_ttl : float = 300,
+                 ttls : Optional[Dict[str, float]] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self.ttls = ttls or {}
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.hits = 0
+        self.negative_hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+    def ttl(self, source : str) -> float:
+        return self.ttls.get(source, self.default_ttl)
+
+    def get(self, source : str, key : str) -> Optional[CachedResponse]:
+        with self.lock:
+            row = self.conn.execute("SELECT status, headers, body, negative, expires_at FROM responses WHERE source = ? AND key = ?", (source, key)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE responses SET last_used = ? WHERE source = ? AND key = ?", (time.time(), source, key))
+            return CachedResponse(row[0], json.loads(row[1]), bytes(row[2]), bool(row[3]), row[4])
+
+    def lookup(self, source : str, key : str, now : Optional[float] = None) -> Optional[CachedResponse]:
+        """A fresh entry, counted as a hit; a stale or missing one counts as a miss and is returned for revalidation."""
+        now = time.time() if now is None else now
+        entry = self.get(source, key)
+        with self.lock:
+            if entry is None or not entry.fresh(now):
+                self.misses += 1
+            elif entry.negative:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+                self.bytes_saved += len(entry.body)
+        return entry
+
+    def put(self, source : str, key : str, status : int, body : bytes, headers : Optional[Dict[str, str]] = None, negative : bool = False,
+            now : Optional[float] = None) -> CachedResponse:
+        now = time.time() if now is None else now
+        entry = CachedResponse(status, headers or {}, body, negative, now + (self.negative_ttl if negative else self.ttl(source)))
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM responses WHERE source = ? AND key = ?", (source, key)).fetchone()
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                              (source, key, status, json.dumps(entry.headers), body, int(negative), entry.expires_at, now, len(body)))
+            self.size += len(body) - (old[0] if old else 0)
+            self.stores += 1
+            self.evict()
+        return entry
+
+    def refresh(self, source : str, key : str, entry : CachedResponse, now : Optional[float] = None) -> None:
+        """The origin confirmed entry is unchanged, so it is fresh for another TTL without sending the body again."""
+        now = time.time() if now is None else now
+        entry.expires_at = now + self.ttl(source)
+        with self.lock:
+            self.conn.execute("UPDATE responses SET expires_at = ?, last_used = ? WHERE source = ? AND key = ?", (entry.expires_at, now, source, key))
+            self.revalidated += 1
+            self.bytes_saved += len(entry.body)
+
+    def evict(self) -> None:
+        while self.size > self.max_bytes:
+            rows = self.conn.execute("SELECT source, key, size FROM responses ORDER BY last_used LIMIT 64").fetchall()
+            if not rows:
+                self.size = 0
+                return
+            for source, key, size in rows:
+                self.conn.execute("DELETE FROM responses WHERE source = ? AND key = ?", (source, key))
+                self.size -= size
+                self.evictions += 1
+                if self.size <= self.max_bytes:
+                    break
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {"hits": self.hits, "negative_hits": self.negative_hits, "revalidated": self.revalidated, "misses": self.misses,
+                    "hit_ratio": (self.hits + self.negative_hits + self.revalidated) / lookups if lookups else 0.0,
+                    "bytes_saved": self.bytes_saved, "stores": self.stores, "evictions": self.evictions,
+                    "entries": self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0], "bytes": self.size, "max_bytes": self.max_bytes}
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,257 @@
+from __future__ import annotations
+import contextlib
+import functools
+import json
+import pathlib
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from dto import Conversation
+import serialization
+from storage.engine import Key, StorageEngine, record_key
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS preferences (
+    user_id TEXT PRIMARY KEY,
+    preferences TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS current_conversation (
+    user_id TEXT PRIMARY KEY,
+    conversation_id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS knowledge (
+    user_id TEXT PRIMARY KEY,
+    knowledge TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS datasources (
+    user_id TEXT PRIMARY KEY,
+    datasources TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    user_id TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    system TEXT NOT NULL,
+    summary TEXT,
+    summarized INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, conversation_id)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    user_id TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (user_id, conversation_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS records (
+    table_name TEXT NOT NULL,
+    record_key TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (table_name, record_key)
+);
+CREATE INDEX IF NOT EXISTS records_by_user ON records (table_name, user_id);
+"""
+
+# Tables with their own schema store one JSON/text column next to user_id; anything else goes to records.
+# The flag marks columns holding objects, which go through the dto codec.
+VALUE_TABLES : Dict[str, Tuple[str, bool]] = {
+    "preferences": ("preferences", False),
+    "current_conversation": ("conversation_id", False),
+    "knowledge": ("knowledge", False),
+    "datasources": ("datasources", True),
+}
+
+def dump(value : Any) -> str:
+    return json.dumps(serialization.encode(value), ensure_ascii=False, separators=(",", ":"))
+
+def load(text : str) -> Any:
+    # Rows written by jsonpickle decode through the codec's fallback.
+    return serialization.decode(json.loads(text))
+
+class SQLiteEngine(StorageEngine):
+    """SQLite in WAL mode, with one row per conversation and one row per message.
+
+    Conversations are read with only their latest recent_messages turns; older ones load on demand.
+    Writes go through one connection; each reading thread gets a read-only connection of its own, so
+    reads see the last commit without waiting for a batch of writes still in progress.
+    """
+    def __init__(self, path : str, recent_messages : int = 50):
+        self.path = path
+        self.recent_messages = recent_messages
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.owner : Optional[int] = None
+        self.local = threading.local()
+        self.read_connections : List[sqlite3.Connection] = []
+        self.read_connections_lock = threading.Lock()
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, cached_statements=256)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(conversations)")]
+        if "summarized" not in columns:
+            self.conn.execute("ALTER TABLE conversations ADD COLUMN summarized INTEGER NOT NULL DEFAULT 0")
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        # Nested use joins the outer transaction, so callers can batch many puts into one commit.
+        with self.lock:
+            if self.depth == 0:
+                self.conn.execute("BEGIN")
+                self.owner = threading.get_ident()
+            self.depth += 1
+            try:
+                yield
+            except BaseException:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.owner = None
+                    self.conn.execute("ROLLBACK")
+                raise
+            self.depth -= 1
+            if self.depth == 0:
+                self.owner = None
+                self.conn.execute("COMMIT")
+
+    @contextlib.contextmanager
+    def reading(self) -> Iterator[sqlite3.Connection]:
+        # The thread inside a transaction must see its own uncommitted writes, so it reads through the
+        # write connection, as does an in-memory database, which a second connection can't open.
+        if self.path == ":memory:" or self.owner == threading.get_ident():
+            with self.lock:
+                yield self.conn
+            return
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            uri = pathlib.Path(self.path).resolve().as_uri() + "?mode=ro"
+            conn = self.local.conn = sqlite3.connect(uri, uri=True, isolation_level=None, check_same_thread=False, cached_statements=256)
+            with self.read_connections_lock:
+                self.read_connections.append(conn)
+        if getattr(self.local, "reading", False):
+            yield conn
+            return
+        # One read transaction, so a conversation's header and messages come from the same commit.
+        conn.execute("BEGIN")
+        self.local.reading = True
+        try:
+            yield conn
+        finally:
+            self.local.reading = False
+            conn.execute("COMMIT")
+
+    def sees_pending_writes(self) -> bool:
+        """False on a thread reading the last commit while another thread's transaction is open."""
+        return self.depth == 0 or self.owner == threading.get_ident()
+
+    def encode_value(self, value : Any, encoded : bool) -> str:
+        if encoded:
+            return dump(value)
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+    def decode_value(self, column : str, text : str, encoded : bool) -> Any:
+        if encoded:
+            return load(text)
+        if column in ("conversation_id", "knowledge"):
+            return text
+        return json.loads(text)
+
+    def get(self, table : str, key : Key) -> Optional[dict[str, Any]]:
+        with self.reading() as conn:
+            if table == "conversations":
+                return self.get_conversation_record(conn, key[0], key[1])
+            if table in VALUE_TABLES:
+                column, encoded = VALUE_TABLES[table]
+                row = conn.execute(f"SELECT {column} FROM {table} WHERE user_id = ?", (key[0],)).fetchone()
+                return None if row is None else {"user_id": key[0], column: self.decode_value(column, row[0], encoded)}
+            row = conn.execute("SELECT record FROM records WHERE table_name = ? AND record_key = ?", (table, json.dumps(list(key)))).fetchone()
+            return None if row is None else load(row[0])
+
+    def find(self, table : str, user_id : str) -> List[dict[str, Any]]:
+        if table in VALUE_TABLES:
+            record = self.get(table, (user_id,))
+            return [] if record is None else [record]
+        with self.reading() as conn:
+            if table == "conversations":
+                return self.find_conversation_records(conn, user_id)
+            rows = conn.execute("SELECT record FROM records WHERE table_name = ? AND user_id = ? ORDER BY rowid", (table, user_id)).fetchall()
+            return [load(row[0]) for row in rows]
+
+    def put(self, table : str, record : dict[str, Any]) -> None:
+        with self.transaction():
+            if table == "conversations":
+                self.put_conversation(str(record["user_id"]), record["conversation"])
+            elif table in VALUE_TABLES:
+                column, encoded = VALUE_TABLES[table]
+                self.conn.execute(f"INSERT INTO {table} (user_id, {column}) VALUES (?, ?) ON CONFLICT (user_id) DO UPDATE SET {column} = excluded.{column}",
+                                  (str(record["user_id"]), self.encode_value(record[column], encoded)))
+            else:
+                key = record_key(table, record)
+                self.conn.execute("INSERT INTO records (table_name, record_key, user_id, record) VALUES (?, ?, ?, ?) ON CONFLICT (table_name, record_key) DO UPDATE SET record = excluded.record",
+                                  (table, json.dumps(list(key)), key[0], dump(record)))
+
+    def delete(self, table : str, key : Key) -> None:
+        with self.transaction():
+            if table == "conversations":
+                self.conn.execute("DELETE FROM messages WHERE user_id = ? AND conversation_id = ?", key)
+                self.conn.execute("DELETE FROM conversations WHERE user_id = ? AND conversation_id = ?", key)
+            elif table in VALUE_TABLES:
+                self.conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (key[0],))
+            else:
+                self.conn.execute("DELETE FROM records WHERE table_name = ? AND record_key = ?", (table, json.dumps(list(key))))
+
+    def put_conversation(self, user_id : str, conversation : Conversation) -> None:
+        self.put_header(user_id, conversation)
+        # Turns before the offset were never loaded, so only the loaded tail is rewritten.
+        self.conn.execute("DELETE FROM messages WHERE user_id = ? AND conversation_id = ? AND seq >= ?", (user_id, conversation.id, conversation.offset))
+        self.conn.executemany("INSERT INTO messages (user_id, conversation_id, seq, role, content) VALUES (?, ?, ?, ?, ?)",
+                              [(user_id, conversation.id, conversation.offset + i, m["role"], m["content"]) for i, m in enumerate(conversation.messages)])
+
+    def put_header(self, user_id : str, conversation : Conversation) -> None:
+        self.conn.execute("INSERT INTO conversations (user_id, conversation_id, system, summary, summarized) VALUES (?, ?, ?, ?, ?) "
+                          "ON CONFLICT (user_id, conversation_id) DO UPDATE SET system = excluded.system, summary = excluded.summary, summarized = excluded.summarized",
+                          (user_id, conversation.id, json.dumps(conversation.system, ensure_ascii=False), conversation.summary, conversation.summarized))
+
+    def put_conversation_header(self, user_id : str, conversation : Conversation) -> None:
+        with self.transaction():
+            self.put_header(user_id, conversation)
+
+    def append_message(self, user_id : str, conversation_id : str, message : dict[str, str]) -> None:
+        with self.transaction():
+            if self.conn.execute("SELECT 1 FROM conversations WHERE user_id = ? AND conversation_id = ?", (user_id, conversation_id)).fetchone() is None:
+                raise KeyError(conversation_id)
+            self.conn.execute("INSERT INTO messages (user_id, conversation_id, seq, role, content) "
+                              "SELECT ?, ?, COALESCE(MAX(seq) + 1, 0), ?, ? FROM messages WHERE user_id = ? AND conversation_id = ?",
+                              (user_id, conversation_id, message["role"], message["content"], user_id, conversation_id))
+
+    def load_messages(self, user_id : str, conversation_id : str, end : int) -> List[dict[str, str]]:
+        with self.reading() as conn:
+            rows = conn.execute("SELECT role, content FROM messages WHERE user_id = ? AND conversation_id = ? AND seq < ? ORDER BY seq", (user_id, conversation_id, end)).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def build_conversation(self, user_id : str, row : Tuple[str, str, Optional[str], int], messages : List[dict[str, str]], offset : int) -> dict[str, Any]:
+        conversation_id, system, summary, summarized = row
+        conversation = Conversation(json.loads(system), messages, summary, conversation_id, summarized, # type: ignore
+                                    offset=offset, loader=functools.partial(self.load_messages, user_id, conversation_id))
+        return {"user_id": user_id, "conversation": conversation, "conversation_id": conversation_id}
+
+    def get_conversation_record(self, conn : sqlite3.Connection, user_id : str, conversation_id : str) -> Optional[dict[str, Any]]:
+        row = conn.execute("SELECT conversation_id, system, summary, summarized FROM conversations WHERE user_id = ? AND conversation_id = ?", (user_id, conversation_id)).fetchone()
+        if row is None:
+            return None
+        rows = conn.execute("SELECT seq, role, content FROM messages WHERE user_id = ? AND conversation_id = ? ORDER BY seq DESC LIMIT ?", (user_id, conversation_id, self.recent_messages)).fetchall()
+        rows.reverse()
+        offset = rows[0][0] if rows else 0
+        return self.build_conversation(user_id, row, [{"role": role, "content": content} for _, role, content in rows], offset)
+
+    def find_conversation_records(self, conn : sqlite3.Connection, user_id : str) -> List[dict[str, Any]]:
+        # Listing a user's conversations is for their summaries, so no messages are read until asked for.
+        rows = conn.execute("SELECT conversation_id, system, summary, summarized FROM conversations WHERE user_id = ? ORDER BY rowid", (user_id,)).fetchall()
+        counts = dict(conn.execute("SELECT conversation_id, MAX(seq) + 1 FROM messages WHERE user_id = ? GROUP BY conversation_id", (user_id,)).fetchall())
+        return [self.build_conversation(user_id, row, [], counts.get(row[0], 0)) for row in rows]
+
+    def close(self) -> None:
+        with self.lock, self.read_connections_lock:
+            for conn in self.read_connections:
+                conn.close()
+            self.conn.close()
@@ -0,0 +1,20 @@
+from storage.archive import ColdStore, ConversationArchive
+from storage.indexed import IndexedEngine
+from db import open_tinydb
+from dto import Conversation
+
+def test_activity_is_written_by_the_sweep_not_by_each_turn(tmp_path):
+    engine = IndexedEngine(open_tinydb(str(tmp_path / "db.json")))
+    archive = ConversationArchive(engine, ColdStore(str(tmp_path / "cold")), max_idle=100)
+    old, current = Conversation.new_conversation(), Conversation.new_conversation()
+    for conversation in (old, current):
+        engine.put("conversations", {"user_id": "1", "conversation": conversation, "conversation_id": conversation.id})
+    for now in (1000, 1010, 1020):
+        archive.touch("1", old.id, now)
+        archive.touch("1", current.id, now)
+    assert engine.find("conversation_activity", "1") == []
+    assert archive.sweep("1", current.id, now=1050) == 0
+    assert engine.get("conversation_activity", ("1", old.id))["last_active"] == 1020 # type: ignore
+    # The flushed timestamp still ages the conversation out once it has been idle long enough.
+    assert archive.sweep("1", current.id, now=1200, force=True) == 1
+    assert archive.is_archived("1", old.id) and not archive.is_archived("1", current.id)
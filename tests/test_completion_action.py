@@ -0,0 +1,49 @@
+import asyncio
+import pytest
+from action import ConversationCompletionAction
+from dto import Conversation
+from sendable import FAILED_REPLY, EditableMessage, Sendable
+
+class RecordingMessage(EditableMessage):
+    def __init__(self, text):
+        self.text = text
+    async def edit(self, message):
+        self.text = message
+
+class RecordingSendable(Sendable):
+    def __init__(self):
+        self.messages = []
+    async def send(self, message):
+        self.messages.append(RecordingMessage(message))
+    async def send_editable(self, message):
+        self.messages.append(RecordingMessage(message))
+        return self.messages[-1]
+
+class RecordingDatabase:
+    def __init__(self):
+        self.appended = []
+    async def update_conversation_system(self, user, conversation):
+        pass
+    async def append_message(self, user, conversation_id, role, content):
+        self.appended.append((role, content))
+
+class FailingSpeculation:
+    def __init__(self):
+        self.conversation = Conversation.new_conversation()
+    async def stream(self):
+        yield "Half an ans"
+        raise ConnectionError("stream dropped")
+
+class Message:
+    user = None
+    text = "What is the answer?"
+
+def test_failed_stream_marks_the_reply_and_saves_no_turns():
+    database = RecordingDatabase()
+    sendable = RecordingSendable()
+    action = ConversationCompletionAction()
+    action.speculation = FailingSpeculation() # type: ignore
+    with pytest.raises(ConnectionError):
+        asyncio.run(action(Message(), database, sendable)) # type: ignore
+    assert [m.text for m in sendable.messages] == ["Half an ans\n\n" + FAILED_REPLY]
+    assert database.appended == []
@@ -0,0 +1,38 @@
+import asyncio
+import threading
+from completion_cache import CompletionCache
+
+def test_cancelled_leader_does_not_fail_followers():
+    async def run():
+        cache = CompletionCache()
+        release = asyncio.Event()
+        calls = []
+        async def compute():
+            calls.append(1)
+            await release.wait()
+            return "answer"
+        leader = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await follower == "answer"
+        assert leader.cancelled()
+        assert calls == [1]
+        assert cache.stats()["coalesced"] == 1
+        assert cache.stats()["misses"] == 1
+        assert await cache.get_or_compute("k", compute) == "answer"
+        assert cache.stats()["hits"] == 1
+    asyncio.run(run())
+
+def test_periodic_save_is_written_off_the_caller(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.json")
+    cache = CompletionCache(path=path, flush_interval=0)
+    written = []
+    monkeypatch.setattr(cache, "write", lambda entries: written.append(threading.current_thread().name))
+    cache.put("k", "answer")
+    cache.saving.result() # type: ignore
+    assert written and written[0].startswith("completion-cache")
+    assert not cache.dirty
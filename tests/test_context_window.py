@@ -0,0 +1,23 @@
+from dto import Conversation
+
+def turns(count):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "word " * 50} for i in range(count)]
+
+def test_unfolded_tail_is_kept_whole():
+    conversation = Conversation({"system": "Be brief."}, turns(10), "Earlier we talked about bread.", summarized=4)
+    context = conversation.get_conversation(max_tokens=100)
+    assert context[1] == {"role": "system", "content": "Here's a summary of the conversation so far:\nEarlier we talked about bread."}
+    assert context[2:] == conversation.messages[4:]
+
+def test_folded_turns_are_trimmed_to_the_budget():
+    conversation = Conversation({"system": "Be brief."}, turns(10), "Earlier we talked about bread.", summarized=10)
+    context = conversation.get_conversation(max_tokens=200)
+    assert context[1]["content"].startswith("Here's a summary")
+    assert 0 < len(context[2:]) < 10 and context[-1] == conversation.messages[-1]
+
+def test_new_conversation_placeholder_is_not_a_summary():
+    conversation = Conversation.new_conversation()
+    conversation.messages = turns(10)
+    context = conversation.get_conversation(max_tokens=100)
+    assert [m["content"] for m in context if m["role"] == "system"] == ["You are a helpful AI assistant."]
+    assert context[1:] == conversation.messages
@@ -0,0 +1,35 @@
+import pytest
+from db import Database
+from dto import Conversation, User
+
+@pytest.mark.parametrize("mode", ["tinydb", "journal", "sqlite"])
+def test_system_update_keeps_a_newer_summary(tmp_path, mode):
+    database = Database(str(tmp_path / "db.json"), mode=mode)
+    user = User("1", "user", "user", "0", None, False, False)
+    database.set_conversation(user, Conversation.new_conversation())
+    conversation = database.get_conversations(user)[0]
+    # A summary fold lands between the completion reading the conversation and saving its system blocks.
+    folded = database.get_conversation(user, conversation.id)
+    folded.summary, folded.summarized = "Talked about bread.", 4 # type: ignore
+    database.update_conversation(user, folded) # type: ignore
+    conversation.set_system("knowledge", "Likes bread.")
+    database.update_conversation_system(user, conversation)
+    stored = database.get_conversation(user, conversation.id)
+    assert (stored.summary, stored.summarized, stored.system["knowledge"]) == ("Talked about bread.", 4, "Likes bread.") # type: ignore
+    database.close()
+
+@pytest.mark.parametrize("mode", ["tinydb", "journal", "sqlite"])
+def test_summary_update_keeps_newer_system_blocks(tmp_path, mode):
+    database = Database(str(tmp_path / "db.json"), mode=mode)
+    user = User("1", "user", "user", "0", None, False, False)
+    database.set_conversation(user, Conversation.new_conversation())
+    conversation = database.get_conversations(user)[0]
+    # The completion saves new system blocks while the fold is still running on its older copy.
+    current = database.get_conversation(user, conversation.id)
+    current.set_system("knowledge", "Likes bread.") # type: ignore
+    database.update_conversation_system(user, current) # type: ignore
+    conversation.summary, conversation.summarized = "Talked about bread.", 4
+    database.update_conversation_summary(user, conversation)
+    stored = database.get_conversation(user, conversation.id)
+    assert (stored.summary, stored.summarized, stored.system.get("knowledge")) == ("Talked about bread.", 4, "Likes bread.") # type: ignore
+    database.close()
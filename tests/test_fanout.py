@@ -0,0 +1,30 @@
+import asyncio
+from external_datasource import DataSource
+from fanout import FanOutDataSource
+
+class ListDataSource(DataSource):
+    def __init__(self, name, texts):
+        super().__init__(name, "", ["search"])
+        self.texts = texts
+
+    async def query(self, query, context=None):
+        for text in self.texts:
+            yield text
+
+def collect(sources):
+    async def run():
+        return [pair async for pair in FanOutDataSource(sources, deadline=5, enough_chars=100000).results("einstein")]
+    return asyncio.run(run())
+
+EINSTEIN_LIFE = ("Albert Einstein was a German-born theoretical physicist who is widely held to be one of the greatest and most influential "
+                 "scientists of all time. Best known for developing the theory of relativity, he also made important contributions to quantum mechanics.")
+EINSTEIN_PRIZE = ("Einstein received the 1921 Nobel Prize in Physics for his services to theoretical physics, and especially for his discovery "
+                  "of the law of the photoelectric effect. He moved to the United States in 1933 and worked at the Institute for Advanced Study.")
+
+def test_distinct_long_results_from_two_sources_both_come_through():
+    results = collect([ListDataSource("Wikipedia", [EINSTEIN_LIFE]), ListDataSource("Google", [EINSTEIN_PRIZE])])
+    assert sorted(results) == [("Google", EINSTEIN_PRIZE), ("Wikipedia", EINSTEIN_LIFE)]
+
+def test_repeated_result_is_dropped():
+    results = collect([ListDataSource("Wikipedia", [EINSTEIN_LIFE]), ListDataSource("Google", ["The " + EINSTEIN_LIFE])])
+    assert len(results) == 1
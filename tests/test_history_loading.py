@@ -0,0 +1,30 @@
+import asyncio
+import threading
+from async_database import AsyncDatabase
+from db import Database
+from dto import Conversation, User
+from storage.sqlite import SQLiteEngine
+
+USER = User("1", "user", "user", "0", None, False, False)
+
+def test_older_turns_load_on_a_reader_thread(tmp_path):
+    async def run():
+        database = AsyncDatabase(Database(engine=SQLiteEngine(str(tmp_path / "db.sqlite"), recent_messages=2)))
+        conversation = Conversation({"system": "Be brief."}, [{"role": "user", "content": f"turn {i}"} for i in range(6)], "")
+        await database.set_conversation(USER, conversation)
+        stored = await database.get_conversation(USER, conversation.id)
+        assert stored.offset == 4 and stored.needs_history(3000) # type: ignore
+        loader = stored.loader # type: ignore
+        threads = []
+        def recording_loader(end):
+            threads.append(threading.current_thread())
+            return loader(end)
+        stored.loader = recording_loader # type: ignore
+        # Building a context never reads storage itself.
+        assert [m["content"] for m in stored.get_conversation(3000)][1:] == ["turn 4", "turn 5"] # type: ignore
+        assert threads == []
+        await database.load_history(USER, stored) # type: ignore
+        assert threads and threads[0] is not threading.main_thread()
+        assert [m["content"] for m in stored.messages] == [f"turn {i}" for i in range(6)] # type: ignore
+        await database.close()
+    asyncio.run(run())
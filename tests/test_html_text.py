@@ -0,0 +1,25 @@
+import pytest
+from html_text import extract_text
+
+PARAGRAPH = "The quick brown fox jumps over the lazy dog near the river bank."
+
+@pytest.mark.parametrize("page", [
+    f'<html><body class="right-sidebar nav-below-header"><p>{PARAGRAPH}</p></body></html>',
+    f'<html class="vector-feature-main-menu-pinned-disabled"><body><p>{PARAGRAPH}</p></body></html>',
+    f'<html><body><article class="commentary"><p>{PARAGRAPH}</p></article></body></html>',
+    f'<html><body><main id="main-menu-layout"><p>{PARAGRAPH}</p></main></body></html>',
+    f'<html><body><div class="canvas shared-layout"><p>{PARAGRAPH}</p></div></body></html>',
+])
+def test_layout_classes_on_containers_keep_their_text(page):
+    assert extract_text(page, 0) == PARAGRAPH
+
+def test_boilerplate_classes_are_skipped():
+    page = (f'<html><body><div class="site-nav"><p>Home page link list here</p></div><p>{PARAGRAPH}</p>'
+            '<div id="comments"><p>First comment on this story.</p></div><div class="share_tools"><p>Share this on social.</p></div>'
+            '<aside><p>Something on the side of the page.</p></aside></body></html>')
+    assert extract_text(page, 0) == PARAGRAPH
+
+def test_main_content_is_preferred_and_budget_applies():
+    page = f"<html><body><p>Text outside the main content block.</p><main><p>{PARAGRAPH}</p><p>{PARAGRAPH}</p></main></body></html>"
+    assert extract_text(page, 0) == PARAGRAPH + "\n" + PARAGRAPH
+    assert extract_text(f"<p>{PARAGRAPH}</p>" * 10, 20) == PARAGRAPH[:20]
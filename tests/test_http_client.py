@@ -0,0 +1,30 @@
+import asyncio
+import threading
+import http_client
+
+def test_cache_runs_on_its_own_thread(tmp_path, monkeypatch):
+    opened_on = []
+
+    class RecordingCache(http_client.ResponseCache):
+        def __init__(self, *args):
+            opened_on.append(threading.current_thread().name)
+            super().__init__(*args)
+
+    monkeypatch.setattr(http_client, "ResponseCache", RecordingCache)
+    monkeypatch.setattr(http_client, "cache_path", str(tmp_path / "responses.db"))
+    monkeypatch.setattr(http_client, "_cache", None)
+    release = threading.Event()
+
+    async def main():
+        assert await http_client.cached_call("Wikipedia", "bread", lambda: ["Bread is food."]) == ["Bread is food."]
+        # Every blocking thread is now stuck in a slow data source call; the cached answer must still come back.
+        waiting = asyncio.gather(*[http_client.run_blocking(release.wait) for _ in range(http_client.blocking_workers)])
+        try:
+            return await asyncio.wait_for(http_client.cached_call("Wikipedia", "bread", lambda: ["never called"]), timeout=2)
+        finally:
+            release.set()
+            await waiting
+
+    assert asyncio.run(main()) == ["Bread is food."]
+    assert len(opened_on) == 1 and opened_on[0].startswith("response-cache")
+    http_client._cache.close() # type: ignore
@@ -0,0 +1,15 @@
+from db import open_engine, open_tinydb
+
+def test_journal_imports_existing_tinydb_on_first_open(tmp_path):
+    path = str(tmp_path / "db.json")
+    tinydb = open_tinydb(path)
+    tinydb.table("preferences").insert({"user_id": "1", "preferences": {"tone": "dry"}})
+    tinydb.close()
+    engine = open_engine(path, "journal")
+    assert engine.get("preferences", ("1",)) == {"user_id": "1", "preferences": {"tone": "dry"}}
+    engine.put("preferences", {"user_id": "1", "preferences": {"tone": "warm"}})
+    engine.close()
+    # Once the journal exists, db.json is not imported again over newer changes.
+    engine = open_engine(path, "journal")
+    assert engine.get("preferences", ("1",))["preferences"] == {"tone": "warm"} # type: ignore
+    engine.close()
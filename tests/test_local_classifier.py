@@ -0,0 +1,25 @@
+import json
+from intent import NoOpIntent, RememberIntent, TopicChangeIntent
+from local_classifier import LocalIntentClassifier
+
+INTENTS = [TopicChangeIntent, NoOpIntent, RememberIntent]
+
+def test_cold_start_classifies_pleasantries():
+    classifier = LocalIntentClassifier(None)
+    for text in ("hi", "thanks", "Thank you!", "good morning"):
+        result = classifier.classify(text, INTENTS)
+        assert result is not None and result[0] is NoOpIntent, text
+    assert classifier.classify("Let's talk about something else.", INTENTS)[0] is TopicChangeIntent # type: ignore
+
+def test_each_sentence_gets_an_intent():
+    classifier = LocalIntentClassifier(None)
+    parts = classifier.classify_parts("hi! Please remember my birthday is May 3rd.", INTENTS)
+    assert parts is not None
+    assert [(part, intent) for part, intent, _ in parts] == [("hi!", NoOpIntent), ("Please remember my birthday is May 3rd.", RememberIntent)]
+
+def test_log_is_written_off_the_caller(tmp_path):
+    path = tmp_path / "log.jsonl"
+    classifier = LocalIntentClassifier(str(path))
+    classifier.record("remember my cat is Tom", [RememberIntent])
+    classifier.log_writer.shutdown(wait=True)
+    assert json.loads(path.read_text(encoding="utf-8")) == {"text": "remember my cat is Tom", "labels": ["intent.RememberIntent"]}
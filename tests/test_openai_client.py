@@ -0,0 +1,34 @@
+import asyncio
+import openai
+import pytest
+import openai_client
+from openai_client import RateLimitScheduler
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    scheduler = RateLimitScheduler(requests_per_minute=6000, tokens_per_minute=60000)
+    monkeypatch.setattr(openai_client, "scheduler", scheduler)
+    monkeypatch.setattr(openai_client, "get_session", lambda: None)
+    return scheduler
+
+def test_failed_requests_hand_their_tokens_back(scheduler, monkeypatch):
+    async def timeout(**kwargs):
+        raise openai.error.Timeout("timed out")
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", timeout)
+    async def run():
+        for _ in range(5):
+            with pytest.raises(openai.error.Timeout):
+                await openai_client.create_chat_completion(model="gpt-3.5-turbo", messages=[{"role": "user", "content": "hi"}], max_tokens=5000)
+    asyncio.run(run())
+    scheduler.tokens.refill()
+    assert scheduler.tokens.level == pytest.approx(scheduler.tokens.capacity)
+
+def test_successful_request_is_charged_its_usage(scheduler, monkeypatch):
+    class Response:
+        usage = {"total_tokens": 100}
+    async def respond(**kwargs):
+        return Response()
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", respond)
+    scheduler.tokens.rate = 0
+    asyncio.run(openai_client.create_chat_completion(model="gpt-3.5-turbo", messages=[{"role": "user", "content": "hi"}], max_tokens=5000))
+    assert scheduler.tokens.level == pytest.approx(scheduler.tokens.capacity - 100)
@@ -0,0 +1,32 @@
+import json
+import serialization
+from dto import Conversation
+
+def legacy_conversation_document(system):
+    # How tinydb_serialization stored a conversation before the codec: jsonpickle, without the newer fields.
+    pickled = json.dumps({"py/object": "dto.Conversation", "system": system, "messages": [{"role": "user", "content": "hi"}],
+                          "summary": "The start of a brand new conversation", "id": "abc"})
+    return {"user_id": "1", "conversation": serialization.LEGACY_TAG + pickled, "conversation_id": "abc"}
+
+def test_legacy_system_entry_maps_to_keyed_blocks():
+    conversation = serialization.decode_document(legacy_conversation_document({"name": "knowledge", "message": "Likes bread."}))["conversation"]
+    assert conversation.system == {"system": "You are a helpful AI assistant.", "knowledge": "Likes bread."}
+    conversation.set_system("knowledge", "Likes sourdough.")
+    assert [m["content"] for m in conversation.get_conversation() if m["role"] == "system"] == ["You are a helpful AI assistant.", "Likes sourdough."]
+
+def test_keyed_system_is_left_alone():
+    conversation = Conversation({"system": "Be brief.", "preferences": "Metric units."}, [], "")
+    assert conversation.system == {"system": "Be brief.", "preferences": "Metric units."}
+
+def test_legacy_conversation_round_trips_through_the_codec():
+    document = serialization.decode_document(legacy_conversation_document({"system": "Be brief."}))
+    assert document["conversation"].summarized == 0
+    encoded = json.loads(json.dumps(serialization.encode(document)))
+    conversation = serialization.decode(encoded)["conversation"]
+    assert (conversation.system, conversation.messages, conversation.summary, conversation.id, conversation.summarized) == \
+        ({"system": "Be brief."}, [{"role": "user", "content": "hi"}], "The start of a brand new conversation", "abc", 0)
+
+def test_codec_encodes_objects_missing_newer_fields():
+    conversation = Conversation.__new__(Conversation)
+    conversation.__dict__.update({"system": {"system": "Be brief."}, "messages": [], "summary": "", "id": "abc"})
+    assert serialization.decode(serialization.encode(conversation)).summarized == 0
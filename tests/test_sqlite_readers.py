@@ -0,0 +1,28 @@
+import threading
+from storage.sqlite import SQLiteEngine
+
+def test_reads_do_not_wait_for_an_open_write_batch(tmp_path):
+    engine = SQLiteEngine(str(tmp_path / "db.sqlite"))
+    engine.put("knowledge", {"user_id": "1", "knowledge": "Likes bread."})
+    in_batch = threading.Event()
+    release = threading.Event()
+    def writer():
+        with engine.transaction():
+            engine.put("knowledge", {"user_id": "1", "knowledge": "Likes sourdough."})
+            # The writer thread sees its own uncommitted write.
+            assert engine.get("knowledge", ("1",))["knowledge"] == "Likes sourdough." # type: ignore
+            in_batch.set()
+            release.wait(5)
+    thread = threading.Thread(target=writer)
+    thread.start()
+    assert in_batch.wait(5)
+    results = []
+    reader = threading.Thread(target=lambda: results.append((engine.get("knowledge", ("1",)), engine.sees_pending_writes())))
+    reader.start()
+    reader.join(2)
+    # The read finished while the batch was still open, and saw the last commit.
+    assert not reader.is_alive() and results == [({"user_id": "1", "knowledge": "Likes bread."}, False)]
+    release.set()
+    thread.join()
+    assert engine.get("knowledge", ("1",))["knowledge"] == "Likes sourdough." # type: ignore
+    engine.close()
@@ -0,0 +1,54 @@
+import asyncio
+import time
+from user_mailbox import UserMailboxes
+
+def test_idle_mailbox_dispatches_at_once_and_merges_while_busy():
+    async def run():
+        batches = []
+        started = []
+        release = asyncio.Event()
+        async def handler(batch):
+            started.append(time.perf_counter())
+            batches.append(batch)
+            if len(batches) == 1:
+                await release.wait()
+        mailboxes = UserMailboxes(handler, window=0.5)
+        submitted = time.perf_counter()
+        mailboxes.submit("user", "first")
+        await asyncio.sleep(0.01)
+        assert batches == [["first"]] and started[0] - submitted < 0.1
+        mailboxes.submit("user", "second")
+        mailboxes.submit("user", "third")
+        release.set()
+        while mailboxes.workers:
+            await asyncio.sleep(0.01)
+        assert batches == [["first"], ["second", "third"]]
+        assert mailboxes.stats()["merged"] == 1
+    asyncio.run(run())
+
+def test_jobs_run_in_order_and_alone():
+    async def run():
+        handled = []
+        release = asyncio.Event()
+        async def handler(batch):
+            handled.append(list(batch))
+            if len(handled) == 1:
+                await release.wait()
+        mailboxes = UserMailboxes(handler)
+        mailboxes.submit("user", "first")
+        await asyncio.sleep(0)
+        mailboxes.submit("user", "second")
+        async def job():
+            handled.append("job")
+            return "done"
+        call = asyncio.create_task(mailboxes.call("user", job))
+        await asyncio.sleep(0)
+        mailboxes.submit("user", "third")
+        await asyncio.sleep(0.01)
+        assert handled == [["first"]] and not call.done()
+        release.set()
+        assert await call == "done"
+        while mailboxes.workers:
+            await asyncio.sleep(0.01)
+        assert handled == [["first"], ["second"], "job", ["third"]]
+    asyncio.run(run())
@@ -0,0 +1,75 @@
+from __future__ import annotations
+import math
+import re
+import zlib
+from typing import Dict, Iterable, List
+
+SparseVector = Dict[int, float]
+
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+class HashingVectorizer:
+    """TF-IDF over hashed word, word-bigram and character trigram features; no vocabulary to store."""
+    def __init__(self, buckets : int = 1 << 20, char_ngrams : int = 3):
+        self.buckets = buckets
+        self.char_ngrams = char_ngrams
+        self.document_frequency : Dict[int, int] = {}
+        self.documents = 0
+
+    def hash(self, feature : str) -> int:
+        # crc32 rather than hash() so vectors stay comparable across processes.
+        return zlib.crc32(feature.encode("utf-8")) % self.buckets
+
+    def features(self, text : str) -> SparseVector:
+        words = WORD_PATTERN.findall(text.lower())
+        counts : SparseVector = {}
+        def add(feature : str) -> None:
+            index = self.hash(feature)
+            counts[index] = counts.get(index, 0.0) + 1.0
+        for i, word in enumerate(words):
+            add("w:" + word)
+            if i > 0:
+                add("b:" + words[i - 1] + " " + word)
+            padded = "#" + word + "#"
+            for j in range(max(1, len(padded) - self.char_ngrams + 1)):
+                add("c:" + padded[j:j + self.char_ngrams])
+        return {k: 1.0 + math.log(v) for k, v in counts.items()}
+
+    def fit(self, documents : Iterable[str]) -> None:
+        self.document_frequency = {}
+        self.documents = 0
+        for document in documents:
+            self.partial_fit(document)
+
+    def partial_fit(self, document : str) -> None:
+        self.documents += 1
+        for index in self.features(document):
+            self.document_frequency[index] = self.document_frequency.get(index, 0) + 1
+
+    def idf(self, index : int) -> float:
+        return math.log((1 + self.documents) / (1 + self.document_frequency.get(index, 0))) + 1.0
+
+    def transform(self, text : str) -> SparseVector:
+        return normalize({k: v * self.idf(k) for k, v in self.features(text).items()})
+
+def normalize(vector : SparseVector) -> SparseVector:
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    if norm == 0:
+        return {}
+    return {k: v / norm for k, v in vector.items()}
+
+def add_into(target : SparseVector, vector : SparseVector, weight : float = 1.0) -> None:
+    for k, v in vector.items():
+        target[k] = target.get(k, 0.0) + v * weight
+
+def cosine(a : SparseVector, b : SparseVector) -> float:
+    # Both sides are expected to be normalized already, so the dot product is the cosine.
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+def centroid(vectors : List[SparseVector]) -> SparseVector:
+    total : SparseVector = {}
+    for vector in vectors:
+        add_into(total, vector)
+    return normalize(total)
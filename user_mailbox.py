@@ -0,0 +1,114 @@
+from __future__ import annotations
+import asyncio
+import traceback
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Generic, Hashable, List, TypeVar, Union
+
+T = TypeVar("T")
+
+class Job:
+    """Work other than a message, such as a slash command, run in its turn and never merged with messages."""
+    def __init__(self, run : Callable[[], Awaitable[Any]], future : asyncio.Future):
+        self.run = run
+        self.future = future
+
+class Mailbox(Generic[T]):
+    def __init__(self):
+        self.items : Deque[Union[T, Job]] = deque()
+        self.arrived = asyncio.Event()
+
+class UserMailboxes(Generic[T]):
+    """One ordered mailbox per user.
+
+    A message to an idle mailbox is handled at once. Messages that arrive while one is being handled
+    are handled together as the next batch, after waiting up to window seconds for the rest of the burst.
+    Jobs passed to call() run alone, in order with the messages around them.
+    """
+    def __init__(self, handler : Callable[[List[T]], Awaitable[Any]], window : float = 0.0, max_batch : int = 10, max_concurrency : int = 8):
+        self.handler = handler
+        self.window = window
+        self.max_batch = max_batch
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.mailboxes : Dict[Hashable, Mailbox[T]] = {}
+        self.workers : Dict[Hashable, asyncio.Task] = {}
+        self.received = 0
+        self.batches = 0
+        self.merged = 0
+        self.jobs = 0
+
+    def submit(self, key : Hashable, item : T) -> None:
+        self.received += 1
+        self.enqueue(key, item)
+
+    async def call(self, key : Hashable, run : Callable[[], Awaitable[Any]]) -> Any:
+        """Runs run in the user's mailbox once everything queued before it is handled, and returns its result."""
+        future = asyncio.get_running_loop().create_future()
+        self.enqueue(key, Job(run, future))
+        return await future
+
+    def enqueue(self, key : Hashable, item : Union[T, Job]) -> None:
+        mailbox = self.mailboxes.get(key)
+        if mailbox is None:
+            mailbox = self.mailboxes[key] = Mailbox()
+        mailbox.items.append(item)
+        mailbox.arrived.set()
+        if key not in self.workers:
+            self.workers[key] = asyncio.create_task(self.run(key))
+
+    async def collect(self, mailbox : Mailbox[T], busy : bool) -> List[T]:
+        batch = [mailbox.items.popleft()]
+        while len(batch) < self.max_batch:
+            if mailbox.items:
+                if isinstance(mailbox.items[0], Job):
+                    break
+                batch.append(mailbox.items.popleft()) # type: ignore
+            elif not busy or self.window <= 0:
+                break
+            else:
+                mailbox.arrived.clear()
+                try:
+                    # The user was typing while the last turn ran; each new message restarts the window.
+                    await asyncio.wait_for(mailbox.arrived.wait(), timeout=self.window)
+                except asyncio.TimeoutError:
+                    break
+        return batch # type: ignore
+
+    async def run(self, key : Hashable) -> None:
+        mailbox = self.mailboxes[key]
+        try:
+            busy = False
+            while mailbox.items:
+                if isinstance(mailbox.items[0], Job):
+                    job : Job = mailbox.items.popleft() # type: ignore
+                    self.jobs += 1
+                    async with self.semaphore:
+                        try:
+                            result = await job.run()
+                        except Exception as e:
+                            if not job.future.done():
+                                job.future.set_exception(e)
+                        else:
+                            if not job.future.done():
+                                job.future.set_result(result)
+                    continue
+                batch = await self.collect(mailbox, busy)
+                busy = True
+                self.batches += 1
+                self.merged += len(batch) - 1
+                async with self.semaphore:
+                    try:
+                        await self.handler(batch)
+                    except Exception:
+                        traceback.print_exc()
+        finally:
+            del self.workers[key]
+            del self.mailboxes[key]
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "received": self.received,
+            "batches": self.batches,
+            "merged": self.merged,
+            "jobs": self.jobs,
+            "active_users": len(self.workers),
+        }